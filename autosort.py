@@ -0,0 +1,341 @@
+"""
+Авто-сортировка через watchdog. Импортируется только при включении наблюдения,
+чтобы команды sort/dry-run не загружали watchdog.
+
+События не обрабатываются в потоке watchdog: путь попадает в StableFileQueue,
+которая ждёт, пока размер и время изменения файла перестанут меняться, и
+только затем отдаёт его рабочим потокам.
+
+Несколько папок (WatchSource) наблюдаются одним Observer и обслуживаются
+общим пулом потоков. Готовые файлы выдаются по кругу между папками, так что
+папка с потоком новых файлов не задерживает остальные.
+
+"watch_mode": "poll" в конфигурации заменяет Observer опросом папок
+(dirpoller) -- для сетевых дисков, где события не приходят.
+"""
+import heapq
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, deque, namedtuple
+
+from watchdog.observers import Observer
+from watchdog.events import FileSystemEventHandler
+
+import metrics as sortmetrics
+from dirpoller import POLL_INTERVAL, POLL_MAX_INTERVAL, DirectoryPoller
+from exclusions import TEMP_SUFFIXES
+
+SETTLE_TIME = 0.5      # сколько секунд файл не должен меняться
+MAX_PENDING = 10000    # файлов одной папки в очереди; дальше -- см. WatchSource.rescan
+WATCH_WORKERS = 2
+
+# Наблюдаемая папка. callback(path) сортирует файл; accept(path) отбирает пути
+# (по умолчанию -- файлы непосредственно в source_dir, кроме незавершённых
+# загрузок). rescan() при переполнении очереди папки заменяет пропущенные
+# события полным проходом по папке; без него поток watchdog ждёт.
+# accept_dir(path) отбирает вложенные папки для обхода в режиме опроса.
+WatchSource = namedtuple("WatchSource", "source_dir callback recursive accept rescan accept_dir",
+                         defaults=(False, None, None, None))
+
+
+class FairQueue:
+    """Очереди готовых путей по папкам; get() выдаёт их по кругу."""
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._queues = OrderedDict()  # источник -> deque путей
+        self._closed = False
+
+    def put(self, source, path):
+        with self._cond:
+            queue = self._queues.get(source)
+            if queue is None:
+                queue = self._queues[source] = deque()
+            queue.append(path)
+            self._cond.notify()
+
+    def get(self):
+        """(источник, путь) или None, когда после close() очереди опустели."""
+        with self._cond:
+            while True:
+                for source, queue in self._queues.items():
+                    if queue:
+                        self._queues.move_to_end(source)
+                        return source, queue.popleft()
+                if self._closed:
+                    return None
+                self._cond.wait()
+
+    def qsize(self, source=None):
+        with self._cond:
+            if source is not None:
+                return len(self._queues.get(source, ()))
+            return sum(len(queue) for queue in self._queues.values())
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+class StableFileQueue:
+    """
+    Очередь путей с объединением повторных событий и проверкой готовности файла.
+
+    Повторное событие для пути, который уже ждёт, только откладывает проверку.
+    Файл считается дописанным, когда (размер, mtime) совпали при двух проверках
+    подряд. Возраст mtime не учитывается: при копировании с сохранением
+    времени (cp -p, rsync, Проводник) у недописанного файла он старый.
+    У каждой папки свой предел очереди.
+    """
+    def __init__(self, workers=WATCH_WORKERS, settle_time=SETTLE_TIME, max_pending=MAX_PENDING,
+                 metrics=sortmetrics.NULL):
+        self.metrics = metrics
+        self.settle_time = settle_time
+        self.max_pending = max_pending
+        self._cond = threading.Condition()
+        self._heap = []        # (срок проверки, путь); по одной записи на путь
+        self._pending = {}     # путь -> [срок проверки, (размер, mtime) или None, время первого события, источник]
+        self._counts = {}      # источник -> файлов в ожидании и в очереди
+        self._overflowed = set()
+        self._ready = FairQueue()
+        self._stopped = False
+        self._threads = [threading.Thread(target=self._check_loop, name="autosort-check", daemon=True)]
+        self._threads += [
+            threading.Thread(target=self._work_loop, name=f"autosort-{i}", daemon=True)
+            for i in range(max(1, workers))
+        ]
+
+    def start(self):
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        self._ready.close()
+
+    def join(self, timeout=None):
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def __len__(self):
+        with self._cond:
+            return sum(self._counts.values())
+
+    def depth(self, source):
+        with self._cond:
+            return self._counts.get(source, 0)
+
+    def put(self, path, source):
+        """Добавить путь или отложить уже ожидающий."""
+        with self._cond:
+            due = time.monotonic() + self.settle_time
+            state = self._pending.get(path)
+            if state is not None:
+                state[0] = due
+                return
+            if self._counts.get(source, 0) >= self.max_pending:
+                if source.rescan is not None:
+                    # Событие отбрасывается; папка будет пройдена целиком, когда очередь опустеет
+                    self._overflowed.add(source)
+                    return
+                while not self._stopped and self._counts.get(source, 0) >= self.max_pending:
+                    self._cond.wait(0.5)
+            if self._stopped:
+                return
+            self._counts[source] = self._counts.get(source, 0) + 1
+            self._pending[path] = [due, None, time.monotonic(), source]
+            heapq.heappush(self._heap, (due, path))
+            self._cond.notify_all()
+
+    def _done(self, source):
+        """Файл папки обработан или исчез; True, если пора пройти папку после переполнения."""
+        self._counts[source] -= 1
+        self._cond.notify_all()
+        if self._counts[source] == 0 and source in self._overflowed:
+            self._overflowed.discard(source)
+            return True
+        return False
+
+    def _check_loop(self):
+        while True:
+            with self._cond:
+                while not self._stopped and (not self._heap or self._heap[0][0] > time.monotonic()):
+                    self._cond.wait(self._heap[0][0] - time.monotonic() if self._heap else None)
+                if self._stopped:
+                    return
+                due, path = heapq.heappop(self._heap)
+                state = self._pending[path]
+                if state[0] > due:
+                    # Пришло новое событие: проверка откладывается
+                    heapq.heappush(self._heap, (state[0], path))
+                    continue
+                previous = state[1]
+            try:
+                st = os.stat(path)
+            except OSError:
+                st = None
+            with self._cond:
+                source = state[3]
+                if st is None:
+                    del self._pending[path]
+                    if self._done(source):
+                        self._ready.put(source, None)  # None -- пройти папку целиком
+                    continue
+                signature = (st.st_size, st.st_mtime_ns)
+                if state[0] > due:
+                    heapq.heappush(self._heap, (state[0], path))
+                elif signature == previous:
+                    del self._pending[path]
+                    self._ready.put(source, path)
+                    self.metrics.observe("filesorter_watch_settle_seconds", time.monotonic() - state[2])
+                else:
+                    state[0] = time.monotonic() + self.settle_time
+                    state[1] = signature
+                    heapq.heappush(self._heap, (state[0], path))
+
+    def _work_loop(self):
+        while True:
+            item = self._ready.get()
+            if item is None:
+                return
+            source, path = item
+            rescan = path is None
+            if path is not None:
+                try:
+                    with self.metrics.timer("filesorter_watch_callback_seconds", histogram=True):
+                        source.callback(path)
+                except Exception as e:
+                    logging.error(f"Ошибка авто-сортировки файла '{path}': {str(e)}")
+                finally:
+                    with self._cond:
+                        rescan = self._done(source)
+            if rescan:
+                logging.info(f"Очередь папки '{source.source_dir}' переполнялась: папка сортируется целиком.")
+                try:
+                    source.rescan()
+                except Exception as e:
+                    logging.error(f"Ошибка сортировки папки '{source.source_dir}': {str(e)}")
+
+
+class AutoSortHandler(FileSystemEventHandler):
+    """Передаёт пути новых, изменённых и переименованных файлов папки в очередь."""
+    def __init__(self, file_queue, source):
+        self.file_queue = file_queue
+        self.source = source
+        self.accept = source.accept or self._in_source_dir
+        self._source_dir = os.path.normpath(source.source_dir)
+
+    def _in_source_dir(self, path):
+        return os.path.dirname(os.path.normpath(path)) == self._source_dir and not path.lower().endswith(TEMP_SUFFIXES)
+
+    def _enqueue(self, path, event):
+        self.file_queue.metrics.inc("filesorter_watch_events_total", event=event)
+        if self.accept(path):
+            self.file_queue.put(path, self.source)
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self._enqueue(event.src_path, "created")
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self._enqueue(event.src_path, "modified")
+
+    def on_moved(self, event):
+        if not event.is_directory:
+            self._enqueue(event.dest_path, "moved")
+
+
+class AutoSorter:
+    """
+    Один Observer watchdog (или DirectoryPoller, если передан poller) на
+    все папки вместе с общей очередью обработки; останавливаются вместе.
+    """
+    def __init__(self, sources, workers=WATCH_WORKERS, settle_time=SETTLE_TIME, metrics=sortmetrics.NULL,
+                 poller=None):
+        self.sources = list(sources)
+        self.file_queue = StableFileQueue(workers=workers, settle_time=settle_time, metrics=metrics)
+        self.observer = poller or Observer()
+        for source in self.sources:
+            handler = AutoSortHandler(self.file_queue, source)
+            if poller is not None:
+                poller.schedule(handler, source.source_dir, recursive=source.recursive, accept_dir=source.accept_dir)
+            else:
+                self.observer.schedule(handler, source.source_dir, recursive=source.recursive)
+            metrics.gauge("filesorter_watch_queue_depth", lambda source=source: self.file_queue.depth(source),
+                          source=source.source_dir)
+
+    def start(self):
+        self.file_queue.start()
+        self.observer.start()
+
+    def stop(self):
+        self.observer.stop()
+        self.file_queue.stop()
+
+    def join(self, timeout=None):
+        self.observer.join(timeout)
+        self.file_queue.join(timeout)
+
+    def is_alive(self):
+        return self.observer.is_alive()
+
+
+def start_watching(sources, config=None, metrics=sortmetrics.NULL):
+    """
+    Запустить наблюдение за папками (WatchSource) и вернуть AutoSorter.
+    Из config берутся "watch_workers", "settle_time", "watch_mode"
+    ("native" или "poll"), "poll_interval" и "poll_max_interval", если
+    заданы; metrics (metrics.Metrics) получает события, задержки и длину
+    очередей.
+    """
+    config = config or {}
+    poller = None
+    if config.get("watch_mode", "native") == "poll":
+        poller = DirectoryPoller(
+            interval=float(config.get("poll_interval", POLL_INTERVAL)),
+            max_interval=float(config.get("poll_max_interval", POLL_MAX_INTERVAL)),
+            metrics=metrics
+        )
+    sorter = AutoSorter(
+        sources,
+        workers=int(config.get("watch_workers", WATCH_WORKERS)),
+        settle_time=float(config.get("settle_time", SETTLE_TIME)),
+        metrics=metrics,
+        poller=poller
+    )
+    sorter.start()
+    return sorter
+
+
+def start_observer(source_dir, callback, config=None, accept=None, metrics=sortmetrics.NULL):
+    """Наблюдение за одной папкой; "recursive" берётся из config."""
+    config = config or {}
+    source = WatchSource(source_dir, callback, bool(config.get("recursive", False)), accept)
+    return start_watching([source], config, metrics)
+
+
+def engine_sources(engines, on_file):
+    """
+    WatchSource для движков сортировки (SortEngine.source_engines):
+    on_file(engine, path) сортирует файл, переполнение очереди папки
+    заменяется sort_directory. Несуществующие папки пропускаются.
+    """
+    sources = []
+    for engine in engines:
+        if not os.path.isdir(engine.source_dir):
+            logging.error(f"Папка для наблюдения не существует: '{engine.source_dir}'")
+            continue
+        sources.append(WatchSource(
+            engine.source_dir,
+            lambda path, engine=engine: on_file(engine, path),
+            engine.recursive,
+            engine.accepts_path,
+            engine.sort_directory,
+            lambda path, engine=engine: engine.accepts_path(path, is_dir=True)
+        ))
+    return sources
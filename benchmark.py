@@ -0,0 +1,350 @@
+"""
+Воспроизводимый замер скорости сортировки без графического интерфейса.
+
+    python benchmark.py --files 20000 --sizes 4k:70,256k:25,4m:5 --output result.json
+
+Для каждого сценария во временной папке генерируется дерево файлов
+(одинаковое при одинаковом --seed), затем движок запускается в отдельном
+процессе, чтобы пиковый RSS относился только к этому сценарию:
+    scan    -- обход и классификация без действий (iter_directory_tasks);
+    dry-run -- sort_directory в тестовом режиме;
+    move    -- sort_directory с перемещением;
+    copy    -- sort_directory с копированием;
+    single  -- sort_file для каждого файла (путь авто-сортировки);
+    watch   -- файлы появляются в наблюдаемой папке, задержка считается от
+               появления файла до конца его сортировки (нужен watchdog);
+    startup -- время импорта filesorterapp и filesorter в новом
+               интерпретаторе (-X importtime) и проверка, что тяжёлые
+               необязательные модули (PIL, pystray, plyer, watchdog) при
+               запуске не загружаются.
+Результат -- JSON: параметры, окружение и для каждого сценария файлы/с,
+байты/с, p50/p99 задержки на файл и пиковый RSS. Если сценарий startup
+нарушил ограничения (--max-import-ms, тяжёлые модули), код выхода 1 --
+так его можно ставить в CI против регрессий времени запуска.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import sortengine
+
+SCENARIOS = ("scan", "dry-run", "move", "copy", "single", "watch", "startup")
+DEFAULT_SCENARIOS = ("scan", "dry-run", "move", "copy", "single")
+DEFAULT_SIZES = "1k:50,64k:35,1m:14,16m:1"
+DEFAULT_EXTS = ".jpg:30,.pdf:20,.mp3:10,.txt:20,.tar.gz:5,.bin:15"
+_UNITS = {"": 1, "k": 1024, "m": 1024 ** 2, "g": 1024 ** 3}
+HEAVY_MODULES = ("PIL", "pystray", "plyer", "watchdog")
+# Модуль -> модули, которых не должно быть в sys.modules сразу после его импорта
+STARTUP_MODULES = {
+    "filesorterapp": HEAVY_MODULES,
+    "filesorter": HEAVY_MODULES + ("tkinter",),
+}
+
+
+def parse_mix(spec, convert=str):
+    """'a:3,b:1' -> ([a, b], [3, 1])."""
+    values, weights = [], []
+    for item in spec.split(","):
+        value, _, weight = item.strip().rpartition(":")
+        values.append(convert(value))
+        weights.append(float(weight))
+    return values, weights
+
+
+def parse_size(text):
+    text = text.strip().lower().rstrip("b")
+    unit = text[-1:] if text[-1:] in _UNITS else ""
+    return int(float(text[:len(text) - len(unit)]) * _UNITS[unit])
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(round(p / 100 * (len(sorted_values) - 1))))]
+
+
+def generate_tree(root, args):
+    """Создать дерево файлов; возвращает (число файлов, суммарный размер)."""
+    rng = random.Random(args.seed)
+    sizes, size_weights = parse_mix(args.sizes, parse_size)
+    exts, ext_weights = parse_mix(args.exts)
+    dirs = [root]
+    for level in range(args.depth):
+        dirs += [os.path.join(d, f"d{level}_{i}") for d in dirs[-args.fanout ** level:] for i in range(args.fanout)]
+    for d in dirs:
+        os.makedirs(d, exist_ok=True)
+    payload = rng.randbytes(max(sizes)) if hasattr(rng, "randbytes") else os.urandom(max(sizes))
+    total = 0
+    for i in range(args.files):
+        size = rng.choices(sizes, size_weights)[0]
+        ext = rng.choices(exts, ext_weights)[0]
+        with open(os.path.join(rng.choice(dirs), f"file_{i:07d}{ext}"), "wb") as f:
+            f.write(payload[:size])
+        total += size
+    return args.files, total
+
+
+def make_config(source_dir, args, action="Переместить"):
+    folders = {
+        "Images": [".jpg"], "Documents": [".pdf", ".txt"], "Music": [".mp3"], "Archives": [".tar.gz"],
+    }
+    return {
+        "source_dir": source_dir,
+        "recursive": args.depth > 0,
+        "workers": args.workers,
+        "target_dirs": {name: {"exts": exts, "action": action} for name, exts in folders.items()},
+        "journal_dir": os.path.join(os.path.dirname(source_dir), "journal") if args.journal else "",
+    }
+
+
+class TimedEngine(sortengine.SortEngine):
+    """Движок, запоминающий время выполнения каждой задачи."""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.latencies = []
+        self._latency_lock = threading.Lock()
+
+    def execute(self, task, auto=False):
+        start = time.perf_counter()
+        try:
+            return super().execute(task, auto)
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._latency_lock:
+                self.latencies.append(elapsed)
+
+
+def _run_watch(engine, source_dir, staging_dir, args):
+    """Переносить файлы из staging_dir в наблюдаемую папку и ждать их сортировки."""
+    from autosort import start_observer
+
+    appeared = {}
+    latencies = []
+    done = threading.Event()
+    names = []
+    for current, _, files in os.walk(staging_dir):
+        names += [os.path.join(current, name) for name in files]
+
+    def callback(path):
+        engine.sort_file(path, auto=True)
+        latencies.append(time.perf_counter() - appeared.get(path, time.perf_counter()))
+        if len(latencies) >= len(names):
+            done.set()
+
+    for current, _, _ in os.walk(staging_dir):
+        os.makedirs(os.path.join(source_dir, os.path.relpath(current, staging_dir)), exist_ok=True)
+    config = dict(engine.config, settle_time=args.settle_time)
+    observer = start_observer(source_dir, callback, config, accept=engine.accepts_path)
+    try:
+        for path in names:
+            dst = os.path.join(source_dir, os.path.relpath(path, staging_dir))
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            appeared[dst] = time.perf_counter()
+            os.rename(path, dst)
+        done.wait(args.timeout)
+    finally:
+        observer.stop()
+        observer.join()
+    return latencies
+
+
+def measure_import(module, forbidden):
+    """Один импорт module в новом интерпретаторе: (мс по часам, мс по importtime, загруженные запрещённые модули)."""
+    code = (f"import json, sys; import {module}; "
+            f"print(json.dumps(sorted(m for m in {list(forbidden)!r} if m in sys.modules)))")
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code], cwd=os.path.dirname(os.path.abspath(__file__)),
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, check=True
+    )
+    wall_ms = (time.perf_counter() - start) * 1000
+    import_us = None
+    for line in proc.stderr.splitlines():
+        parts = line.split("|")
+        if len(parts) == 3 and parts[2].strip() == module:
+            import_us = int(parts[1])
+    return wall_ms, import_us / 1000 if import_us is not None else None, json.loads(proc.stdout)
+
+
+def run_startup(args):
+    modules = {}
+    failed = False
+    for module, forbidden in STARTUP_MODULES.items():
+        runs = sorted((measure_import(module, forbidden) for _ in range(max(1, args.startup_runs))),
+                      key=lambda run: run[1] or 0)
+        wall_ms, import_ms, loaded = runs[len(runs) // 2]
+        too_slow = args.max_import_ms is not None and import_ms is not None and import_ms > args.max_import_ms
+        failed |= too_slow or bool(loaded)
+        modules[module] = {
+            "import_ms": round(import_ms, 2) if import_ms is not None else None,
+            "process_ms": round(wall_ms, 2),
+            "heavy_loaded": loaded,
+            "too_slow": too_slow,
+        }
+    return {
+        "scenario": "startup",
+        "modules": modules,
+        "seconds": round(sum((m["import_ms"] or 0) for m in modules.values()) / 1000, 6),
+        "failed": failed,
+        "peak_rss_kb": peak_rss_kb(),
+    }
+
+
+def run_scenario(name, args):
+    """Выполнить один сценарий в текущем процессе и вернуть словарь результатов."""
+    if name == "startup":
+        return run_startup(args)
+    work_dir = tempfile.mkdtemp(prefix="filesorter-bench-", dir=args.tmp_dir)
+    try:
+        source_dir = os.path.join(work_dir, "source")
+        staging_dir = os.path.join(work_dir, "staging")
+        files, total_bytes = generate_tree(staging_dir if name == "watch" else source_dir, args)
+        sortengine.setup_logging(os.path.join(work_dir, "bench.log") if args.log else os.devnull)
+        action = "Копировать" if name == "copy" else "Переместить"
+        engine = TimedEngine(make_config(source_dir, args, action), test_run=name in ("scan", "dry-run"))
+        start = time.perf_counter()
+        if name == "scan":
+            processed = 0
+            for task in engine.iter_directory_tasks(source_dir):
+                processed += 1
+            latencies = []
+        elif name == "single":
+            processed = 0
+            latencies = []
+            paths = [entry.path for entry in engine.iter_files(source_dir)]
+            start = time.perf_counter()
+            for path in paths:
+                t = time.perf_counter()
+                if engine.sort_file(path, auto=True):
+                    processed += 1
+                latencies.append(time.perf_counter() - t)
+            engine.close_auto_journal()
+        elif name == "watch":
+            latencies = _run_watch(engine, source_dir, staging_dir, args)
+            processed = len(latencies)
+            engine.close_auto_journal()
+        else:
+            processed = engine.sort_directory(source_dir).processed
+            latencies = engine.latencies
+        seconds = time.perf_counter() - start
+        sortengine.sortlog.stop_logging()
+        latencies.sort()
+        return {
+            "scenario": name,
+            "files": files,
+            "bytes": total_bytes,
+            "processed": processed,
+            "seconds": round(seconds, 6),
+            "files_per_s": round(files / seconds, 1) if seconds else None,
+            "bytes_per_s": round(total_bytes / seconds) if seconds and name not in ("scan", "dry-run") else None,
+            "p50_ms": round(percentile(latencies, 50) * 1000, 4) if latencies else None,
+            "p99_ms": round(percentile(latencies, 99) * 1000, 4) if latencies else None,
+            "peak_rss_kb": peak_rss_kb(),
+        }
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def peak_rss_kb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == "darwin" else rss  # на macOS в байтах
+
+
+def run_isolated(name, argv):
+    """Запустить сценарий в дочернем процессе и прочитать его JSON."""
+    proc = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), *argv, "--child", name],
+        stdout=subprocess.PIPE, text=True, check=True
+    )
+    return json.loads(proc.stdout)
+
+
+def environment():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
+        ).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="benchmark", description="Замер скорости сортировки")
+    parser.add_argument("scenarios", nargs="*", metavar="SCENARIO",
+                        help=f"сценарии из {', '.join(SCENARIOS)} (по умолчанию все, кроме watch)")
+    parser.add_argument("--files", type=int, default=5000, help="число файлов")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="распределение размеров, например 4k:70,1m:30")
+    parser.add_argument("--exts", default=DEFAULT_EXTS, help="доли расширений, например .jpg:50,.bin:50")
+    parser.add_argument("--depth", type=int, default=0, help="глубина вложенных папок (0 -- плоская папка)")
+    parser.add_argument("--fanout", type=int, default=4, help="подпапок на уровень")
+    parser.add_argument("--workers", type=int, default=sortengine.DEFAULT_WORKERS, help="потоков движка")
+    parser.add_argument("--seed", type=int, default=1, help="зерно генератора дерева")
+    parser.add_argument("--repeat", type=int, default=1, help="повторов сценария (в отчёт идёт медианный)")
+    parser.add_argument("--journal", action="store_true", help="вести журнал запусков")
+    parser.add_argument("--log", action="store_true", help="писать лог в файл (по умолчанию в /dev/null)")
+    parser.add_argument("--settle-time", type=float, default=0.2, help="settle_time для сценария watch")
+    parser.add_argument("--timeout", type=float, default=600, help="предельное время сценария watch, с")
+    parser.add_argument("--max-import-ms", type=float, help="для startup: предельное время импорта модуля, мс")
+    parser.add_argument("--startup-runs", type=int, default=5, help="для startup: запусков интерпретатора на модуль")
+    parser.add_argument("--tmp-dir", help="где создавать деревья (важна файловая система)")
+    parser.add_argument("--output", help="файл для JSON (по умолчанию stdout)")
+    parser.add_argument("--child", choices=SCENARIOS, help=argparse.SUPPRESS)
+    return parser
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"неизвестные сценарии: {', '.join(sorted(unknown))}")
+    if args.child:
+        json.dump(run_scenario(args.child, args), sys.stdout)
+        return 0
+    child_argv = [a for a in argv if a not in SCENARIOS]
+    results = []
+    for name in args.scenarios or DEFAULT_SCENARIOS:
+        runs = sorted((run_isolated(name, child_argv) for _ in range(max(1, args.repeat))),
+                      key=lambda r: r["seconds"])
+        result = runs[len(runs) // 2]
+        result["runs"] = [r["seconds"] for r in runs]
+        results.append(result)
+        if name == "startup":
+            for module, m in result["modules"].items():
+                heavy = f"  загружены: {', '.join(m['heavy_loaded'])}" if m["heavy_loaded"] else ""
+                print(f"{name:8} {module}: импорт {m['import_ms']} мс, процесс {m['process_ms']} мс{heavy}",
+                      file=sys.stderr)
+            continue
+        print(f"{name:8} {result['files_per_s']:>10} файлов/с  p50 {result['p50_ms']} мс  "
+              f"p99 {result['p99_ms']} мс  RSS {result['peak_rss_kb']} КБ", file=sys.stderr)
+    report = {"params": {k: v for k, v in vars(args).items() if k not in ("child", "output", "scenarios")},
+              "environment": environment(), "results": results}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=4, ensure_ascii=False)
+    else:
+        json.dump(report, sys.stdout, indent=4, ensure_ascii=False)
+        print()
+    return 1 if any(result.get("failed") for result in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
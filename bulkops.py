@@ -0,0 +1,222 @@
+"""
+Массовые операции над подпапками: возврат файлов в исходную папку и
+удаление подпапки целиком.
+
+Обе выполняются в пуле потоков движка (SortEngine.workers) и подходят для
+фонового запуска: progress(done, total) вызывается в потоке вызывающего,
+cancel (threading.Event) останавливает отправку новых пакетов, уже
+отправленные дорабатываются. Прерванную операцию можно просто запустить
+снова -- она продолжит с того, что осталось на диске.
+
+Это фоновые задания: они подчиняются пределам раздела "io" и уступают
+интерактивной сортировке (см. iolimit).
+"""
+import contextlib
+import logging
+import os
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import fileops
+import iolimit
+import journal
+
+BATCH_SIZE = 256
+
+# done -- обработано файлов (и папок при удалении), total -- всего
+BulkResult = namedtuple("BulkResult", "done total failed cancelled")
+
+
+def _run_batches(batches, func, workers, progress, cancel, total):
+    """Выполнить func(batch) -> (успешно, ошибок) для пакетов в пуле; не больше 2*workers пакетов в работе."""
+    done = failed = 0
+    cancelled = False
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bulk") as pool:
+        pending = deque()
+
+        def collect():
+            nonlocal done, failed
+            ok, errors = pending.popleft().result()
+            done += ok
+            failed += errors
+            if progress:
+                progress(done + failed, total)
+        for batch in batches:
+            if cancel is not None and cancel.is_set():
+                cancelled = True
+                break
+            pending.append(pool.submit(func, batch))
+            while pending and (len(pending) > 2 * workers or pending[0].done()):
+                collect()
+        while pending:
+            collect()
+    return done, failed, cancelled
+
+
+def _background(io):
+    """Декоратор функции пакета: выполнять её как фоновое задание io (или без ограничений, если io нет)."""
+    def wrap(func):
+        def run(batch):
+            with io.job(iolimit.BACKGROUND) if io is not None else contextlib.nullcontext():
+                return func(batch)
+        return run
+    return wrap
+
+
+def _chunks(items, size=BATCH_SIZE):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def return_files(engine, subfolder_path, dest_dir, progress=None, cancel=None):
+    """
+    Переместить файлы из subfolder_path (без вложенных папок) в dest_dir и
+    удалить подпапку, если она опустела. Имена выбираются по политике
+    "collisions" движка, операции пишутся в журнал запуска (вид "return"),
+    так что возврат можно отменить как обычную сортировку.
+    """
+    io = engine.io
+    with io.job(iolimit.BACKGROUND), os.scandir(subfolder_path) as entries:
+        files = [entry.path for entry in entries if entry.is_file()]
+    total = len(files)
+    subfolder = os.path.basename(subfolder_path)
+    names = engine.name_registry()
+    replace = names.policy == "overwrite"
+    test_run = engine.test_run
+    run_journal = engine.open_journal(dest_dir, "return")
+
+    @_background(io)
+    def move_batch(batch):
+        planned = []
+        for src in batch:
+            name = names.reserve(dest_dir, os.path.basename(src), src)
+            planned.append((src, os.path.join(dest_dir, name) if name else None))
+        ops = [["move", src, dst] for src, dst in planned if dst]
+        batch_id = run_journal.begin_batch(ops) if run_journal is not None and ops else None
+        ok = errors = 0
+        outcomes = []
+        dsts = []
+        for src, dst in planned:
+            file_name = os.path.basename(src)
+            if dst is None:
+                logging.info(f"Файл '{file_name}' оставлен в '{subfolder}': такой же уже есть в исходной папке.")
+                ok += 1
+                continue
+            planned_dst = dst
+            try:
+                if not test_run:
+                    io.acquire_op()
+                    while dst is not None:
+                        try:
+                            fileops.move_file(src, dst, io.copy_throttle(), replace)
+                            break
+                        except FileExistsError:
+                            # Имя заняли мимо реестра (другой запуск): берём следующее
+                            names.taken_elsewhere(dest_dir, os.path.basename(dst))
+                            name = names.reserve(dest_dir, file_name, src)
+                            dst = os.path.join(dest_dir, name) if name else None
+                if dst is None:
+                    logging.info(f"Файл '{file_name}' оставлен в '{subfolder}': такой же уже есть в исходной папке.")
+                    outcomes.append(journal.DUPLICATE)
+                else:
+                    logging.info(f"Файл '{file_name}' возвращён из '{subfolder}' в исходную папку.")
+                    outcomes.append(journal.OK)
+                ok += 1
+            except Exception as e:
+                logging.error(f"Ошибка возврата файла '{file_name}': {str(e)}")
+                outcomes.append(journal.FAILED)
+                errors += 1
+            dsts.append(dst or planned_dst)
+        if batch_id is not None:
+            run_journal.end_batch(batch_id, outcomes, dsts if dsts != [op[2] for op in ops] else None)
+        return ok, errors
+
+    try:
+        done, failed, cancelled = _run_batches(_chunks(files), move_batch, engine.workers, progress, cancel, total)
+    finally:
+        engine.close_journal(run_journal)
+    if not cancelled and not test_run:
+        try:
+            os.rmdir(subfolder_path)
+            logging.info(f"Папка '{subfolder}' удалена после возврата файлов.")
+        except OSError:
+            pass  # в папке остались вложенные папки или файлы
+    return BulkResult(done, total, failed, cancelled)
+
+
+def _scan_tree(path):
+    """Файлы (и ссылки) дерева и его папки по уровням вложенности; ссылки на папки не обходятся."""
+    files = []
+    levels = [[path]]
+    depth = 0
+    while depth < len(levels):
+        for current in levels[depth]:
+            with os.scandir(current) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        if depth + 1 == len(levels):
+                            levels.append([])
+                        levels[depth + 1].append(entry.path)
+                    else:
+                        files.append(entry.path)
+        depth += 1
+    return files, levels
+
+
+def delete_tree(path, workers=4, progress=None, cancel=None, test_run=False, io=None):
+    """
+    Удалить папку со всем содержимым: файлы удаляются пакетами параллельно,
+    затем папки -- снизу вверх, уровень за уровнем. При отмене удаление
+    папок не начинается. io -- iolimit.IOLimiter для пределов и приоритета.
+    """
+    with io.job(iolimit.BACKGROUND) if io is not None else contextlib.nullcontext():
+        files, levels = _scan_tree(path)
+    dirs = sum(len(level) for level in levels)
+    total = len(files) + dirs
+
+    @_background(io)
+    def unlink_batch(batch):
+        ok = errors = 0
+        for file_path in batch:
+            try:
+                if not test_run:
+                    if io is not None:
+                        io.acquire_op()
+                    os.unlink(file_path)
+                ok += 1
+            except FileNotFoundError:
+                ok += 1
+            except OSError as e:
+                logging.error(f"Ошибка удаления файла '{file_path}': {str(e)}")
+                errors += 1
+        return ok, errors
+
+    @_background(io)
+    def rmdir_batch(batch):
+        ok = errors = 0
+        for dir_path in batch:
+            try:
+                if not test_run:
+                    if io is not None:
+                        io.acquire_op()
+                    os.rmdir(dir_path)
+                ok += 1
+            except FileNotFoundError:
+                ok += 1
+            except OSError as e:
+                logging.error(f"Ошибка удаления папки '{dir_path}': {str(e)}")
+                errors += 1
+        return ok, errors
+
+    done, failed, cancelled = _run_batches(_chunks(files), unlink_batch, workers, progress, cancel, total)
+    for level in reversed(levels):
+        if cancelled:
+            break
+
+        def report(level_done, _, offset=done + failed):
+            if progress:
+                progress(offset + level_done, total)
+        level_ok, level_failed, cancelled = _run_batches(_chunks(level), rmdir_batch, workers, report, cancel, total)
+        done += level_ok
+        failed += level_failed
+    return BulkResult(done, total, failed, cancelled)
@@ -0,0 +1,86 @@
+"""
+Слежение за файлом конфигурации для подмены правил на ходу.
+
+Раз в interval секунд файл проверяется одним stat: отметка версии --
+(inode, размер, mtime), см. sortengine.config_stamp. save_config пишет файл
+атомарно (переименованием), поэтому при смене отметки читается целый файл.
+Новый config.json, разосланный по машинам тем же способом (запись рядом и
+переименование), запущенные экземпляры подхватывают без перезапуска.
+Файл с ошибкой JSON пропускается до следующего изменения, прежняя
+конфигурация остаётся в силе.
+"""
+import json
+import logging
+import threading
+
+import sortengine
+
+CONFIG_POLL_INTERVAL = 2.0
+
+
+class ConfigWatcher:
+    """
+    Вызывает on_change(config) в своём потоке, когда файл конфигурации
+    меняется. Исключение в on_change (например, ошибка в правилах)
+    записывается в лог, наблюдение продолжается.
+    """
+    def __init__(self, config_file, on_change, interval=CONFIG_POLL_INTERVAL):
+        self.config_file = config_file
+        self.on_change = on_change
+        self.interval = interval
+        self._stamp = sortengine.config_stamp(config_file)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="config-watch", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def join(self, timeout=None):
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+
+    def saved(self):
+        """Запомнить текущую версию файла: собственное сохранение не считается изменением."""
+        with self._lock:
+            self._stamp = sortengine.config_stamp(self.config_file)
+
+    def check(self):
+        """Проверить файл сейчас; True, если загружена новая конфигурация."""
+        with self._lock:
+            stamp = sortengine.config_stamp(self.config_file)
+            if stamp is None or stamp == self._stamp:
+                return False
+            self._stamp = stamp
+            try:
+                with open(self.config_file, "r", encoding="utf-8") as f:
+                    config = json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                logging.error(f"Конфигурация '{self.config_file}' не загружена: {str(e)}")
+                return False
+        try:
+            self.on_change(config)
+        except Exception as e:
+            logging.error(f"Ошибка применения конфигурации '{self.config_file}': {str(e)}")
+            return False
+        logging.info(f"Конфигурация '{self.config_file}' перечитана.")
+        return True
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.check()
+
+
+def watch_config(config_file, on_change, config=None):
+    """
+    Запустить ConfigWatcher с интервалом "config_poll_interval" из config
+    (по умолчанию CONFIG_POLL_INTERVAL); 0 отключает слежение -- тогда None.
+    """
+    interval = float((config or {}).get("config_poll_interval", CONFIG_POLL_INTERVAL))
+    if interval <= 0:
+        return None
+    return ConfigWatcher(config_file, on_change, interval).start()
@@ -0,0 +1,191 @@
+"""
+Поиск дубликатов по содержимому при сортировке.
+
+Кандидаты отбираются по размеру среди файлов целевой папки, затем
+сравнивается быстрый частичный хэш (начало и конец файла) и только при
+совпадении -- полный хэш, который считается потоково через mmap. Хэши
+кэшируются по (устройство, inode) с проверкой размера и mtime, поэтому
+файл, перемещённый внутри тома, повторно не хэшируется; при заданном
+"hash_cache" кэш хранится в SQLite между запусками.
+"""
+import hashlib
+import mmap
+import os
+import threading
+import time
+
+DUPLICATE_POLICIES = ("off", "skip", "hardlink", "delete")
+PARTIAL_BLOCK = 64 * 1024
+FULL_CHUNK = 1024 * 1024
+COMMIT_EVERY = 1000
+COMMIT_INTERVAL = 5.0  # секунд: в режиме наблюдения записи редкие, а запуск не кончается
+
+
+def partial_hash(path, size):
+    """Хэш первых и последних PARTIAL_BLOCK байт; файлы до 2*PARTIAL_BLOCK читаются целиком."""
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        h.update(f.read(PARTIAL_BLOCK))
+        if size > 2 * PARTIAL_BLOCK:
+            f.seek(size - PARTIAL_BLOCK)
+        h.update(f.read(PARTIAL_BLOCK))
+    return h.digest()
+
+
+def full_hash(path, size):
+    """Полный хэш файла; данные читаются через mmap кусками по FULL_CHUNK."""
+    h = hashlib.blake2b()
+    if size == 0:
+        return h.digest()
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        view = memoryview(mm)
+        try:
+            for offset in range(0, len(mm), FULL_CHUNK):
+                h.update(view[offset:offset + FULL_CHUNK])
+        finally:
+            view.release()
+    return h.digest()
+
+
+class HashCache:
+    """Кэш хэшей в памяти и, если задан db_path, в SQLite. Потокобезопасен."""
+    def __init__(self, db_path=None):
+        self._lock = threading.Lock()
+        self._mem = {}  # (dev, inode) -> [size, mtime_ns, partial, full]
+        self.conn = None
+        self._writes = 0
+        self._committed = time.monotonic()
+        if db_path:
+            import sqlite3
+            self.conn = sqlite3.connect(db_path, check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS hashes (dev INTEGER, inode INTEGER, size INTEGER, mtime_ns INTEGER,"
+                " partial BLOB, full BLOB, PRIMARY KEY (dev, inode)) WITHOUT ROWID"
+            )
+
+    def _entry(self, st):
+        key = (st.st_dev, st.st_ino)
+        entry = self._mem.get(key)
+        if entry is None and self.conn is not None:
+            row = self.conn.execute(
+                "SELECT size, mtime_ns, partial, full FROM hashes WHERE dev = ? AND inode = ?", key
+            ).fetchone()
+            if row:
+                entry = self._mem[key] = list(row)
+        if entry is None or entry[0] != st.st_size or entry[1] != st.st_mtime_ns:
+            entry = self._mem[key] = [st.st_size, st.st_mtime_ns, None, None]
+        return entry
+
+    def _store(self, st, entry):
+        if self.conn is not None:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?, ?)",
+                (st.st_dev, st.st_ino, *entry)
+            )
+            self._writes += 1
+            if self._writes >= COMMIT_EVERY or time.monotonic() - self._committed >= COMMIT_INTERVAL:
+                self._commit()
+
+    def _commit(self):
+        self.conn.commit()
+        self._writes = 0
+        self._committed = time.monotonic()
+
+    def get(self, path, st, full=False):
+        """Частичный (или полный при full=True) хэш файла, из кэша, если файл не менялся."""
+        slot = 3 if full else 2
+        with self._lock:
+            value = self._entry(st)[slot]
+        if value is not None:
+            return value
+        value = (full_hash if full else partial_hash)(path, st.st_size)
+        with self._lock:
+            entry = self._entry(st)
+            entry[slot] = value
+            self._store(st, entry)
+        return value
+
+    def commit(self):
+        with self._lock:
+            if self.conn is not None and self._writes:
+                self._commit()
+
+    def close(self):
+        with self._lock:
+            if self.conn is not None:
+                self._commit()
+                self.conn.close()
+                self.conn = None
+
+
+class Deduplicator:
+    """
+    Индекс размеров файлов по целевым папкам и сравнение содержимого.
+
+    Индекс папки строится один раз и перестраивается, только если mtime
+    папки изменился не из-за файлов, добавленных через add().
+    """
+    def __init__(self, cache):
+        self.cache = cache
+        self._lock = threading.Lock()
+        self._folders = {}  # папка -> (mtime_ns, {размер: [пути]})
+
+    def _sizes(self, target_dir):
+        try:
+            mtime_ns = os.stat(target_dir).st_mtime_ns
+        except OSError:
+            return {}
+        with self._lock:
+            cached = self._folders.get(target_dir)
+            if cached and cached[0] == mtime_ns:
+                return cached[1]
+        sizes = {}
+        with os.scandir(target_dir) as entries:
+            for entry in entries:
+                if entry.is_file(follow_symlinks=False):
+                    sizes.setdefault(entry.stat().st_size, []).append(entry.path)
+        with self._lock:
+            self._folders[target_dir] = (mtime_ns, sizes)
+        return sizes
+
+    def find(self, src, target_dir):
+        """Путь файла в target_dir с тем же содержимым, что у src, или None."""
+        try:
+            src_st = os.stat(src)
+        except OSError:
+            return None
+        candidates = self._sizes(target_dir).get(src_st.st_size)
+        if not candidates:
+            return None
+        src_partial = None
+        for path in list(candidates):
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            if st.st_size != src_st.st_size:
+                continue
+            if (st.st_dev, st.st_ino) == (src_st.st_dev, src_st.st_ino):
+                return path
+            if src_partial is None:
+                src_partial = self.cache.get(src, src_st)
+            if self.cache.get(path, st) != src_partial:
+                continue
+            if self.cache.get(path, st, full=True) == self.cache.get(src, src_st, full=True):
+                return path
+        return None
+
+    def add(self, path, target_dir):
+        """Учесть файл, помещённый в target_dir, без перечитывания папки."""
+        try:
+            size = os.stat(path).st_size
+            mtime_ns = os.stat(target_dir).st_mtime_ns
+        except OSError:
+            return
+        with self._lock:
+            cached = self._folders.get(target_dir)
+            if cached:
+                cached[1].setdefault(size, []).append(path)
+                self._folders[target_dir] = (mtime_ns, cached[1])
@@ -0,0 +1,175 @@
+"""
+Опрос папок для сетевых дисков (SMB/NFS), где события файловой системы не
+приходят. Замена Observer из watchdog с тем же интерфейсом
+(schedule/start/stop/join/is_alive).
+
+В отличие от watchdog.observers.polling здесь на каждом проходе делается
+один stat на папку: содержимое перечитывается только у папок, время
+изменения которых сдвинулось. Снимок папки -- имя -> (размер, mtime) для
+файлов и множество имён вложенных папок; разница со снимком превращается в
+события created/modified для обработчика.
+
+Интервал опроса у каждой наблюдаемой папки свой: после изменений он
+сбрасывается к poll_interval, без изменений растёт до poll_max_interval.
+"""
+import heapq
+import logging
+import os
+import threading
+import time
+
+from watchdog.events import FileCreatedEvent, FileModifiedEvent
+
+import metrics as sortmetrics
+
+POLL_INTERVAL = 2.0
+POLL_MAX_INTERVAL = 30.0
+POLL_BACKOFF = 1.5
+# mtime папки на сетевых дисках грубый (до 2 с на FAT/SMB): изменение в ту же
+# секунду, что и чтение, его не сдвигает. Поэтому недавно изменившаяся папка
+# перечитывается ещё раз, когда mtime простоит столько секунд.
+RACY_WINDOW = 3.0
+
+
+class _DirState:
+    __slots__ = ("mtime", "files", "dirs", "verify_at")
+
+    def __init__(self, mtime, files, dirs, verify_at):
+        self.mtime = mtime
+        self.files = files          # имя -> (размер, mtime_ns)
+        self.dirs = dirs            # имена вложенных папок
+        self.verify_at = verify_at  # когда перечитать повторно (time.monotonic) или None
+
+
+class _Watch:
+    __slots__ = ("handler", "path", "recursive", "accept_dir", "interval", "dirs")
+
+    def __init__(self, handler, path, recursive, accept_dir, interval):
+        self.handler = handler
+        self.path = path
+        self.recursive = recursive
+        self.accept_dir = accept_dir
+        self.interval = interval
+        self.dirs = {}              # путь папки -> _DirState
+
+
+class DirectoryPoller:
+    """
+    Опрашивает наблюдаемые папки в одном потоке. accept_dir(path) в
+    schedule() отсекает вложенные папки, которые не нужно обходить
+    (целевые, исключённые).
+    """
+    def __init__(self, interval=POLL_INTERVAL, max_interval=POLL_MAX_INTERVAL, metrics=sortmetrics.NULL):
+        self.interval = interval
+        self.max_interval = max(interval, max_interval)
+        self.metrics = metrics
+        self._watches = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="autosort-poll", daemon=True)
+
+    def schedule(self, event_handler, path, recursive=False, accept_dir=None):
+        watch = _Watch(event_handler, os.path.normpath(path), recursive, accept_dir, self.interval)
+        self._watches.append(watch)
+        return watch
+
+    def start(self):
+        # Исходное состояние снимается до возврата, чтобы файлы, созданные
+        # сразу после запуска, не попали в снимок без события
+        for watch in self._watches:
+            self._scan(watch, initial=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def join(self, timeout=None):
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+
+    def is_alive(self):
+        return self._thread.is_alive()
+
+    def _run(self):
+        now = time.monotonic()
+        heap = [(now + watch.interval, i) for i, watch in enumerate(self._watches)]
+        heapq.heapify(heap)
+        while heap:
+            due, i = heap[0]
+            if self._stop.wait(max(0.0, due - time.monotonic())):
+                return
+            heapq.heappop(heap)
+            watch = self._watches[i]
+            try:
+                changed = self._scan(watch)
+            except Exception as e:
+                logging.error(f"Ошибка опроса папки '{watch.path}': {str(e)}")
+                changed = False
+            if changed:
+                watch.interval = self.interval
+            else:
+                watch.interval = min(watch.interval * POLL_BACKOFF, self.max_interval)
+            heapq.heappush(heap, (time.monotonic() + watch.interval, i))
+
+    def _scan(self, watch, initial=False):
+        """Один проход по папке; True, если найдены новые или изменённые файлы."""
+        changed = False
+        stack = [watch.path]
+        seen = set()
+        while stack:
+            path = stack.pop()
+            seen.add(path)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            self.metrics.inc("filesorter_poll_stats_total")
+            state = watch.dirs.get(path)
+            now = time.monotonic()
+            if (state is None or state.mtime != st.st_mtime_ns
+                    or state.verify_at is not None and now >= state.verify_at):
+                changed |= self._list(watch, path, st.st_mtime_ns, state, initial)
+            state = watch.dirs.get(path)
+            if state is not None and watch.recursive:
+                stack.extend(os.path.join(path, name) for name in state.dirs)
+        # Папки, которых больше нет или которые перестали обходиться
+        for path in [path for path in watch.dirs if path not in seen]:
+            del watch.dirs[path]
+        return changed
+
+    def _list(self, watch, path, mtime, state, initial):
+        self.metrics.inc("filesorter_poll_listings_total")
+        files, dirs = {}, set()
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if watch.accept_dir is None or watch.accept_dir(entry.path):
+                                dirs.add(entry.name)
+                        elif entry.is_file():
+                            est = entry.stat()
+                            files[entry.name] = (est.st_size, est.st_mtime_ns)
+                    except OSError:
+                        continue
+        except OSError:
+            watch.dirs.pop(path, None)
+            return False
+        now = time.monotonic()
+        old_files = state.files if state is not None else {}
+        changed = False
+        if not initial:
+            # У новой вложенной папки (state is None) все файлы -- новые
+            for name, signature in files.items():
+                previous = old_files.get(name)
+                if previous == signature:
+                    continue
+                changed = True
+                file_path = os.path.join(path, name)
+                event = FileCreatedEvent(file_path) if previous is None else FileModifiedEvent(file_path)
+                watch.handler.dispatch(event)
+        if state is None:
+            recent = abs(time.time() - mtime / 1e9) < RACY_WINDOW
+        else:
+            recent = changed or state.mtime != mtime
+        watch.dirs[path] = _DirState(mtime, files, dirs, now + RACY_WINDOW if recent else None)
+        return changed
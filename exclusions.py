@@ -0,0 +1,139 @@
+"""
+Скомпилированные исключения в стиле .gitignore.
+
+Раздел "exclusions" конфигурации:
+    "patterns"      -- шаблоны как в .gitignore, по умолчанию [".*"]:
+                       "*.bak", "!keep.bak" (отмена исключения), "cache/"
+                       (только папки), "docs/*.tmp" или "/draft.txt" (путь от
+                       папки сортировки), "**/build/"; выигрывает последний
+                       подошедший шаблон, строки с "#" -- комментарии;
+    "temp_suffixes" -- окончания незавершённых загрузок, исключаются всегда;
+    "min_size", "max_size" -- границы размера файла в байтах;
+    "min_age", "max_age"   -- границы возраста файла (по mtime) в секундах.
+Шаблоны собираются в одно регулярное выражение для файлов и одно для папок,
+так что проверка пути -- один fullmatch. Пути относительные, через "/".
+"""
+import os
+import re
+import time
+
+DEFAULT_PATTERNS = [".*"]  # скрытые файлы и папки
+# Незавершённые загрузки браузеров; файл сортируется после переименования
+TEMP_SUFFIXES = (".crdownload", ".part", ".partial", ".download", ".tmp", ".opdownload")
+
+
+def _glob_to_regex(glob):
+    """Glob в стиле .gitignore: '*' и '?' не пересекают '/', '**' -- любые папки."""
+    out = []
+    i, n = 0, len(glob)
+    while i < n:
+        c = glob[i]
+        if c == "*":
+            if glob.startswith("**", i):
+                i += 2
+                if i < n and glob[i] == "/":
+                    out.append("(?:.*/)?")
+                    i += 1
+                else:
+                    out.append(".*")
+                continue
+            out.append("[^/]*")
+        elif c == "?":
+            out.append("[^/]")
+        elif c == "[":
+            j = glob.find("]", i + 2)
+            if j < 0:
+                out.append(re.escape(c))
+            else:
+                body = glob[i + 1:j].replace("\\", "\\\\")
+                if body.startswith("!"):
+                    body = "^" + body[1:]
+                out.append(f"[{body}]")
+                i = j + 1
+                continue
+        elif c == "\\" and i + 1 < n:
+            out.append(re.escape(glob[i + 1]))
+            i += 2
+            continue
+        else:
+            out.append(re.escape(c))
+        i += 1
+    return "".join(out)
+
+
+def _parse_pattern(line):
+    """Строка шаблона -> (regex, отмена, только папки) или None для пустых строк и комментариев."""
+    line = line.strip()
+    if not line or line.startswith("#"):
+        return None
+    negate = line.startswith("!")
+    if negate or line.startswith(("\\!", "\\#")):
+        line = line[1:]
+    dir_only = line.endswith("/")
+    line = line.rstrip("/")
+    if not line:
+        return None
+    # Шаблон с '/' в начале или середине отсчитывается от папки сортировки
+    anchored = "/" in line
+    regex = _glob_to_regex(line.lstrip("/"))
+    if not anchored:
+        regex = "(?:.*/)?" + regex
+    return regex, negate, dir_only
+
+
+class ExclusionRules:
+    """Неизменяемый набор исключений; для обновления создаётся новый объект."""
+    __slots__ = ("_files", "_dirs", "min_size", "max_size", "min_age", "max_age")
+
+    def __init__(self, config=None):
+        config = config or {}
+        file_parts, dir_parts = [], []
+        for i, line in enumerate(config.get("patterns", DEFAULT_PATTERNS)):
+            parsed = _parse_pattern(line)
+            if parsed is None:
+                continue
+            regex, negate, dir_only = parsed
+            group = f"{'k' if negate else 'x'}{i}"
+            part = f"(?P<{group}>{regex})"
+            dir_parts.append(part)
+            if not dir_only:
+                file_parts.append(part)
+        suffixes = config.get("temp_suffixes", TEMP_SUFFIXES)
+        if suffixes:
+            file_parts.append("(?P<temp>(?i:.*(?:{})))".format("|".join(re.escape(s) for s in suffixes)))
+        flags = re.IGNORECASE if os.path.normcase("A") == "a" else 0
+        # Альтернативы проверяются по порядку, а выигрывать должен последний шаблон
+        self._files = re.compile("|".join(reversed(file_parts)), flags) if file_parts else None
+        self._dirs = re.compile("|".join(reversed(dir_parts)), flags) if dir_parts else None
+        self.min_size = config.get("min_size")
+        self.max_size = config.get("max_size")
+        self.min_age = config.get("min_age")
+        self.max_age = config.get("max_age")
+
+    @property
+    def needs_stat(self):
+        """Заданы ли пороги размера или возраста (для них нужен stat файла)."""
+        return any(v is not None for v in (self.min_size, self.max_size, self.min_age, self.max_age))
+
+    def excluded(self, rel_path, is_dir=False):
+        """Исключён ли путь по шаблонам."""
+        pattern = self._dirs if is_dir else self._files
+        if pattern is None:
+            return False
+        m = pattern.fullmatch(rel_path)
+        return m is not None and m.lastgroup[0] != "k"
+
+    def excluded_stat(self, st, now=None):
+        """Исключён ли файл по размеру или возрасту."""
+        size = st.st_size
+        if self.min_size is not None and size < self.min_size:
+            return True
+        if self.max_size is not None and size > self.max_size:
+            return True
+        if self.min_age is not None or self.max_age is not None:
+            age = (time.time() if now is None else now) - st.st_mtime
+            if self.min_age is not None and age < self.min_age:
+                return True
+            if self.max_age is not None and age > self.max_age:
+                return True
+        return False
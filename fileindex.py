@@ -0,0 +1,141 @@
+"""
+Постоянный индекс состояния файлов для повторных сортировок (SQLite).
+
+Для каждой просмотренной папки хранится её mtime до чтения и список
+подпапок, для файлов -- inode, размер, mtime и принятое решение. Папка,
+mtime которой не изменился, при следующем запуске не читается вовсе; в
+изменённой папке заново оцениваются только новые и изменённые файлы.
+Все записи привязаны к версии правил: после изменения правил индекс
+перестраивается.
+"""
+import os
+import sqlite3
+from collections import namedtuple
+
+NO_RULE = ""           # файл просмотрен, правило не подошло (с размером и mtime -- по содержимому)
+COMMIT_EVERY = 1000    # записей между фиксациями транзакции
+
+FileState = namedtuple("FileState", "inode size mtime_ns decision")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS dirs (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    subdirs TEXT NOT NULL,
+    version TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS files (
+    dir TEXT NOT NULL,
+    name TEXT NOT NULL,
+    inode INTEGER NOT NULL,
+    size INTEGER,
+    mtime_ns INTEGER,
+    decision TEXT NOT NULL,
+    version TEXT NOT NULL,
+    PRIMARY KEY (dir, name)
+) WITHOUT ROWID;
+"""
+
+
+class FileStateIndex:
+    """
+    Индекс одного запуска сортировки; используется из одного потока.
+
+    Состояние папок записывается только в finish(), и только для папок,
+    где не было ошибок: прерванный запуск не помечает папку просмотренной.
+    """
+    NO_RULE = NO_RULE
+
+    def __init__(self, db_path, version):
+        self.version = version
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(_SCHEMA)
+        self._listed = {}        # путь папки -> (mtime_ns, подпапки)
+        self._incomplete = set()
+        self._writes = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.finish()
+        self.close()
+
+    def unchanged_subdirs(self, dir_path, mtime_ns):
+        """
+        Список подпапок, если папка не менялась с прошлого запуска, иначе None.
+        Папки с файлами, решение по которым зависит от содержимого
+        (скопированными или не подошедшими к правилам по содержимому),
+        всегда перечитываются: правка файла на месте не меняет mtime папки.
+        """
+        row = self.conn.execute(
+            "SELECT mtime_ns, subdirs FROM dirs WHERE path = ? AND version = ?",
+            (dir_path, self.version)
+        ).fetchone()
+        if row is None or row[0] != mtime_ns:
+            return None
+        if self.conn.execute(
+            "SELECT 1 FROM files WHERE dir = ? AND (decision != ? OR size IS NOT NULL) LIMIT 1", (dir_path, NO_RULE)
+        ).fetchone():
+            return None
+        return row[1].split("\0") if row[1] else []
+
+    def entries(self, dir_path):
+        """Известные файлы папки: имя -> FileState (только текущей версии правил)."""
+        return {
+            name: FileState(inode, size, mtime_ns, decision)
+            for name, inode, size, mtime_ns, decision in self.conn.execute(
+                "SELECT name, inode, size, mtime_ns, decision FROM files WHERE dir = ? AND version = ?",
+                (dir_path, self.version)
+            )
+        }
+
+    def listed_dir(self, dir_path, mtime_ns, subdirs, missing=()):
+        """Запомнить прочитанную папку и удалить записи исчезнувших файлов."""
+        self._listed[dir_path] = (mtime_ns, subdirs)
+        if missing:
+            self.conn.executemany(
+                "DELETE FROM files WHERE dir = ? AND name = ?", ((dir_path, name) for name in missing)
+            )
+            self._count_write(len(missing))
+
+    def record(self, path, inode, size, mtime_ns, decision):
+        dir_path, name = os.path.split(path)
+        self.conn.execute(
+            "INSERT OR REPLACE INTO files (dir, name, inode, size, mtime_ns, decision, version) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (dir_path, name, inode, size, mtime_ns, decision, self.version)
+        )
+        self._count_write()
+
+    def forget(self, path):
+        self.conn.execute("DELETE FROM files WHERE dir = ? AND name = ?", os.path.split(path))
+        self._count_write()
+
+    def mark_incomplete(self, path):
+        """Файл в папке не обработан: папку нужно перечитать в следующий раз."""
+        self._incomplete.add(os.path.dirname(path))
+
+    def _count_write(self, n=1):
+        self._writes += n
+        if self._writes >= COMMIT_EVERY:
+            self.conn.commit()
+            self._writes = 0
+
+    def finish(self):
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO dirs (path, mtime_ns, subdirs, version) VALUES (?, ?, ?, ?)",
+            (
+                (path, mtime_ns, "\0".join(subdirs), self.version)
+                for path, (mtime_ns, subdirs) in self._listed.items()
+                if path not in self._incomplete
+            )
+        )
+        self.conn.commit()
+        self._listed.clear()
+        self._incomplete.clear()
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,175 @@
+"""
+Быстрые операции перемещения и копирования файлов.
+
+Перемещение в пределах одного тома -- один os.rename; на другой том файл
+копируется самым дешёвым доступным способом и удаляется. Копирование
+пробует по порядку: жёсткую ссылку (если включена), reflink (FICLONE на
+btrfs/xfs), os.copy_file_range и shutil.copyfile (sendfile в Linux,
+fcopyfile в macOS). Метаданные переносятся как в shutil.copy2.
+
+С throttle(nbytes) данные копируются блоками по CHUNK_SIZE байт, и перед
+каждым блоком вызывается throttle -- так фоновое копирование укладывается в
+пределы скорости и уступает интерактивным заданиям (см. iolimit). Блоки
+копирует ядро (copy_file_range, в Linux без него -- sendfile); через память
+Python данные идут только в других ОС.
+
+С replace=False существующий файл назначения не заменяется ни при каком
+способе: перемещение на том же томе -- жёсткая ссылка и удаление исходного
+(в Windows rename и так не заменяет файл), копирование создаёт файл с
+O_EXCL. Если имя уже занято, выбрасывается FileExistsError, и вызывающий
+берёт другое.
+"""
+import errno
+import os
+import shutil
+import sys
+
+COPY_MODES = ("copy", "hardlink")
+CHUNK_SIZE = 1024 * 1024
+FICLONE = 0x40049409  # ioctl из linux/fs.h
+# Ошибки, после которых способ копирования пропускается и берётся следующий
+_FALLBACK_ERRNOS = {errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP, errno.ENOTTY, errno.EPERM, errno.EBADF}
+
+if sys.platform.startswith("linux"):
+    import fcntl
+else:
+    fcntl = None
+
+
+def _reflink(src_fd, dst_fd):
+    fcntl.ioctl(dst_fd, FICLONE, src_fd)
+
+
+def _copy_file_range(src_fd, dst_fd, size, throttle=None):
+    offset = 0
+    while offset < size:
+        count = size - offset
+        if throttle is not None:
+            count = min(count, CHUNK_SIZE)
+            throttle(count)
+        copied = os.copy_file_range(src_fd, dst_fd, count, offset, offset)
+        if copied == 0:
+            break
+        offset += copied
+    return offset
+
+
+def _sendfile(src_fd, dst_fd, size, throttle):
+    offset = 0
+    while offset < size:
+        count = min(size - offset, CHUNK_SIZE)
+        throttle(count)
+        sent = os.sendfile(dst_fd, src_fd, offset, count)
+        if sent == 0:
+            break
+        offset += sent
+    return offset
+
+
+def _copy_chunks(src, dst, throttle):
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        while True:
+            throttle(CHUNK_SIZE)
+            chunk = fsrc.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            fdst.write(chunk)
+
+
+def _copy_data(src, dst, throttle=None, replace=True):
+    """Скопировать содержимое src в dst без чтения данных в Python, если возможно."""
+    if fcntl is not None:
+        with open(src, "rb") as fsrc, open(dst, "wb" if replace else "xb") as fdst:
+            try:
+                _reflink(fsrc.fileno(), fdst.fileno())
+                return
+            except OSError as e:
+                if e.errno not in _FALLBACK_ERRNOS:
+                    raise
+            size = os.fstat(fsrc.fileno()).st_size
+            if hasattr(os, "copy_file_range"):
+                try:
+                    if _copy_file_range(fsrc.fileno(), fdst.fileno(), size, throttle) >= size:
+                        return
+                except OSError as e:
+                    if e.errno not in _FALLBACK_ERRNOS:
+                        raise
+            if throttle is not None:
+                try:
+                    if _sendfile(fsrc.fileno(), fdst.fileno(), size, throttle) >= size:
+                        return
+                except OSError as e:
+                    if e.errno not in _FALLBACK_ERRNOS:
+                        raise
+    elif not replace:
+        open(dst, "xb").close()  # занять имя; дальше содержимое пишется в свой же файл
+    if throttle is not None:
+        _copy_chunks(src, dst, throttle)
+    else:
+        shutil.copyfile(src, dst)
+
+
+def copy_file(src, dst, mode="copy", throttle=None, replace=True):
+    """
+    Скопировать файл с метаданными; mode="hardlink" создаёт жёсткую ссылку,
+    если можно. replace=False -- FileExistsError, если dst уже есть.
+    """
+    if mode == "hardlink":
+        try:
+            os.link(src, dst)
+            return
+        except OSError as e:
+            if e.errno == errno.EEXIST:
+                if not replace:
+                    raise
+                os.remove(dst)
+                os.link(src, dst)
+                return
+            if e.errno not in _FALLBACK_ERRNOS and e.errno != errno.EMLINK:
+                raise
+    try:
+        _copy_data(src, dst, throttle, replace)
+        shutil.copystat(src, dst)
+    except FileExistsError:
+        raise  # файл назначения чужой, его не трогаем
+    except BaseException:
+        try:
+            os.remove(dst)
+        except OSError:
+            pass
+        raise
+
+
+def _rename_noreplace(src, dst):
+    if sys.platform == "win32":
+        os.rename(src, dst)  # FileExistsError, если dst есть
+        return
+    try:
+        os.link(src, dst, follow_symlinks=False)
+    except OSError as e:
+        if e.errno in (errno.EEXIST, errno.EXDEV) or e.errno not in _FALLBACK_ERRNOS and e.errno != errno.EMLINK:
+            raise
+        # Файловая система без жёстких ссылок: проверка и rename (узкое окно гонки)
+        if os.path.lexists(dst):
+            raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), dst)
+        os.rename(src, dst)
+        return
+    os.unlink(src)
+
+
+def move_file(src, dst, throttle=None, replace=True):
+    """
+    Переместить файл: rename на том же томе, иначе копирование и удаление.
+    replace=False -- FileExistsError, если dst уже есть.
+    """
+    try:
+        if replace:
+            os.replace(src, dst)
+        else:
+            _rename_noreplace(src, dst)
+        return
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+    copy_file(src, dst, throttle=throttle, replace=replace)
+    os.remove(src)
@@ -0,0 +1,256 @@
+"""
+Консольный запуск сортировщика без графического интерфейса.
+
+    python -m filesorter sort [папка]
+    python -m filesorter dry-run [папка]
+    python -m filesorter watch [папка]
+    python -m filesorter plan [папка] [-o plan.json|plan.csv]
+    python -m filesorter apply plan.json
+    python -m filesorter runs
+    python -m filesorter undo [запуск]
+    python -m filesorter recover resume|revert
+
+Не импортирует tkinter, PIL и pystray.
+"""
+import argparse
+import logging
+import sys
+import time
+
+import journal
+import planner
+import sortengine
+from exclusions import DEFAULT_PATTERNS
+from naming import COLLISION_POLICIES
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="filesorter", description="Умный сортировщик файлов (без GUI)")
+    parser.add_argument("--config", default=sortengine.CONFIG_FILE, help="путь к config.json")
+    parser.add_argument("--log-file", default=sortengine.LOG_FILE, help="путь к файлу лога")
+    parser.add_argument("--workers", type=int, help="число потоков для копирования/перемещения (1 -- последовательно)")
+    parser.add_argument("--index", metavar="PATH", help="файл индекса состояния для повторных запусков (SQLite)")
+    parser.add_argument("--hardlink", action="store_true", help="для действия 'Копировать' создавать жёсткие ссылки, где возможно")
+    parser.add_argument("--duplicates", choices=("off", "skip", "hardlink", "delete"), help="что делать с файлами, содержимое которых уже есть в целевой папке")
+    parser.add_argument("--collisions", choices=COLLISION_POLICIES, help="что делать, если имя в целевой папке занято")
+    parser.add_argument("--hash-cache", metavar="PATH", help="файл кэша хэшей для поиска дубликатов (SQLite)")
+    parser.add_argument("--sniff", action="store_true", help="определять тип файлов без подходящего расширения по содержимому")
+    parser.add_argument("--exclude", action="append", metavar="PATTERN", help="шаблон исключения в стиле .gitignore (можно повторять)")
+    parser.add_argument("--metrics-file", metavar="PATH", help="файл метрик в формате Prometheus")
+    parser.add_argument("--metrics-port", type=int, metavar="PORT", help="отдавать метрики по http://127.0.0.1:PORT/metrics")
+    parser.add_argument("--profile", choices=("cprofile", "sample"), help="сохранять профиль каждого запуска в папку profiles")
+    parser.add_argument("--bwlimit", type=float, metavar="MB", help="предел скорости копирования, МБ/с")
+    parser.add_argument("--iops", type=float, metavar="N", help="предел файловых операций в секунду")
+    parser.add_argument("--idle-io", action="store_true", help="работать с приоритетом ввода-вывода idle (как ionice -c3)")
+    parser.add_argument("--poll", action="store_true", help="для watch: опрашивать папки вместо событий файловой системы (сетевые диски)")
+    parser.add_argument("-r", "--recursive", action="store_true", help="обходить вложенные папки")
+    parser.add_argument("-v", "--verbose", action="store_true", help="выводить каждый обработанный файл")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name, help_text in (
+        ("sort", "отсортировать файлы в папке"),
+        ("dry-run", "показать, что будет сделано, без изменений"),
+        ("watch", "отсортировать папку и следить за новыми файлами"),
+    ):
+        cmd = sub.add_parser(name, help=help_text)
+        cmd.add_argument("source_dir", nargs="?", help="папка для сортировки (по умолчанию source_dir из конфигурации)")
+    cmd = sub.add_parser("plan", help="составить план сортировки, проверить конфликты имён и место на дисках")
+    cmd.add_argument("source_dir", nargs="?", help="папка для сортировки (по умолчанию source_dir из конфигурации)")
+    cmd.add_argument("-o", "--output", metavar="FILE", help="сохранить план в JSON или CSV (по расширению)")
+    cmd = sub.add_parser("apply", help="выполнить сохранённый план")
+    cmd.add_argument("plan_file", help="файл плана (JSON или CSV)")
+    sub.add_parser("runs", help="список запусков из журнала")
+    cmd = sub.add_parser("undo", help="отменить запуск сортировки по журналу")
+    cmd.add_argument("run_id", nargs="?", help="идентификатор запуска (по умолчанию последний)")
+    cmd = sub.add_parser("recover", help="обработать запуски, прерванные сбоем")
+    cmd.add_argument("mode", choices=("resume", "revert"), help="довыполнить или откатить незавершённые операции")
+    return parser
+
+
+def run_journal_command(args, engine):
+    journal_dir = engine.journal_dir
+    if args.command == "runs":
+        for run in journal.list_runs(journal_dir):
+            ops = sum(len(ops) for ops in run.batches.values())
+            state = ("идёт" if journal.writer_alive(run.path) else "прерван") if not run.ended else "отменён" if run.batches and len(run.undone) == len(run.batches) else "завершён"
+            print(f"{run.run_id}\t{run.header.get('kind', 'sort')}\t{ops}\t{state}\t{run.header.get('source_dir', '')}")
+        return 0
+    if args.command == "undo":
+        runs = [run for run in journal.list_runs(journal_dir) if run.batches]
+        if args.run_id:
+            runs = [run for run in runs if run.run_id == args.run_id]
+        if not runs:
+            print("Ошибка: запуск не найден в журнале.", file=sys.stderr)
+            return 1
+        print(f"Отменено операций: {journal.undo_run(runs[0], engine.workers)}")
+        return 0
+    count = 0
+    for run in journal.incomplete_runs(journal_dir):
+        count += journal.undo_run(run, engine.workers, interrupted_only=True) if args.mode == "revert" else journal.resume_run(run)
+    print(f"Обработано операций прерванных запусков: {count}")
+    return 0
+
+
+def run_plan_command(args, engine):
+    if args.command == "plan":
+        try:
+            plan = planner.build_plan(engine)
+        except FileNotFoundError as e:
+            print(f"Ошибка: {e}", file=sys.stderr)
+            return 1
+        if args.output:
+            plan.save(args.output)
+        if args.verbose:
+            for entry in plan.entries:
+                print(f"{entry.src} -> {entry.dst or entry.action}")
+        print(plan.summary())
+        return 0 if plan.ok else 1
+    try:
+        plan = planner.Plan.load(args.plan_file)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Ошибка чтения плана: {e}", file=sys.stderr)
+        return 1
+    msg = engine.summary(engine.run_plan(plan))
+    logging.info(msg)
+    print(msg)
+    return 0
+
+
+def run_watch(engine, engines, args=None, initial=None):
+    """
+    Наблюдение за папками. С args изменения файла конфигурации args.config
+    применяются на ходу (с теми же параметрами командной строки поверх).
+    initial() -- первичная сортировка уже лежащих файлов: она идёт после
+    запуска наблюдения, чтобы файлы, появившиеся за время обхода, не
+    остались без события.
+    """
+    from autosort import engine_sources, start_watching
+    from configwatch import watch_config
+
+    def on_file(source_engine, path):
+        action = source_engine.sort_file(path, auto=True)
+        if action:
+            print(f"{path}: {action}")
+
+    sources = engine_sources(engines, on_file)
+    if not sources:
+        print("Ошибка: нет папок для наблюдения", file=sys.stderr)
+        return
+    observer = start_watching(sources, engine.config, metrics=engine.metrics)
+    config_watcher = None
+    if args is not None:
+        config_watcher = watch_config(
+            args.config, lambda config: engine.reload_config(apply_args(config, args), engines), engine.config
+        )
+    for source in sources:
+        print(f"Наблюдение за '{source.source_dir}'.")
+    print("Ctrl+C для выхода.")
+    try:
+        if initial is not None:
+            initial()
+        while observer.is_alive():
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if config_watcher is not None:
+            config_watcher.stop()
+        observer.stop()
+        observer.join()
+        for source_engine in engines:
+            source_engine.close_auto_journal()
+
+
+def apply_args(config, args):
+    """Наложить параметры командной строки на конфигурацию."""
+    if getattr(args, "source_dir", None):
+        config["source_dir"] = args.source_dir
+    if args.workers:
+        config["workers"] = args.workers
+    if args.recursive:
+        config["recursive"] = True
+    if args.index:
+        config["state_index"] = args.index
+    if args.hardlink:
+        config["copy_mode"] = "hardlink"
+    if args.sniff:
+        config["sniff_content"] = True
+    if args.duplicates:
+        config["duplicates"] = args.duplicates
+    if args.collisions:
+        config["collisions"] = args.collisions
+    if args.hash_cache:
+        config["hash_cache"] = args.hash_cache
+    if args.exclude:
+        exclusions = dict(config.get("exclusions") or {})
+        exclusions["patterns"] = list(exclusions.get("patterns", DEFAULT_PATTERNS)) + args.exclude
+        config["exclusions"] = exclusions
+    if args.metrics_file or args.metrics_port:
+        config["metrics"] = dict(config.get("metrics") or {}, file=args.metrics_file, http_port=args.metrics_port)
+    if args.profile:
+        config["profile"] = args.profile
+    if args.bwlimit or args.iops or args.idle_io:
+        io = dict(config.get("io") or {})
+        if args.bwlimit:
+            io["bandwidth"] = int(args.bwlimit * 1024 * 1024)
+        if args.iops:
+            io["iops"] = args.iops
+        if args.idle_io:
+            io["idle"] = True
+        config["io"] = io
+    if args.poll:
+        config["watch_mode"] = "poll"
+    return config
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    config = sortengine.load_config(args.config)
+    sortengine.setup_logging(args.log_file, config)
+    apply_args(config, args)
+
+    def notify(title, message):
+        print(f"[{title}] {message}", file=sys.stderr)
+
+    engine = sortengine.SortEngine(config, test_run=args.command == "dry-run", notify=notify)
+    try:
+        return run_command(args, engine)
+    finally:
+        engine.close()
+
+
+def run_command(args, engine):
+    if args.command in ("runs", "undo", "recover"):
+        return run_journal_command(args, engine)
+    if args.command in ("plan", "apply"):
+        return run_plan_command(args, engine)
+
+    def progress(done, result):
+        if result.duplicate:
+            print(f"{result.task.src} == {result.dst} (уже есть)")
+        elif result.ok:
+            print(f"{result.task.src} -> {result.dst or result.task.action}")
+
+    engines = engine.source_engines() or [engine]
+
+    def sort_all():
+        status = 0
+        for source_engine in engines:
+            try:
+                stats = source_engine.sort_directory(progress=progress if args.verbose else None)
+            except FileNotFoundError as e:
+                logging.error(str(e))
+                print(f"Ошибка: {e}", file=sys.stderr)
+                status = 1
+                continue
+            msg = source_engine.summary(stats)
+            logging.info(msg)
+            print(msg)
+        return status
+    if args.command == "watch":
+        run_watch(engine, engines, args, sort_all)
+        return 0
+    return sort_all()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,88 +1,122 @@
-import json
+"""
+Графический интерфейс сортировщика.
+
+Для быстрого запуска тяжёлые необязательные части загружаются позже:
+значок в трее (pystray, PIL) -- в фоновом потоке после первой отрисовки
+окна, plyer -- при первом уведомлении, watchdog -- при включении
+авто-сортировки, окно лога -- при первом открытии.
+Время импорта проверяет сценарий startup в benchmark.py.
+"""
+import importlib
 import os
-import shutil
+import re
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
 import logging
+import queue
 import threading
-from PIL import Image, ImageDraw
-try:
-    from plyer import notification
-except ImportError:
-    notification = None
-try:
-    import pystray
-except ImportError:
-    pystray = None
-from watchdog.observers import Observer
-from watchdog.events import FileSystemEventHandler
 import time
 import platform
 import subprocess
+import bulkops
+import journal
+from configwatch import watch_config
+import planner
+from exclusions import DEFAULT_PATTERNS, ExclusionRules
+from notifier import Notifier
+import sortengine
+
+_optional_modules = {}
+
+
+def optional_import(name):
+    """Модуль name при первом обращении или None, если он не установлен."""
+    if name not in _optional_modules:
+        try:
+            _optional_modules[name] = importlib.import_module(name)
+        except ImportError:
+            _optional_modules[name] = None
+    return _optional_modules[name]
+
 
 class FileSorterApp:
     """
     Умный сортировщик файлов с поддержкой авто-сортировки, логирования, трея и расширяемых опций.
     """
-    ACTIONS = ["Переместить", "Копировать", "Переименовать", "Удалить"]
-    ACTION_MAP = {
-        "Переместить": "move",
-        "Копировать": "copy",
-        "Переименовать": "rename",
-        "Удалить": "delete"
-    }
+    ACTIONS = sortengine.ACTIONS
+    ACTION_MAP = sortengine.ACTION_MAP
     KNOWN_EXTENSIONS = {
         ".txt", ".pdf", ".doc", ".docx", ".xls", ".xlsx", ".ppt", ".pptx",
         ".jpg", ".jpeg", ".png", ".gif", ".bmp", ".tiff", ".mp3", ".wav",
         ".ogg", ".flac", ".mp4", ".avi", ".mkv", ".mov", ".zip", ".rar",
         ".7z", ".tar", ".gz", ".exe", ".msi", ".bat", ".py", ".js", ".html",
-        ".css", ".json", ".xml", ".csv", ".tsv", ".md", ".rtf", ".svg"
+        ".css", ".json", ".xml", ".csv", ".tsv", ".md", ".rtf", ".svg",
+        ".bz2", ".xz", ".tgz"
         # ...add more as needed
     }
+    NOTIFICATION_SUMMARIES = {
+        "Обработан файл": "Обработано файлов: {count}",
+        "Ошибка": "Ошибок: {count}, последняя: {message}",
+        "Ошибка авто-сортировки": "Ошибок авто-сортировки: {count}, последняя: {message}",
+    }
     def __init__(self, root):
         self.root = root
         self.root.title("Умный сортировщик файлов")
         self.root.geometry("500x500")
         self.root.resizable(True, True)
-        self.config_file = "config.json"
+        self.config_file = sortengine.CONFIG_FILE
         self.config = self.load_config()
         self.setup_logging()
+        self.notifier = Notifier(self._send_notification, summaries=self.NOTIFICATION_SUMMARIES)
+        self.engine = sortengine.SortEngine(self.config, notify=self.show_notification)
         self.tray_icon = None
-        self.setup_tray_icon()
         self.observer = None
+        self.watch_engines = []
         self.auto_sort_enabled = False
-        self.exclusion_patterns = [".*"]  # Пример: скрытые файлы
         self.test_run = False
+        self.ui_queue = queue.Queue()
+        self.cancel_event = None
+        self.sort_thread = None
+        self.interactive_thread = None
         self.setup_ui()
+        self._poll_ui_queue()
+        self.root.after(500, self.check_interrupted_runs)
+        # Изменения config.json извне (другим экземпляром, рассылкой) применяются на ходу
+        self.config_watcher = watch_config(
+            self.config_file, lambda config: self.call_in_ui(self.apply_external_config, config), self.config
+        )
+        # Трей запускается, когда окно уже нарисовано
+        self.root.after_idle(lambda: threading.Thread(target=self.setup_tray_icon, name="tray", daemon=True).start())
+
+    @property
+    def test_run(self):
+        return self.engine.test_run
+
+    @test_run.setter
+    def test_run(self, value):
+        self.engine.test_run = value
 
     def setup_logging(self):
-        logging.basicConfig(
-            filename='file_sorter.log',
-            level=logging.INFO,
-            format='%(asctime)s - %(levelname)s - %(message)s',
-            encoding='utf-8'
-        )
+        sortengine.setup_logging(config=self.config)
 
     def load_config(self):
-        try:
-            with open(self.config_file, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            default_config = {
-                "target_dirs": {
-                    "Images": {"exts": [".jpg", ".png", ".gif"], "action": "Переместить"},
-                    "Documents": {"exts": [".pdf", ".docx", ".txt"], "action": "Переместить"},
-                    "Music": {"exts": [".mp3", ".wav"], "action": "Переместить"}
-                },
-                "source_dir": ""
-            }
-            with open(self.config_file, "w", encoding="utf-8") as f:
-                json.dump(default_config, f, indent=4, ensure_ascii=False)
-            return default_config
+        return sortengine.load_config(self.config_file)
 
     def save_config(self):
-        with open(self.config_file, "w", encoding="utf-8") as f:
-            json.dump(self.config, f, indent=4)
+        sortengine.save_config(self.config, self.config_file)
+        if self.config_watcher is not None:
+            self.config_watcher.saved()
+
+    def apply_external_config(self, config):
+        """Применить перечитанный файл конфигурации к движкам, не прерывая сортировку и наблюдение."""
+        try:
+            self.engine.reload_config(config, self.watch_engines)
+        except Exception as e:
+            logging.error(f"Конфигурация из файла не применена: {str(e)}")
+            self.show_notification("Ошибка", f"Конфигурация из файла не применена: {str(e)}")
+            return
+        self.config = config
+        self.set_status("Конфигурация обновлена из файла")
 
     def setup_ui(self):
         style = ttk.Style()
@@ -92,11 +126,15 @@ class FileSorterApp:
         ttk.Button(main_frame, text="Настройки сортировки", command=self.open_settings).pack(pady=5, fill=tk.X)
         ttk.Button(main_frame, text="Выполнить сортировку", command=self.sort_files).pack(pady=5, fill=tk.X)
         ttk.Button(main_frame, text="Выбрать файлы для сортировки", command=self.select_files_for_sorting).pack(pady=5, fill=tk.X)
+        ttk.Button(main_frame, text="Выполнить сохранённый план", command=self.run_saved_plan).pack(pady=5, fill=tk.X)
         self.auto_sort_btn = ttk.Button(main_frame, text="Включить авто-сортировку", command=self.toggle_auto_sort)
         self.auto_sort_btn.pack(pady=5, fill=tk.X)
         ttk.Button(main_frame, text="Просмотреть лог", command=self.show_log_viewer).pack(pady=5, fill=tk.X)
+        ttk.Button(main_frame, text="Отменить сортировку", command=self.undo_sort_run).pack(pady=5, fill=tk.X)
         ttk.Button(main_frame, text="Вернуть файлы из подпапки", command=self.return_from_subfolder).pack(pady=5, fill=tk.X)
         ttk.Button(main_frame, text="Удалить подпапку", command=self.delete_subfolder).pack(pady=5, fill=tk.X)
+        self.cancel_btn = ttk.Button(main_frame, text="Прервать операцию", command=self.cancel_operation, state=tk.DISABLED)
+        self.cancel_btn.pack(pady=5, fill=tk.X)
         # Test run checkbox
         self.test_run_var = tk.BooleanVar(value=self.test_run)
         test_run_cb = ttk.Checkbutton(main_frame, text="Тестовый режим (без изменений)", variable=self.test_run_var, command=self.toggle_test_run)
@@ -107,8 +145,12 @@ class FileSorterApp:
         status_bar.pack(side=tk.BOTTOM, fill=tk.X)
 
     def setup_tray_icon(self):
+        """Создать значок в трее и обслуживать его; выполняется в фоновом потоке."""
+        pystray = optional_import("pystray")
         if pystray is None:
             return
+        from PIL import Image, ImageDraw
+
         def create_image():
             image = Image.new('RGB', (64, 64), color=(0, 128, 255))
             d = ImageDraw.Draw(image)
@@ -117,26 +159,44 @@ class FileSorterApp:
         image = create_image()
         menu = pystray.Menu(pystray.MenuItem('Выход', self.quit_app))
         self.tray_icon = pystray.Icon("filesorter", image, "FileSorterApp", menu)
-        threading.Thread(target=self.tray_icon.run, daemon=True).start()
+        self.tray_icon.run()
 
     def quit_app(self, icon, item):
         if self.tray_icon:
             self.tray_icon.stop()
-        self.root.quit()
+        self.root.quit()  # остальное -- в shutdown после выхода из mainloop
+
+    def shutdown(self):
+        """
+        Остановить наблюдение и фоновые службы перед выходом. Журналы
+        авто-сортировки закрываются записью "end", иначе при следующем
+        запуске они считались бы прерванными.
+        """
+        self._stop_watching()
+        self.notifier.stop()
+        if self.config_watcher is not None:
+            self.config_watcher.stop()
+        self.engine.close()
 
     def show_notification(self, title, message):
+        """Поставить уведомление в очередь; показывается сводкой в фоне."""
+        self.notifier.notify(title, message)
+
+    def _send_notification(self, title, message):
         try:
-            if notification:
-                notification.notify(title=title, message=message, app_name="FileSorterApp")
+            plyer = optional_import("plyer")
+            if plyer is not None:
+                plyer.notification.notify(title=title, message=message, app_name="FileSorterApp")
             elif self.tray_icon:
                 self.tray_icon.notify(message, title)
             elif platform.system() == "Darwin":
                 # macOS native notification
                 try:
+                    quote = lambda text: text.replace("\\", "\\\\").replace('"', '\\"')
                     subprocess.run([
                         "osascript", "-e",
-                        f'display notification "{message}" with title "{title}"'
-                    ], check=True)
+                        f'display notification "{quote(message)}" with title "{quote(title)}"'
+                    ], check=True, timeout=10)
                 except Exception as e:
                     logging.error(f"Ошибка показа уведомления через osascript: {e}")
                     print(f"[{title}] {message} (уведомление не поддерживается)")
@@ -148,39 +208,11 @@ class FileSorterApp:
 
     def perform_action(self, src, dst, action, file_name, folder, auto=False):
         """Выполнить действие над файлом и логировать результат."""
-        try:
-            if action == "Переместить":
-                if not self.test_run:
-                    shutil.move(src, dst)
-                logging.info(f"Файл '{file_name}' перемещён в '{folder}'{' (авто)' if auto else ''}")
-            elif action == "Копировать":
-                if not self.test_run:
-                    shutil.copy2(src, dst)
-                logging.info(f"Файл '{file_name}' скопирован в '{folder}'{' (авто)' if auto else ''}")
-            elif action == "Переименовать":
-                base, extn = os.path.splitext(file_name)
-                new_name = base + "_renamed" + extn
-                dst = os.path.join(os.path.dirname(dst), new_name)
-                if not self.test_run:
-                    shutil.move(src, dst)
-                logging.info(f"Файл '{file_name}' переименован и перемещён в '{folder}' как '{new_name}'{' (авто)' if auto else ''}")
-            elif action == "Удалить":
-                if not self.test_run:
-                    os.remove(src)
-                logging.info(f"Файл '{file_name}' удалён{' (авто)' if auto else ''}")
-            return True
-        except Exception as e:
-            logging.error(f"Ошибка при обработке файла '{file_name}': {str(e)}")
-            self.show_notification("Ошибка", f"{file_name}: {str(e)}")
-            return False
+        return self.engine.perform_action(src, dst, action, file_name, folder, auto=auto)
 
     def is_excluded(self, file_name):
         """Проверить, исключён ли файл по паттернам."""
-        for pattern in self.exclusion_patterns:
-            if pattern == ".*" and file_name.startswith('.'):
-                return True
-            # Можно добавить другие паттерны
-        return False
+        return self.engine.is_excluded(file_name)
 
     def sort_files(self):
         """Сортировка всех файлов в исходной папке согласно настройкам."""
@@ -190,45 +222,125 @@ class FileSorterApp:
             logging.error("Папка для сортировки не указана или не существует!")
             self.show_notification("Ошибка", "Папка для сортировки не указана или не существует!")
             return
+        if self.test_run:
+            self.plan_files(source_dir)
+            return
+        self.run_sort_in_background(lambda progress: self.engine.sort_directory(source_dir, progress))
+
+    def plan_files(self, source_dir):
+        """Тестовый режим: составить план без изменений на диске и предложить сохранить его."""
+        result = {}
+        last_update = [0.0]
+
+        def progress(done):
+            now = time.monotonic()
+            if now - last_update[0] >= 0.2:
+                last_update[0] = now
+                self.call_in_ui(self.set_status, f"Запланировано файлов: {done}")
+
+        def work():
+            result["plan"] = plan = planner.build_plan(self.engine, source_dir, progress)
+            return plan.summary()
+
+        def done(msg):
+            if messagebox.askyesno("План сортировки", msg + "\n\nСохранить план в файл?"):
+                path = filedialog.asksaveasfilename(
+                    title="Сохранить план", defaultextension=".json",
+                    filetypes=[("JSON", "*.json"), ("CSV", "*.csv")]
+                )
+                if path:
+                    result["plan"].save(path)
+        self.run_in_background(work, "Планирование...", on_done=done)
+
+    def run_saved_plan(self):
+        """Выполнить план, сохранённый в тестовом режиме."""
+        path = filedialog.askopenfilename(title="Выберите план", filetypes=[("План", "*.json *.csv")])
+        if not path:
+            return
         try:
-            affected_files = 0
-            ext_to_info = {}
-            for folder, info in self.config["target_dirs"].items():
-                exts = info["exts"] if isinstance(info, dict) else info
-                action = info["action"] if isinstance(info, dict) else "Переместить"
-                for ext in exts:
-                    ext = ext.strip().lower()
-                    if not ext.startswith("."):
-                        ext = "." + ext
-                    ext_to_info[ext] = (folder, action)
-            with os.scandir(source_dir) as entries:
-                for entry in entries:
-                    if entry.is_file():
-                        file_name = entry.name
-                        if self.is_excluded(file_name):
-                            continue
-                        ext = os.path.splitext(file_name)[1].lower()
-                        info = ext_to_info.get(ext)
-                        if info:
-                            folder, action = info
-                            src = entry.path
-                            if action != "Удалить":
-                                target_dir = os.path.join(source_dir, folder)
-                                os.makedirs(target_dir, exist_ok=True)
-                                dst = os.path.join(target_dir, file_name)
-                            else:
-                                target_dir = None
-                                dst = None
-                            if self.perform_action(src, dst, action, file_name, folder):
-                                affected_files += 1
-            msg = f"(Тест) Обработано {affected_files} файлов!" if self.test_run else f"Обработано {affected_files} файлов!"
-            messagebox.showinfo("Готово", msg)
+            plan = planner.Plan.load(path)
+        except (OSError, ValueError, KeyError) as e:
+            messagebox.showerror("Ошибка", f"Не удалось прочитать план: {str(e)}")
+            return
+        if plan.collisions and not messagebox.askyesno(
+                "План сортировки", plan.summary() + "\n\nФайлы с конфликтами будут пропущены. Продолжить?"):
+            return
+        self.run_sort_in_background(lambda progress: self.engine.run_plan(plan, progress))
+
+    def call_in_ui(self, func, *args):
+        """Выполнить func(*args) в потоке Tk (безопасно вызывать из любого потока)."""
+        self.ui_queue.put((func, args))
+
+    def _poll_ui_queue(self):
+        try:
+            while True:
+                try:
+                    func, args = self.ui_queue.get_nowait()
+                except queue.Empty:
+                    break
+                try:
+                    func(*args)
+                except Exception as e:
+                    # Ошибка одного обработчика не должна останавливать опрос очереди
+                    logging.error(f"Ошибка обработчика интерфейса {getattr(func, '__qualname__', func)}: {str(e)}", exc_info=True)
+        finally:
+            self.root.after(100, self._poll_ui_queue)
+
+    def run_in_background(self, work, status="Сортировка...", on_done=None, interactive=False):
+        """
+        Выполнить work() в фоновом потоке, чтобы окно не зависало; work
+        возвращает итоговое сообщение. on_done(msg), если задан, вызывается
+        в потоке Tk вместо окна "Готово". Возвращает False, если предыдущая
+        операция ещё не завершена. Интерактивная операция (interactive=True)
+        может идти одновременно с фоновой и приостанавливает её (см. iolimit).
+        """
+        running = self.interactive_thread if interactive else self.sort_thread
+        if running and running.is_alive():
+            self.set_status("Сортировка уже выполняется...")
+            return False
+
+        def worker():
+            try:
+                msg = work()
+                self.call_in_ui(self.set_status, msg.split("\n", 1)[0])
+                if on_done:
+                    self.call_in_ui(on_done, msg)
+                else:
+                    self.call_in_ui(messagebox.showinfo, "Готово", msg)
+                self.show_notification("Готово", msg)
+            except Exception as e:
+                logging.error(f"Произошла ошибка: {str(e)}")
+                self.call_in_ui(self.set_status, "Ошибка.")
+                self.call_in_ui(messagebox.showerror, "Ошибка", f"Произошла ошибка: {str(e)}")
+                self.show_notification("Ошибка", f"Произошла ошибка: {str(e)}")
+
+        self.set_status(status)
+        thread = threading.Thread(target=worker, daemon=True)
+        if interactive:
+            self.interactive_thread = thread
+        else:
+            self.sort_thread = thread
+        thread.start()
+        return True
+
+    def run_sort_in_background(self, run, interactive=False):
+        """
+        Запустить run(progress) в фоновом потоке.
+        Прогресс выводится в строку состояния не чаще раза в 0.2 с.
+        """
+        last_update = [0.0]
+
+        def progress(done, result):
+            now = time.monotonic()
+            if now - last_update[0] >= 0.2:
+                last_update[0] = now
+                self.call_in_ui(self.set_status, f"Обработано файлов: {done} ({result.task.file_name})")
+
+        def work():
+            msg = self.engine.summary(run(progress))
             logging.info(msg)
-            self.show_notification("Готово", msg)
-        except Exception as e:
-            messagebox.showerror("Ошибка", f"Произошла ошибка: {str(e)}")
-            logging.error(f"Произошла ошибка: {str(e)}")
-            self.show_notification("Ошибка", f"Произошла ошибка: {str(e)}")
+            return msg
+        return self.run_in_background(work, interactive=interactive)
 
     def open_settings(self):
         self.settings_window = tk.Toplevel(self.root)
@@ -244,6 +356,14 @@ class FileSorterApp:
         source_entry = ttk.Entry(source_panel, textvariable=self.source_var, width=50)
         source_entry.pack(side=tk.LEFT, fill=tk.X, expand=True)
         ttk.Button(source_panel, text="Обзор", command=self.browse_source).pack(side=tk.RIGHT, padx=5)
+        self.recursive_var = tk.BooleanVar(value=self.config.get("recursive", False))
+        ttk.Checkbutton(self.settings_window, text="Включая вложенные папки", variable=self.recursive_var).pack(anchor=tk.W, padx=10)
+        exclusions_panel = ttk.Frame(self.settings_window)
+        exclusions_panel.pack(pady=(5, 0), fill=tk.X, padx=10)
+        ttk.Label(exclusions_panel, text="Исключения (шаблоны .gitignore через запятую):").pack(anchor=tk.W)
+        patterns = (self.config.get("exclusions") or {}).get("patterns", DEFAULT_PATTERNS)
+        self.exclusions_var = tk.StringVar(value=", ".join(patterns))
+        ttk.Entry(exclusions_panel, textvariable=self.exclusions_var).pack(fill=tk.X)
 
         # Formats panel
         formats_panel = ttk.Frame(self.settings_window)
@@ -258,8 +378,8 @@ class FileSorterApp:
         self.tree.column("action", width=150)
         self.tree.pack(fill=tk.BOTH, expand=True)
         for folder, info in self.config["target_dirs"].items():
-            exts = info["exts"] if isinstance(info, dict) else info
-            action = info["action"] if isinstance(info, dict) else "Переместить"
+            exts = info.get("exts", []) if isinstance(info, dict) else info
+            action = info.get("action", "Переместить") if isinstance(info, dict) else "Переместить"
             self.tree.insert("", tk.END, values=(folder, ", ".join(exts), action))
         self.tree.bind("<Double-1>", self.edit_format)
 
@@ -353,14 +473,14 @@ class FileSorterApp:
                 continue
             if not ext.startswith("."):
                 ext = "." + ext
-            if not all(c.isalnum() or c == '_' for c in ext[1:]) or not ext[0] == '.':
+            if not self._extension_syntax_ok(ext):
                 messagebox.showerror(
                     "Ошибка",
-                    f"Некорректное расширение файла: {ext}. Расширения должны начинаться с точки и содержать только буквы, цифры или подчёркивания."
+                    f"Некорректное расширение файла: {ext}. Расширения должны начинаться с точки и содержать только буквы, цифры, подчёркивания или точки между частями (.tar.gz)."
                 )
                 logging.error(f"Некорректное расширение файла: {ext}")
                 return False
-            if ext not in self.KNOWN_EXTENSIONS:
+            if not self._is_known_extension(ext):
                 messagebox.showerror(
                     "Ошибка",
                     f"Расширение {ext} не является стандартным. Проверьте правильность написания."
@@ -369,6 +489,18 @@ class FileSorterApp:
                 return False
         return True
 
+    @staticmethod
+    def _extension_syntax_ok(ext):
+        parts = ext[1:].split(".")
+        return ext[0] == '.' and all(part and all(c.isalnum() or c == '_' for c in part) for part in parts)
+
+    def _is_known_extension(self, ext):
+        """Составное расширение (.tar.gz) допустимо, если известна каждая его часть."""
+        if ext in self.KNOWN_EXTENSIONS:
+            return True
+        parts = ext[1:].split(".")
+        return len(parts) > 1 and all("." + part in self.KNOWN_EXTENSIONS for part in parts)
+
     def remove_format(self):
         selected = self.tree.selection()
         if selected:
@@ -376,8 +508,8 @@ class FileSorterApp:
 
     def save_settings(self, window):
         try:
-            self.config["source_dir"] = self.source_var.get()
-            self.config["target_dirs"] = {}
+            old_target_dirs = self.config.get("target_dirs", {})
+            target_dirs = {}
             for child in self.tree.get_children():
                 folder, exts, action = self.tree.item(child)['values']
                 ext_list = []
@@ -387,14 +519,14 @@ class FileSorterApp:
                         continue
                     if not ext.startswith("."):
                         ext = "." + ext
-                    if not all(c.isalnum() or c == '_' for c in ext[1:]) or not ext[0] == '.':
+                    if not self._extension_syntax_ok(ext):
                         messagebox.showerror(
                             "Ошибка",
-                            f"Некорректное расширение файла: {ext}. Расширения должны начинаться с точки и содержать только буквы, цифры или подчёркивания."
+                            f"Некорректное расширение файла: {ext}. Расширения должны начинаться с точки и содержать только буквы, цифры, подчёркивания или точки между частями (.tar.gz)."
                         )
                         logging.error(f"Некорректное расширение файла: {ext}")
                         return
-                    if ext not in self.KNOWN_EXTENSIONS:
+                    if not self._is_known_extension(ext):
                         messagebox.showerror(
                             "Ошибка",
                             f"Расширение {ext} не является стандартным. Проверьте правильность написания."
@@ -402,7 +534,24 @@ class FileSorterApp:
                         logging.error(f"Неизвестное расширение файла: {ext}")
                         return
                     ext_list.append(ext)
-                self.config["target_dirs"][folder] = {"exts": ext_list, "action": action}
+                # Сохраняем дополнительные ключи правила (например, "patterns"), которых нет в таблице
+                old_info = old_target_dirs.get(folder)
+                info = dict(old_info) if isinstance(old_info, dict) else {}
+                info.update({"exts": ext_list, "action": action})
+                target_dirs[folder] = info
+            exclusions = dict(self.config.get("exclusions") or {})
+            exclusions["patterns"] = [p.strip() for p in self.exclusions_var.get().split(",") if p.strip()]
+            try:
+                ExclusionRules(exclusions)
+            except re.error as e:
+                messagebox.showerror("Ошибка", f"Некорректный шаблон исключения: {str(e)}")
+                return
+            # Новый словарь, а не правка self.config: движок держит тот же объект,
+            # а при ошибке в правилах прежняя конфигурация должна уцелеть
+            config = dict(self.config, source_dir=self.source_var.get(), recursive=self.recursive_var.get(),
+                          exclusions=exclusions, target_dirs=target_dirs)
+            self.engine.reload_config(config, self.watch_engines)
+            self.config = config
             self.save_config()
             messagebox.showinfo("Сохранено", "Настройки успешно сохранены!")
             logging.info("Настройки успешно сохранены!")
@@ -418,71 +567,47 @@ class FileSorterApp:
             self.stop_auto_sort()
 
     def start_auto_sort(self):
-        source_dir = self.config.get("source_dir", "")
-        if not source_dir or not os.path.exists(source_dir):
-            messagebox.showerror("Ошибка", "Папка для сортировки не указана или не существует!")
-            return
+        """Наблюдение за source_dir и папками из "sources" конфигурации."""
         if self.observer:
             self.stop_auto_sort()
-        event_handler = self.AutoSortHandler(self)
-        self.observer = Observer()
-        self.observer.schedule(event_handler, source_dir, recursive=False)
-        self.observer.start()
+        engines = self.engine.source_engines()
+        from autosort import engine_sources, start_watching
+        sources = engine_sources(engines, lambda engine, path: self.sort_single_file(path, engine))
+        if not sources:
+            messagebox.showerror("Ошибка", "Папка для сортировки не указана или не существует!")
+            return
+        watched = {source.source_dir for source in sources}
+        self.watch_engines = [engine for engine in engines if engine.source_dir in watched]
+        self.observer = start_watching(sources, self.config, metrics=self.engine.metrics)
         self.auto_sort_enabled = True
         self.auto_sort_btn.config(text="Отключить авто-сортировку")
         self.show_notification("Авто-сортировка", "Автоматическая сортировка включена.")
         # Process existing files immediately
-        self.sort_files()
+        engines = list(self.watch_engines)
+        self.run_sort_in_background(
+            lambda progress: sortengine.total_stats(engine.sort_directory(None, progress) for engine in engines))
 
-    def stop_auto_sort(self):
+    def _stop_watching(self):
         if self.observer:
             self.observer.stop()
             self.observer.join()
             self.observer = None
+        for engine in self.watch_engines or [self.engine]:
+            engine.close_auto_journal()
+        self.watch_engines = []
+
+    def stop_auto_sort(self):
+        self._stop_watching()
         self.auto_sort_enabled = False
         self.auto_sort_btn.config(text="Включить авто-сортировку")
         self.show_notification("Авто-сортировка", "Автоматическая сортировка отключена.")
 
-    class AutoSortHandler(FileSystemEventHandler):
-        def __init__(self, app):
-            self.app = app
-        def on_created(self, event):
-            if not event.is_directory:
-                # Wait a bit for file to be fully written
-                time.sleep(0.5)
-                self.app.sort_single_file(event.src_path)
-
-    def sort_single_file(self, file_path):
-        """Сортировка одного файла (для авто-сортировки)."""
+    def sort_single_file(self, file_path, engine=None):
+        """Сортировка одного файла (для авто-сортировки); engine -- движок его папки."""
         try:
-            source_dir = self.config.get("source_dir", "")
-            if not file_path.startswith(source_dir):
-                return
-            file_name = os.path.basename(file_path)
-            if self.is_excluded(file_name):
-                return
-            ext_to_info = {}
-            for folder, info in self.config["target_dirs"].items():
-                exts = info["exts"] if isinstance(info, dict) else info
-                action = info["action"] if isinstance(info, dict) else "Переместить"
-                for ext in exts:
-                    ext = ext.strip().lower()
-                    if not ext.startswith("."):
-                        ext = "." + ext
-                    ext_to_info[ext] = (folder, action)
-            ext = os.path.splitext(file_name)[1].lower()
-            info = ext_to_info.get(ext)
-            if info:
-                folder, action = info
-                if action != "Удалить":
-                    target_dir = os.path.join(source_dir, folder)
-                    os.makedirs(target_dir, exist_ok=True)
-                    dst = os.path.join(target_dir, file_name)
-                else:
-                    target_dir = None
-                    dst = None
-                self.perform_action(file_path, dst, action, file_name, folder, auto=True)
-                self.show_notification("Авто-сортировка", f"Файл '{file_name}' обработан: {action}")
+            action = (engine or self.engine).sort_file(file_path, auto=True)
+            if action:
+                self.show_notification("Обработан файл", f"Файл '{os.path.basename(file_path)}' обработан: {action}")
         except Exception as e:
             logging.error(f"Ошибка авто-сортировки файла '{file_path}': {str(e)}")
             self.show_notification("Ошибка авто-сортировки", f"{os.path.basename(file_path)}: {str(e)}")
@@ -496,65 +621,118 @@ class FileSorterApp:
         self.set_status("Тестовый режим включён." if self.test_run else "Тестовый режим выключен.")
 
     def show_log_viewer(self):
-        log_win = tk.Toplevel(self.root)
-        log_win.title("Просмотр лога")
-        log_win.geometry("700x400")
-        text = tk.Text(log_win, wrap=tk.NONE, font=("Consolas", 10))
-        text.pack(expand=True, fill=tk.BOTH)
-        try:
-            with open('file_sorter.log', 'r', encoding='utf-8') as f:
-                lines = f.readlines()[-100:]
-                text.insert(tk.END, ''.join(lines))
-        except Exception as e:
-            text.insert(tk.END, f"Ошибка чтения лога: {e}")
-        text.config(state=tk.DISABLED)
-        ttk.Button(log_win, text="Закрыть", command=log_win.destroy).pack(pady=5)
+        from logviewer import LogViewer
+        LogViewer(self.root, sortengine.LOG_FILE)
 
     def select_files_for_sorting(self):
         files = filedialog.askopenfilenames(title="Выберите файлы для сортировки")
         if files:
-            self.set_status(f"Сортировка {len(files)} выбранных файлов...")
             self.sort_selected_files(files)
-            self.set_status("Готово.")
 
     def sort_selected_files(self, files):
-        try:
-            affected_files = 0
-            ext_to_info = {}
-            for folder, info in self.config["target_dirs"].items():
-                exts = info["exts"] if isinstance(info, dict) else info
-                action = info["action"] if isinstance(info, dict) else "Переместить"
-                for ext in exts:
-                    ext = ext.strip().lower()
-                    if not ext.startswith("."):
-                        ext = "." + ext
-                    ext_to_info[ext] = (folder, action)
-            for file_path in files:
-                file_name = os.path.basename(file_path)
-                if self.is_excluded(file_name):
-                    continue
-                ext = os.path.splitext(file_name)[1].lower()
-                info = ext_to_info.get(ext)
-                if info:
-                    folder, action = info
-                    source_dir = self.config.get("source_dir", "")
-                    if action != "Удалить":
-                        target_dir = os.path.join(source_dir, folder)
-                        os.makedirs(target_dir, exist_ok=True)
-                        dst = os.path.join(target_dir, file_name)
-                    else:
-                        target_dir = None
-                        dst = None
-                    if self.perform_action(file_path, dst, action, file_name, folder):
-                        affected_files += 1
-            msg = f"(Тест) Обработано {affected_files} файлов!" if self.test_run else f"Обработано {affected_files} файлов!"
-            messagebox.showinfo("Готово", msg)
-            logging.info(msg)
-            self.show_notification("Готово", msg)
-        except Exception as e:
-            messagebox.showerror("Ошибка", f"Произошла ошибка: {str(e)}")
-            logging.error(f"Произошла ошибка: {str(e)}")
-            self.show_notification("Ошибка", f"Произошла ошибка: {str(e)}")
+        # Выбранные файлы сортируются сразу, фоновая сортировка и авто-сортировка ждут
+        if self.run_sort_in_background(lambda progress: self.engine.sort_paths(files, progress), interactive=True):
+            self.set_status(f"Сортировка {len(files)} выбранных файлов...")
+
+    def check_interrupted_runs(self):
+        """Предложить откатить или довыполнить сортировки, прерванные сбоем."""
+        if not self.engine.journal_dir:
+            return
+        runs = journal.incomplete_runs(self.engine.journal_dir)
+        if not runs:
+            return
+        answer = messagebox.askyesnocancel(
+            "Прерванная сортировка",
+            f"Найдено прерванных сортировок: {len(runs)}.\n\n"
+            "Да -- откатить незавершённые операции, Нет -- довыполнить их, Отмена -- решить позже."
+        )
+        if answer is None:
+            return
+
+        def work():
+            if answer:
+                count = sum(journal.undo_run(run, self.engine.workers, interrupted_only=True) for run in runs)
+                return f"Откат прерванных сортировок: возвращено {count} файлов."
+            count = sum(journal.resume_run(run) for run in runs)
+            return f"Прерванные сортировки довыполнены: {count} файлов."
+        self.run_in_background(work, "Восстановление после сбоя...")
+
+    def undo_sort_run(self):
+        """Выбрать завершённый запуск из журнала и отменить его операции."""
+        runs = [run for run in journal.list_runs(self.engine.journal_dir) if run.ended and run.batches]
+        if not runs:
+            messagebox.showinfo("Нет запусков", "В журнале нет сортировок, которые можно отменить.")
+            return
+        labels = []
+        for run in runs:
+            ops = sum(len(ops) for ops in run.batches.values())
+            undone = " (отменён)" if len(run.undone) == len(run.batches) else ""
+            labels.append(f"{run.run_id} -- {run.header.get('kind', 'sort')}, операций: {ops}{undone}")
+        pick_win = tk.Toplevel(self.root)
+        pick_win.title("Отменить сортировку")
+        pick_win.geometry("450x200")
+        tk.Label(pick_win, text="Выберите запуск:").pack(pady=10)
+        run_var = tk.StringVar(value=labels[0])
+        combo = ttk.Combobox(pick_win, values=labels, textvariable=run_var, state="readonly", width=60)
+        combo.pack(pady=10, padx=10)
+
+        def do_undo():
+            run = runs[labels.index(run_var.get())]
+            pick_win.destroy()
+            last_update = [0.0]
+
+            def progress(done, total):
+                now = time.monotonic()
+                if now - last_update[0] >= 0.2:
+                    last_update[0] = now
+                    self.call_in_ui(self.set_status, f"Отмена: пакетов {done} из {total}")
+
+            def work():
+                count = journal.undo_run(run, self.engine.workers, progress)
+                return f"Отменено операций: {count} (запуск {run.run_id})."
+            self.run_in_background(work, "Отмена сортировки...")
+        ttk.Button(pick_win, text="Отменить", command=do_undo).pack(pady=10)
+        ttk.Button(pick_win, text="Закрыть", command=pick_win.destroy).pack()
+
+    def run_bulk_job(self, job, status, describe):
+        """
+        Запустить job(progress, cancel) из bulkops в фоне с кнопкой
+        "Прервать операцию". describe(result) даёт итоговое сообщение;
+        прерванную операцию можно продолжить -- она запускается снова.
+        """
+        cancel = threading.Event()
+        outcome = {}
+        last_update = [0.0]
+
+        def progress(done, total):
+            now = time.monotonic()
+            if now - last_update[0] >= 0.2:
+                last_update[0] = now
+                self.call_in_ui(self.set_status, f"{status}: {done} из {total}")
+
+        def work():
+            try:
+                outcome["result"] = result = job(progress, cancel)
+            finally:
+                self.call_in_ui(self.cancel_btn.config, {"state": tk.DISABLED})
+            if result.cancelled:
+                return f"{status} прервано: обработано {result.done} из {result.total}."
+            return describe(result)
+
+        def done(msg):
+            result = outcome["result"]
+            if not result.cancelled:
+                messagebox.showinfo("Готово", msg)
+            elif messagebox.askyesno("Операция прервана", msg + "\n\nПродолжить?"):
+                self.run_bulk_job(job, status, describe)
+        if self.run_in_background(work, f"{status}...", on_done=done):
+            self.cancel_event = cancel
+            self.cancel_btn.config(state=tk.NORMAL)
+
+    def cancel_operation(self):
+        if self.cancel_event is not None and not self.cancel_event.is_set():
+            self.cancel_event.set()
+            self.set_status("Прерывание после текущих пакетов...")
 
     def return_from_subfolder(self):
         source_dir = self.config.get("source_dir", "")
@@ -577,35 +755,16 @@ class FileSorterApp:
         def do_return():
             subfolder = subfolder_var.get()
             subfolder_path = os.path.join(source_dir, subfolder)
-            files = [f for f in os.listdir(subfolder_path) if os.path.isfile(os.path.join(subfolder_path, f))]
-            if not files:
-                messagebox.showinfo("Пусто", "В выбранной подпапке нет файлов.")
-                pick_win.destroy()
-                return
-            moved = 0
-            for f in files:
-                src = os.path.join(subfolder_path, f)
-                dst = os.path.join(source_dir, f)
-                try:
-                    if not self.test_run:
-                        shutil.move(src, dst)
-                    moved += 1
-                    logging.info(f"Файл '{f}' возвращён из '{subfolder}' в исходную папку.")
-                except Exception as e:
-                    logging.error(f"Ошибка возврата файла '{f}': {str(e)}")
-            # Delete subfolder if empty
-            if not os.listdir(subfolder_path):
-                try:
-                    if not self.test_run:
-                        os.rmdir(subfolder_path)
-                    logging.info(f"Папка '{subfolder}' удалена после возврата файлов.")
-                except Exception as e:
-                    logging.error(f"Ошибка удаления папки '{subfolder}': {str(e)}")
-            msg = f"Возвращено {moved} файлов из '{subfolder}'."
-            messagebox.showinfo("Готово", msg)
-            self.show_notification("Готово", msg)
-            self.set_status(msg)
             pick_win.destroy()
+
+            def describe(result):
+                if not result.total:
+                    return f"В подпапке '{subfolder}' нет файлов."
+                return f"Возвращено {result.done} файлов из '{subfolder}'."
+            self.run_bulk_job(
+                lambda progress, cancel: bulkops.return_files(self.engine, subfolder_path, source_dir, progress, cancel),
+                "Возврат файлов", describe
+            )
         ttk.Button(pick_win, text="Вернуть файлы", command=do_return).pack(pady=10)
         ttk.Button(pick_win, text="Отмена", command=pick_win.destroy).pack()
 
@@ -634,19 +793,22 @@ class FileSorterApp:
                 messagebox.showerror("Ошибка", "Папка не найдена.")
                 pick_win.destroy()
                 return
-            if messagebox.askyesno("Подтверждение", f"Удалить подпапку '{subfolder}' и все её содержимое?"):
-                try:
-                    if not self.test_run:
-                        shutil.rmtree(subfolder_path)
-                    logging.info(f"Папка '{subfolder}' и все её содержимое удалены.")
-                    msg = f"Папка '{subfolder}' удалена."
-                    messagebox.showinfo("Готово", msg)
-                    self.show_notification("Готово", msg)
-                    self.set_status(msg)
-                except Exception as e:
-                    logging.error(f"Ошибка удаления папки '{subfolder}': {str(e)}")
-                    messagebox.showerror("Ошибка", f"Ошибка удаления: {str(e)}")
+            if not messagebox.askyesno("Подтверждение", f"Удалить подпапку '{subfolder}' и все её содержимое?"):
+                pick_win.destroy()
+                return
             pick_win.destroy()
+
+            def describe(result):
+                if result.failed:
+                    return f"Папка '{subfolder}' удалена не полностью: ошибок {result.failed}, подробности в логе."
+                if not result.cancelled:
+                    logging.info(f"Папка '{subfolder}' и все её содержимое удалены.")
+                return f"Папка '{subfolder}' удалена."
+            self.run_bulk_job(
+                lambda progress, cancel: bulkops.delete_tree(subfolder_path, self.engine.workers, progress, cancel,
+                                                             self.test_run, self.engine.io),
+                "Удаление", describe
+            )
         ttk.Button(pick_win, text="Удалить подпапку", command=do_delete).pack(pady=10)
         ttk.Button(pick_win, text="Отмена", command=pick_win.destroy).pack()
 
@@ -654,7 +816,10 @@ if __name__ == "__main__":
     try:
         root = tk.Tk()
         app = FileSorterApp(root)
-        root.mainloop()
+        try:
+            root.mainloop()
+        finally:
+            app.shutdown()
     except Exception as e:
         import traceback
         try:
@@ -0,0 +1,209 @@
+"""
+Ограничение дискового ввода-вывода и приоритеты заданий.
+
+Раздел "io" конфигурации:
+    "bandwidth" -- предел скорости копирования в байтах в секунду;
+    "iops"      -- предел файловых операций (перемещение, копирование,
+                   удаление) в секунду;
+    "burst"     -- сколько секунд запаса накапливает ведро токенов, по
+                   умолчанию 1;
+    "idle"      -- выполнять фоновые задания с приоритетом ввода-вывода
+                   idle (как ionice -c3 в Linux, фоновый режим потока в
+                   Windows): диск получают, только когда он никому не нужен.
+Пределы действуют на фоновые задания (сортировка папки, авто-сортировка,
+массовые операции). Интерактивное задание (сортировка выбранных файлов)
+не ограничивается и вытесняет фоновые: пока оно идёт, фоновые потоки
+ждут перед следующим файлом или следующим блоком копирования.
+"""
+import contextlib
+import logging
+import sys
+import threading
+import time
+
+import metrics as sortmetrics
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+BURST_SECONDS = 1.0
+
+# Номера системных вызовов ioprio_get/ioprio_set по архитектурам
+_IOPRIO_SYSCALLS = {
+    "x86_64": (252, 251), "amd64": (252, 251), "i386": (290, 289), "i686": (290, 289),
+    "aarch64": (31, 30), "arm64": (31, 30), "armv7l": (315, 314), "ppc64le": (274, 273), "s390x": (283, 282),
+}
+_IOPRIO_WHO_PROCESS = 1
+_IOPRIO_IDLE = 3 << 13  # IOPRIO_CLASS_IDLE << IOPRIO_CLASS_SHIFT
+_THREAD_MODE_BACKGROUND_BEGIN = 0x00010000
+_THREAD_MODE_BACKGROUND_END = 0x00020000
+_idle_api = None
+
+
+def _load_idle_api():
+    """
+    Функция, переводящая текущий поток в idle-приоритет ввода-вывода и
+    возвращающая функцию отмены (или None при отказе); None, если ОС это не
+    поддерживает.
+    """
+    global _idle_api
+    if _idle_api is not None:
+        return _idle_api or None
+    _idle_api = False
+    try:
+        import ctypes
+        if sys.platform.startswith("linux"):
+            import platform
+            numbers = _IOPRIO_SYSCALLS.get(platform.machine().lower())
+            if numbers is None:
+                raise OSError(f"неизвестная архитектура {platform.machine()}")
+            get_nr, set_nr = numbers
+            libc = ctypes.CDLL(None, use_errno=True)
+
+            def enter():
+                tid = threading.get_native_id()
+                previous = libc.syscall(get_nr, _IOPRIO_WHO_PROCESS, tid)
+                if previous < 0 or libc.syscall(set_nr, _IOPRIO_WHO_PROCESS, tid, _IOPRIO_IDLE) != 0:
+                    return None
+                return lambda: libc.syscall(set_nr, _IOPRIO_WHO_PROCESS, tid, previous)
+        elif sys.platform == "win32":
+            kernel32 = ctypes.windll.kernel32
+
+            def enter():
+                thread = kernel32.GetCurrentThread()
+                if not kernel32.SetThreadPriority(thread, _THREAD_MODE_BACKGROUND_BEGIN):
+                    return None
+                return lambda: kernel32.SetThreadPriority(thread, _THREAD_MODE_BACKGROUND_END)
+        else:
+            raise OSError(f"не поддерживается в {sys.platform}")
+        _idle_api = enter
+    except Exception as e:
+        logging.warning(f"Приоритет ввода-вывода idle недоступен: {str(e)}")
+    return _idle_api or None
+
+
+class TokenBucket:
+    """
+    Ведро токенов: rate единиц в секунду, запас до burst. Списание идёт в
+    долг, так что порция больше запаса не блокирует навсегда, а просто
+    отодвигает следующие. Потокобезопасно.
+    """
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst) if burst else self.rate * BURST_SECONDS
+        self._tokens = self.capacity
+        self._stamp = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount):
+        """Списать amount; вернуть, сколько секунд нужно подождать перед использованием."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._stamp) * self.rate)
+            self._stamp = now
+            self._tokens -= amount
+            return -self._tokens / self.rate if self._tokens < 0 else 0.0
+
+    def consume(self, amount):
+        """Списать amount и подождать, если токенов не хватило; вернуть время ожидания."""
+        wait = self.reserve(amount)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+class IOLimiter:
+    """
+    Пределы и приоритеты ввода-вывода, общие для движков одного процесса.
+    Задание объявляется через job(priority) в каждом потоке, который его
+    выполняет; acquire_op и throttle вызываются перед операцией и перед
+    блоком копирования.
+    """
+    def __init__(self, config=None, metrics=sortmetrics.NULL):
+        self.metrics = metrics
+        self._local = threading.local()
+        self._cond = threading.Condition()
+        self._interactive = 0
+        self.configure(config)
+
+    def configure(self, config=None):
+        """Применить раздел "io" конфигурации; идущие задания подхватывают пределы со следующей операции."""
+        config = config or {}
+        burst = float(config.get("burst", BURST_SECONDS))
+        bandwidth = config.get("bandwidth")
+        iops = config.get("iops")
+        self._bytes = TokenBucket(bandwidth, bandwidth * burst) if bandwidth else None
+        self._ops = TokenBucket(iops, max(1.0, iops * burst)) if iops else None
+        self.idle = bool(config.get("idle", False))
+
+    @property
+    def priority(self):
+        """Приоритет задания текущего потока или None вне заданий."""
+        return getattr(self._local, "priority", None)
+
+    @contextlib.contextmanager
+    def job(self, priority=BACKGROUND):
+        """
+        Выполнять работу текущего потока с приоритетом priority. Вложенные
+        вызовы допустимы; idle-приоритет ставится и снимается внешним.
+        """
+        local = self._local
+        outer = getattr(local, "priority", None)
+        local.priority = priority
+        restore = None
+        if priority == INTERACTIVE:
+            with self._cond:
+                self._interactive += 1
+        elif self.idle and outer != BACKGROUND:
+            enter = _load_idle_api()
+            restore = enter() if enter is not None else None
+        try:
+            yield
+        finally:
+            if restore is not None:
+                restore()
+            local.priority = outer
+            if priority == INTERACTIVE:
+                with self._cond:
+                    self._interactive -= 1
+                    if not self._interactive:
+                        self._cond.notify_all()
+
+    def _yield(self):
+        """Фоновому потоку -- дождаться конца интерактивных заданий."""
+        if not self._interactive:
+            return
+        started = time.monotonic()
+        with self._cond:
+            while self._interactive:
+                self._cond.wait()
+        self.metrics.inc("filesorter_io_wait_seconds_total", time.monotonic() - started, reason="preempted")
+
+    def _consume(self, bucket, amount):
+        if bucket is not None:
+            wait = bucket.consume(amount)
+            if wait:
+                self.metrics.inc("filesorter_io_wait_seconds_total", wait, reason="throttled")
+
+    def acquire_op(self):
+        """Перед файловой операцией фонового задания: уступить интерактивным и уложиться в iops."""
+        if getattr(self._local, "priority", None) != BACKGROUND:
+            return
+        self._yield()
+        self._consume(self._ops, 1)
+
+    def throttle(self, nbytes):
+        """Перед блоком копирования nbytes байт фонового задания."""
+        if getattr(self._local, "priority", None) != BACKGROUND:
+            return
+        self._yield()
+        self._consume(self._bytes, nbytes)
+
+    def copy_throttle(self):
+        """
+        throttle для fileops или None -- копирование целиком, одним вызовом
+        ядра. Блоками копирует только фоновое задание и только если задан
+        предел скорости или идёт интерактивное задание.
+        """
+        if getattr(self._local, "priority", None) != BACKGROUND:
+            return None
+        return self.throttle if self._bytes is not None or self._interactive else None
@@ -0,0 +1,361 @@
+"""
+Журнал операций сортировки: точная отмена запусков и восстановление после сбоя.
+
+Каждый запуск пишет в journal_dir свой файл <run>.jsonl, только дописывая:
+    {"type": "run", ...}                         -- заголовок запуска
+    {"type": "batch", "batch": N, "ops": [...]}  -- намерение, до выполнения
+    {"type": "done", "batch": N, "outcomes": [...], "dsts": [...]}
+    {"type": "undone", "batch": N}
+    {"type": "end", ...}
+Операция -- [вид, src, dst], вид из ACTION_MAP ("move", "copy", "rename",
+"delete"). "dsts" -- фактические пути назначения; пишется, только если
+какое-то имя пришлось сменить при выполнении (его заняли). fsync делается
+один раз на пакет, а не на файл. Пакет с намерением без "done" --
+прерванный: его можно довыполнить (resume) или откатить (undo); запуск без
+"end" считается незавершённым. Пока журнал
+открыт, писатель держит на нём блокировку: запуск другого процесса (например,
+службы watch с тем же journal_dir) за прерванный не принимается.
+"""
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import fileops
+
+if sys.platform == "win32":
+    import msvcrt
+    fcntl = None
+else:
+    import fcntl
+    msvcrt = None
+
+JOURNAL_DIR = "journal"
+KEEP_RUNS = 50
+TAIL_SIZE = 4096  # байт с конца журнала, по которым prune_runs узнаёт, завершён ли запуск
+_LOCK_OFFSET = 1 << 40  # блокировка в Windows -- на байт далеко за концом файла, чтобы не мешать чтению
+OK, FAILED, DUPLICATE = "ok", "failed", "duplicate"
+
+RunInfo = namedtuple("RunInfo", "run_id path header batches outcomes undone ended")
+
+
+class RunJournal:
+    """Журнал одного запуска; методы потокобезопасны."""
+    def __init__(self, path, header):
+        self.path = path
+        self.run_id = header["run"]
+        self._lock = threading.Lock()
+        self._next_batch = 0
+        self._file = open(path, "a", encoding="utf-8")
+        _try_lock(self._file)
+        self._write(header, sync=True)
+
+    @classmethod
+    def create(cls, journal_dir, source_dir, kind="sort"):
+        os.makedirs(journal_dir, exist_ok=True)
+        run_id = time.strftime("%Y%m%d-%H%M%S") + f"-{os.getpid()}-{int(time.monotonic_ns() % 1000000)}"
+        header = {"type": "run", "run": run_id, "kind": kind, "source_dir": source_dir, "started": time.time()}
+        return cls(os.path.join(journal_dir, run_id + ".jsonl"), header)
+
+    def _write(self, record, sync=False):
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+        if sync:
+            os.fsync(self._file.fileno())
+
+    def begin_batch(self, ops):
+        """Записать намерение выполнить ops и вернуть номер пакета."""
+        with self._lock:
+            batch = self._next_batch
+            self._next_batch += 1
+            self._write({"type": "batch", "batch": batch, "ops": ops}, sync=True)
+            return batch
+
+    def end_batch(self, batch, outcomes, dsts=None):
+        record = {"type": "done", "batch": batch, "outcomes": outcomes}
+        if dsts is not None:
+            record["dsts"] = dsts
+        with self._lock:
+            self._write(record, sync=True)
+
+    def close(self):
+        """Отметить конец запуска; журнал запуска без операций удаляется."""
+        with self._lock:
+            if self._file.closed:
+                return
+            if self._next_batch == 0:
+                self._file.close()
+                os.remove(self.path)
+                return
+            self._write({"type": "end", "finished": time.time()}, sync=True)
+            self._file.close()
+
+
+def read_run(path):
+    """Прочитать журнал; оборванная последняя строка (сбой при записи) пропускается."""
+    header, batches, outcomes, undone, ended = {}, {}, {}, set(), False
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            kind = record.get("type")
+            if kind == "run":
+                header = record
+            elif kind == "batch":
+                batches[record["batch"]] = record["ops"]
+            elif kind == "done":
+                outcomes[record["batch"]] = record["outcomes"]
+                dsts = record.get("dsts")
+                if dsts is not None and record["batch"] in batches:
+                    batches[record["batch"]] = [[op[0], op[1], dst] for op, dst in zip(batches[record["batch"]], dsts)]
+            elif kind == "undone":
+                undone.add(record["batch"])
+            elif kind == "end":
+                ended = True
+    run_id = header.get("run", os.path.splitext(os.path.basename(path))[0])
+    return RunInfo(run_id, path, header, batches, outcomes, undone, ended)
+
+
+def _try_lock(f):
+    """Взять блокировку писателя на открытом файле f без ожидания; False, если она занята."""
+    try:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            f.seek(_LOCK_OFFSET)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        return False
+    return True
+
+
+def writer_alive(path):
+    """Пишет ли в журнал сейчас какой-либо процесс (в том числе этот)."""
+    try:
+        with open(path, "rb") as f:
+            return not _try_lock(f)
+    except OSError:
+        return False
+
+
+def list_runs(journal_dir=JOURNAL_DIR):
+    """Запуски от новых к старым."""
+    try:
+        names = [n for n in os.listdir(journal_dir) if n.endswith(".jsonl")]
+    except FileNotFoundError:
+        return []
+    return [read_run(os.path.join(journal_dir, n)) for n in sorted(names, reverse=True)]
+
+
+def incomplete_runs(journal_dir=JOURNAL_DIR):
+    """Запуски, прерванные сбоем: нет записи "end", и журнал никем не открыт."""
+    return [run for run in list_runs(journal_dir) if not run.ended and not writer_alive(run.path)]
+
+
+def _run_ended(path):
+    """
+    Есть ли в журнале запись "end". Читается только хвост файла: после "end"
+    могут идти лишь отметки "undone"; если хвоста не хватило, журнал
+    читается целиком.
+    """
+    with open(path, "rb") as f:
+        size = f.seek(0, os.SEEK_END)
+        f.seek(max(0, size - TAIL_SIZE))
+        lines = f.read().split(b"\n")
+    if size > TAIL_SIZE:
+        lines = lines[1:]  # первая строка хвоста может быть неполной
+    for line in reversed(lines):
+        try:
+            kind = json.loads(line).get("type")
+        except ValueError:
+            continue
+        if kind == "end":
+            return True
+        if kind != "undone":
+            return False
+    return size > TAIL_SIZE and read_run(path).ended
+
+
+def prune_runs(journal_dir=JOURNAL_DIR, keep=KEEP_RUNS):
+    """
+    Удалить журналы завершённых запусков сверх keep последних. Порядок --
+    по имени (в нём время запуска), журналы целиком не читаются.
+    """
+    try:
+        names = sorted((n for n in os.listdir(journal_dir) if n.endswith(".jsonl")), reverse=True)
+    except FileNotFoundError:
+        return
+    kept = 0
+    for name in names:
+        path = os.path.join(journal_dir, name)
+        try:
+            if not _run_ended(path):
+                continue
+        except OSError:
+            continue
+        kept += 1
+        if kept <= keep:
+            continue
+        try:
+            os.remove(path)
+        except OSError as e:
+            logging.error(f"Ошибка удаления журнала '{path}': {str(e)}")
+
+
+def _undo_op(op):
+    kind, src, dst = op
+    if kind in ("move", "rename"):
+        if dst and os.path.lexists(dst) and not os.path.lexists(src):
+            os.makedirs(os.path.dirname(src), exist_ok=True)
+            fileops.move_file(dst, src)
+            return True
+    elif kind == "copy":
+        if dst and os.path.lexists(dst) and os.path.lexists(src):
+            os.remove(dst)
+            return True
+    return False  # удаление необратимо; отсутствующие файлы пропускаются
+
+
+def _redo_op(op):
+    kind, src, dst = op
+    if not os.path.lexists(src):
+        return False
+    if kind in ("move", "rename"):
+        if not os.path.lexists(dst):
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            fileops.move_file(src, dst)
+            return True
+    elif kind == "copy":
+        if not os.path.lexists(dst):
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            fileops.copy_file(src, dst)
+            return True
+    elif kind == "delete":
+        os.remove(src)
+        return True
+    return False
+
+
+def _apply(ops, func):
+    done = 0
+    for op in ops:
+        try:
+            if func(op):
+                done += 1
+        except Exception as e:
+            logging.error(f"Ошибка журнальной операции {op[0]} '{op[1]}': {str(e)}")
+    return done
+
+
+def _append(run, record):
+    """Дописать запись в журнал запуска; оборванная при сбое строка сначала завершается."""
+    with open(run.path, "r+b") as f:
+        prefix = b""
+        if f.seek(0, os.SEEK_END) > 0:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                prefix = b"\n"
+        f.write(prefix + json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _undo_batches(batches):
+    """Откатить пакеты [(номер, операции)] по порядку; вернуть [(номер, отменено операций)]."""
+    return [(batch, _apply(ops, _undo_op)) for batch, ops in batches]
+
+
+def _group_by_path(todo):
+    """
+    Разбить пакеты на группы, не пересекающиеся по путям: пакеты, которые
+    трогают один и тот же файл (авто-сортировка), попадают в одну группу и
+    откатываются последовательно в обратном порядке; группы -- параллельно.
+    """
+    parent = list(range(len(todo)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+    owner = {}
+    for i, (_, ops) in enumerate(todo):
+        for op in ops:
+            for path in op[1:]:
+                if not path:
+                    continue
+                key = os.path.normcase(path)
+                j = owner.setdefault(key, i)
+                if j != i:
+                    parent[find(i)] = find(j)
+    groups = {}
+    for i, item in enumerate(todo):
+        groups.setdefault(find(i), []).append(item)  # порядок todo -- от новых пакетов к старым
+    return list(groups.values())
+
+
+def undo_run(run, workers=4, progress=None, interrupted_only=False):
+    """
+    Откатить запуск: выполненные ("ok") операции и операции прерванных
+    пакетов отменяются в обратном порядке. Пакеты с общими путями
+    откатываются последовательно от последнего к первому, независимые --
+    параллельно. Каждый откаченный пакет отмечается в журнале, так что
+    повторный вызов после сбоя продолжает с места остановки. Возвращает
+    число отменённых операций. progress(done_batches, total_batches)
+    вызывается в потоке вызывающего. interrupted_only -- откатить только
+    пакеты без записи "done" (восстановление после сбоя): завершённые
+    операции прерванного запуска остаются в силе.
+    """
+    todo = []
+    for batch in sorted(run.batches, reverse=True):
+        if batch in run.undone or interrupted_only and batch in run.outcomes:
+            continue
+        ops = run.batches[batch]
+        outcomes = run.outcomes.get(batch)
+        if outcomes is not None:
+            ops = [op for op, outcome in zip(ops, outcomes) if outcome == OK]
+        todo.append((batch, list(reversed(ops))))
+    undone_ops = 0
+    done_batches = 0
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="undo") as pool:
+        futures = [pool.submit(_undo_batches, group) for group in _group_by_path(todo)]
+        for future in futures:
+            for batch, count in future.result():
+                undone_ops += count
+                done_batches += 1
+                _append(run, {"type": "undone", "batch": batch})
+                if progress:
+                    progress(done_batches, len(todo))
+    if not run.ended:
+        _append(run, {"type": "end", "finished": time.time(), "recovered": "undo"})
+    logging.info(f"Запуск '{run.run_id}' отменён: возвращено {undone_ops} операций.")
+    return undone_ops
+
+
+def resume_run(run):
+    """Довыполнить пакеты, прерванные сбоем, и закрыть запуск. Возвращает число операций."""
+    redone = 0
+    for batch in sorted(run.batches):
+        if batch in run.outcomes or batch in run.undone:
+            continue
+        outcomes = []
+        for op in run.batches[batch]:
+            try:
+                done = _redo_op(op)
+            except Exception as e:
+                logging.error(f"Ошибка журнальной операции {op[0]} '{op[1]}': {str(e)}")
+                done = False
+            redone += done
+            # Операция, выполненная до сбоя: исходного файла уже нет, а назначение есть
+            completed = done or (not os.path.lexists(op[1]) and (op[2] is None or os.path.lexists(op[2])))
+            outcomes.append(OK if completed else FAILED)
+        _append(run, {"type": "done", "batch": batch, "outcomes": outcomes})
+    _append(run, {"type": "end", "finished": time.time(), "recovered": "resume"})
+    logging.info(f"Запуск '{run.run_id}' довыполнен: {redone} операций.")
+    return redone
@@ -0,0 +1,253 @@
+"""
+Индекс строк файла лога для просмотра без загрузки файла в память.
+
+Файл делится на блоки примерно по BLOCK_SIZE байт, заканчивающиеся на
+границе строки. Для блока хранятся смещение, номер первой строки, число
+строк, встречающиеся уровни и время первой и последней строки. Чтение
+любого окна строк -- один seek и чтение одного-двух блоков; фильтр по
+уровню и дате пропускает блоки по индексу, не читая их. Дописанный хвост
+индексируется отдельно (tail -f); при ротации или усечении файла индекс
+строится заново.
+"""
+import os
+import threading
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict, namedtuple
+
+BLOCK_SIZE = 1024 * 1024
+CACHED_BLOCKS = 8
+LEVELS = ("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL")
+# Уровень в текстовом формате и в JSON lines (см. sortlog)
+_LEVEL_MARKERS = tuple(
+    (1 << i, f" - {level} - ".encode(), f'"level": "{level}"'.encode())
+    for i, level in enumerate(LEVELS)
+)
+
+Block = namedtuple("Block", "offset end first_line lines levels first_time last_time")
+
+
+def level_mask(level):
+    return 1 << LEVELS.index(level)
+
+
+def line_time(line):
+    """Время строки как 'YYYY-MM-DD HH:MM:SS' (текстовый или JSON-формат) или None."""
+    if line.startswith('{"time": "'):
+        stamp = line[10:29]
+    else:
+        stamp = line[:19]
+    if len(stamp) == 19 and stamp[4] == "-" and stamp[7] == "-" and stamp[13] == ":":
+        return stamp.replace("T", " ")
+    return None
+
+
+def line_level(line):
+    for level in LEVELS:
+        if f" - {level} - " in line or f'"level": "{level}"' in line:
+            return level
+    return None
+
+
+class LogIndex:
+    """Блочный индекс строк; методы потокобезопасны."""
+    def __init__(self, path, block_size=BLOCK_SIZE):
+        self.path = path
+        self.block_size = block_size
+        self._lock = threading.RLock()
+        self._refresh_lock = threading.Lock()
+        self._cache = OrderedDict()
+        self._reset(None)
+
+    def _reset(self, identity):
+        self.blocks = []
+        self._first_lines = []
+        self.size = 0
+        self.identity = identity
+        self._seen_size = 0  # размер файла при последнем refresh, с неоконченной строкой
+        self._cache.clear()
+
+    @property
+    def line_count(self):
+        with self._lock:
+            if not self.blocks:
+                return 0
+            last = self.blocks[-1]
+            return last.first_line + last.lines
+
+    def stale(self):
+        """Изменился ли файл с последнего refresh (один stat, без чтения)."""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return bool(self.blocks)
+        return (st.st_dev, st.st_ino) != self.identity or st.st_size != self._seen_size
+
+    def refresh(self):
+        """
+        Проиндексировать дописанные строки. Возвращает True, если индекс
+        изменился. Неоконченная последняя строка ждёт следующего вызова.
+        Долгое первое индексирование не держит блокировку чтения: она
+        берётся на каждый добавляемый блок, уже проиндексированные строки
+        читаются по ходу.
+        """
+        with self._refresh_lock:
+            try:
+                st = os.stat(self.path)
+            except FileNotFoundError:
+                with self._lock:
+                    changed = bool(self.blocks)
+                    self._reset(None)
+                return changed
+            identity = (st.st_dev, st.st_ino)
+            rebuilt = False
+            if identity != self.identity or st.st_size < self.size:
+                with self._lock:
+                    self._reset(identity)
+                rebuilt = True
+            self._seen_size = st.st_size
+            if st.st_size == self.size:
+                return rebuilt
+            added = False
+            with open(self.path, "rb") as f:
+                f.seek(self.size)
+                pending = b""
+                while True:
+                    chunk = f.read(self.block_size)
+                    if not chunk:
+                        break
+                    pending += chunk
+                    cut = pending.rfind(b"\n")
+                    if cut < 0:
+                        continue  # очень длинная строка: читаем дальше
+                    with self._lock:
+                        self._add_block(pending[:cut + 1])
+                    pending = pending[cut + 1:]
+                    added = True
+            return rebuilt or added
+
+    def _add_block(self, data):
+        levels = 0
+        for bit, text_marker, json_marker in _LEVEL_MARKERS:
+            if text_marker in data or json_marker in data:
+                levels |= bit
+        first_line = self.blocks[-1].first_line + self.blocks[-1].lines if self.blocks else 0
+        last_start = data.rfind(b"\n", 0, len(data) - 1) + 1
+        first_time = line_time(data[:64].decode("utf-8", "replace"))
+        last_time = line_time(data[last_start:last_start + 64].decode("utf-8", "replace")) or first_time
+        if first_time is None and self.blocks:
+            first_time = self.blocks[-1].last_time
+        block = Block(self.size, self.size + len(data), first_line, data.count(b"\n"), levels, first_time, last_time)
+        self.blocks.append(block)
+        self._first_lines.append(first_line)
+        self.size = block.end
+
+    def _block_lines(self, i):
+        """Строки блока i (с небольшим LRU-кэшем прочитанных блоков)."""
+        lines = self._cache.get(i)
+        if lines is not None:
+            self._cache.move_to_end(i)
+            return lines
+        block = self.blocks[i]
+        with open(self.path, "rb") as f:
+            f.seek(block.offset)
+            data = f.read(block.end - block.offset)
+        # Только "\n", как при подсчёте строк в _add_block: splitlines делит
+        # и по \r, \x0c, U+2028 и т. п., и номера строк съехали бы.
+        lines = data.decode("utf-8", "replace").split("\n")
+        lines.pop()  # блок кончается переводом строки
+        self._cache[i] = lines
+        if len(self._cache) > CACHED_BLOCKS:
+            self._cache.popitem(last=False)
+        return lines
+
+    def read_lines(self, start, count):
+        """Строки с номерами start..start+count-1 (сколько есть)."""
+        result = []
+        with self._lock:
+            i = bisect_right(self._first_lines, start) - 1
+            while i >= 0 and i < len(self.blocks) and len(result) < count:
+                block = self.blocks[i]
+                lines = self._block_lines(i)
+                offset = max(0, start - block.first_line)
+                result.extend(lines[offset:offset + count - len(result)])
+                i += 1
+        return result
+
+    def read_numbered(self, numbers):
+        """Строки по списку номеров (для отфильтрованного вида)."""
+        with self._lock:
+            result = []
+            for n in numbers:
+                i = bisect_right(self._first_lines, n) - 1
+                if i < 0:
+                    continue
+                lines = self._block_lines(i)
+                offset = n - self.blocks[i].first_line
+                if offset < len(lines):
+                    result.append(lines[offset])
+            return result
+
+    def filter_lines(self, level=None, date_from=None, date_to=None, text=None, start=0, cancelled=None):
+        """
+        Номера строк начиная со start, подходящих под фильтр (array). Блоки
+        без нужного уровня или вне диапазона дат не читаются. Даты -- строки
+        'YYYY-MM-DD[ HH:MM:SS]'. cancelled() позволяет прервать долгий поиск.
+        """
+        mask = level_mask(level) if level else 0
+        needle = text.lower() if text else None
+        if date_to and len(date_to) == 10:
+            date_to += " 23:59:59"  # дата без времени -- весь день включительно
+        result = array("Q")
+        with self._lock:
+            blocks = list(enumerate(self.blocks))
+        for i, block in blocks:
+            if cancelled and cancelled():
+                break
+            if block.first_line + block.lines <= start:
+                continue
+            if mask and not block.levels & mask:
+                continue
+            if date_from and block.last_time and block.last_time < date_from:
+                continue
+            if date_to and block.first_time and block.first_time > date_to:
+                break
+            with self._lock:
+                if i >= len(self.blocks) or self.blocks[i] is not block:
+                    break  # файл ротирован во время поиска
+                lines = self._block_lines(i)
+            current_time = block.first_time
+            for n, line in enumerate(lines):
+                stamp = line_time(line)
+                if stamp:
+                    current_time = stamp
+                if block.first_line + n < start:
+                    continue
+                if level and line_level(line) != level:
+                    continue
+                if current_time and ((date_from and current_time < date_from) or (date_to and current_time > date_to)):
+                    continue
+                if needle and needle not in line.lower():
+                    continue
+                result.append(block.first_line + n)
+        return result
+
+    def find(self, text, start, backwards=False):
+        """Номер ближайшей строки с text от start (не включая) или None."""
+        needle = text.lower()
+        with self._lock:
+            if not self.blocks:
+                return None
+            # start = -1 -- поиск вперёд с первой строки включительно
+            i = max(0, bisect_right(self._first_lines, start) - 1)
+            step = -1 if backwards else 1
+            while 0 <= i < len(self.blocks):
+                block = self.blocks[i]
+                lines = self._block_lines(i)
+                numbered = range(len(lines) - 1, -1, -1) if backwards else range(len(lines))
+                for n in numbered:
+                    line_no = block.first_line + n
+                    if (line_no < start if backwards else line_no > start) and needle in lines[n].lower():
+                        return line_no
+                i += step
+        return None
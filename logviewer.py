@@ -0,0 +1,283 @@
+"""
+Окно просмотра лога поверх LogIndex.
+
+В Text находится только видимое окно строк; полоса прокрутки работает в
+номерах строк, а не в содержимом виджета, поэтому размер файла не важен.
+Индексирование, фильтр и поиск выполняются в фоновом потоке; новые
+строки подхватываются таймером (tail -f), если включено "Следить".
+"""
+import threading
+import tkinter as tk
+from bisect import bisect_left
+from tkinter import font as tkfont
+from tkinter import ttk
+
+from logindex import LEVELS, LogIndex
+
+POLL_MS = 500
+ALL_LEVELS = "Все"
+
+
+class LogViewer:
+    def __init__(self, root, path):
+        self.index = LogIndex(path)
+        self.view = None  # None -- все строки, иначе номера отфильтрованных строк
+        self.filter = {}
+        self.top = 0
+        self.found = None
+        self._job = None
+        self._result = None
+        self._closed = False
+
+        self.win = tk.Toplevel(root)
+        self.win.title("Просмотр лога")
+        self.win.geometry("900x500")
+        self.win.protocol("WM_DELETE_WINDOW", self.close)
+
+        bar = ttk.Frame(self.win)
+        bar.pack(fill=tk.X, padx=5, pady=5)
+        ttk.Label(bar, text="Уровень:").pack(side=tk.LEFT)
+        self.level_var = tk.StringVar(value=ALL_LEVELS)
+        ttk.Combobox(bar, textvariable=self.level_var, values=(ALL_LEVELS,) + LEVELS,
+                     state="readonly", width=9).pack(side=tk.LEFT, padx=(2, 8))
+        ttk.Label(bar, text="С:").pack(side=tk.LEFT)
+        self.date_from_var = tk.StringVar()
+        ttk.Entry(bar, textvariable=self.date_from_var, width=11).pack(side=tk.LEFT, padx=(2, 4))
+        ttk.Label(bar, text="По:").pack(side=tk.LEFT)
+        self.date_to_var = tk.StringVar()
+        ttk.Entry(bar, textvariable=self.date_to_var, width=11).pack(side=tk.LEFT, padx=(2, 4))
+        ttk.Button(bar, text="Фильтр", command=self.apply_filter).pack(side=tk.LEFT, padx=2)
+        ttk.Button(bar, text="Сброс", command=self.reset_filter).pack(side=tk.LEFT, padx=(2, 8))
+        self.search_var = tk.StringVar()
+        search = ttk.Entry(bar, textvariable=self.search_var, width=20)
+        search.pack(side=tk.LEFT, padx=2)
+        search.bind("<Return>", lambda e: self.find())
+        self.search_var.trace_add("write", lambda *args: setattr(self, "found", None))
+        ttk.Button(bar, text="Найти ▼", command=self.find).pack(side=tk.LEFT, padx=2)
+        ttk.Button(bar, text="▲", width=3, command=lambda: self.find(backwards=True)).pack(side=tk.LEFT)
+        self.follow_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(bar, text="Следить", variable=self.follow_var).pack(side=tk.RIGHT)
+
+        body = ttk.Frame(self.win)
+        body.pack(expand=True, fill=tk.BOTH, padx=5)
+        self.font = tkfont.Font(family="Consolas", size=10)
+        self.text = tk.Text(body, wrap=tk.NONE, font=self.font, state=tk.DISABLED)
+        self.text.tag_configure("match", background="yellow")
+        self.text.tag_configure("found", background="#dde8ff")
+        self.vscroll = ttk.Scrollbar(body, orient=tk.VERTICAL, command=self.on_scroll)
+        hscroll = ttk.Scrollbar(body, orient=tk.HORIZONTAL, command=self.text.xview)
+        self.text.config(xscrollcommand=hscroll.set)
+        self.vscroll.pack(side=tk.RIGHT, fill=tk.Y)
+        hscroll.pack(side=tk.BOTTOM, fill=tk.X)
+        self.text.pack(expand=True, fill=tk.BOTH)
+
+        self.status_var = tk.StringVar(value="Индексирование лога...")
+        ttk.Label(self.win, textvariable=self.status_var, anchor="w").pack(fill=tk.X, padx=5)
+        ttk.Button(self.win, text="Закрыть", command=self.close).pack(pady=5)
+
+        self.text.bind("<Configure>", lambda e: self.render())
+        for widget in (self.text, self.win):
+            widget.bind("<MouseWheel>", self.on_wheel)
+            widget.bind("<Button-4>", lambda e: self.scroll_to(self.top - 3))
+            widget.bind("<Button-5>", lambda e: self.scroll_to(self.top + 3))
+        self.win.bind("<Prior>", lambda e: self.scroll_to(self.top - self.rows()))
+        self.win.bind("<Next>", lambda e: self.scroll_to(self.top + self.rows()))
+        self.win.bind("<Control-Home>", lambda e: self.scroll_to(0))
+        self.win.bind("<Control-End>", lambda e: self.scroll_to(self.total()))
+
+        self.run_job(self.index.refresh, lambda changed: self.scroll_to(self.total()))
+        self.win.after(POLL_MS, self._tick)
+
+    def close(self):
+        self._closed = True
+        self.win.destroy()
+
+    # --- окно строк ---
+
+    def total(self):
+        return len(self.view) if self.view is not None else self.index.line_count
+
+    def rows(self):
+        return max(1, self.text.winfo_height() // self.font.metrics("linespace"))
+
+    def at_end(self):
+        return self.top >= self.total() - self.rows()
+
+    def scroll_to(self, top):
+        self.top = max(0, min(top, self.total() - self.rows()))
+        self.render()
+
+    def render(self):
+        if self._job is not None and self._job.is_alive():
+            return  # индекс занят фоновой задачей
+        rows = self.rows()
+        total = self.total()
+        if self.view is not None:
+            numbers = self.view[self.top:self.top + rows]
+            lines = self.index.read_numbered(numbers)
+        else:
+            numbers = range(self.top, self.top + rows)
+            lines = self.index.read_lines(self.top, rows)
+        self.text.config(state=tk.NORMAL)
+        self.text.delete("1.0", tk.END)
+        self.text.insert(tk.END, "\n".join(lines))
+        needle = self.search_var.get()
+        if needle:
+            start = "1.0"
+            while True:
+                start = self.text.search(needle, start, stopindex=tk.END, nocase=True)
+                if not start:
+                    break
+                end = f"{start}+{len(needle)}c"
+                self.text.tag_add("match", start, end)
+                start = end
+        for row, number in enumerate(numbers, 1):
+            if number == self.found:
+                self.text.tag_add("found", f"{row}.0", f"{row}.end")
+        self.text.config(state=tk.DISABLED)
+        if total:
+            self.vscroll.set(self.top / total, min(1.0, (self.top + rows) / total))
+        else:
+            self.vscroll.set(0, 1)
+        self.update_status()
+
+    def update_status(self):
+        count = self.index.line_count
+        if self.view is not None:
+            self.status_var.set(f"Отфильтровано строк: {len(self.view)} из {count}")
+        else:
+            self.status_var.set(f"Строк: {count}")
+
+    def on_scroll(self, command, *args):
+        if command == "moveto":
+            self.scroll_to(int(float(args[0]) * self.total()))
+        elif command == "scroll":
+            step = self.rows() if args[1] == "pages" else 1
+            self.scroll_to(self.top + int(args[0]) * step)
+
+    def on_wheel(self, event):
+        self.scroll_to(self.top - (event.delta // 120 or (1 if event.delta > 0 else -1)) * 3)
+
+    # --- фоновые задачи ---
+
+    def run_job(self, work, done, status=None):
+        """Выполнить work() в фоне; done(результат) вызывается в потоке интерфейса."""
+        if self._job is not None and self._job.is_alive():
+            return False
+        if status:
+            self.status_var.set(status)
+        self._result = None
+
+        def target():
+            self._result = (work(), done)
+        self._job = threading.Thread(target=target, daemon=True)
+        self._job.start()
+        return True
+
+    def _tick(self):
+        if self._closed:
+            return
+        if self._job is not None and not self._job.is_alive():
+            self._job = None
+            if self._result is not None:
+                result, done = self._result
+                self._result = None
+                done(result)
+        if self._job is None and self.follow_var.get():
+            self._follow()
+        self.win.after(POLL_MS, self._tick)
+
+    def _follow(self):
+        """Дописанные строки индексируются в фоне; в потоке интерфейса -- только stat."""
+        if not self.index.stale():
+            return
+        was_at_end = self.at_end()
+        old_count = self.index.line_count
+        view_filter = self.filter if self.view is not None else None
+
+        def work():
+            if not self.index.refresh():
+                return None
+            count = self.index.line_count
+            if view_filter is None or count < old_count:
+                return count, None
+            return count, self.index.filter_lines(start=old_count, **view_filter)
+
+        def done(result):
+            if result is None:
+                return
+            count, added = result
+            if self.view is not None:
+                if count < old_count or added is None:  # ротация или смена фильтра: фильтр применяется заново
+                    self.apply_filter()
+                    return
+                self.view.extend(added)
+            if was_at_end:
+                self.scroll_to(self.total())
+            else:
+                self.render()
+        self.run_job(work, done)
+
+    # --- фильтр и поиск ---
+
+    def apply_filter(self):
+        level = self.level_var.get()
+        current = {
+            "level": None if level == ALL_LEVELS else level,
+            "date_from": self.date_from_var.get().strip() or None,
+            "date_to": self.date_to_var.get().strip() or None,
+        }
+        if not any(current.values()):
+            self.reset_filter()
+            return
+
+        def done(view):
+            self.filter = current
+            self.view = view
+            self.scroll_to(self.total())
+        self.run_job(lambda: self.index.filter_lines(cancelled=lambda: self._closed, **current), done,
+                     status="Фильтрация...")
+
+    def reset_filter(self):
+        self.level_var.set(ALL_LEVELS)
+        self.date_from_var.set("")
+        self.date_to_var.set("")
+        if self.view is not None:
+            line = self.view[self.top] if self.top < len(self.view) else self.index.line_count
+            self.view = None
+            self.filter = {}
+            self.scroll_to(line)
+
+    def find(self, backwards=False):
+        needle = self.search_var.get()
+        if not needle:
+            return
+        view = self.view
+        if self.found is not None:
+            start = self.found
+        else:
+            if view is not None:
+                start = view[self.top] if self.top < len(view) else self.index.line_count
+            else:
+                start = self.top
+            start += 1 if backwards else -1  # первая видимая строка тоже проверяется
+
+        def work():
+            line = start
+            while True:
+                line = self.index.find(needle, line, backwards)
+                if line is None or view is None or self._closed:
+                    return line
+                pos = bisect_left(view, line)
+                if pos < len(view) and view[pos] == line:
+                    return line
+
+        def done(line):
+            if line is None:
+                self.status_var.set(f"'{needle}' не найдено.")
+                return
+            self.found = line
+            self.follow_var.set(False)
+            pos = line if self.view is None else bisect_left(self.view, line)
+            self.scroll_to(pos - self.rows() // 3)
+        self.run_job(work, done, status="Поиск...")
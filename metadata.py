@@ -0,0 +1,146 @@
+"""
+Метаданные файла для правил с условиями (см. sortrules).
+
+Всё читается лениво и по мере надобности, от дешёвого к дорогому: сначала
+stat (размер, mtime), затем первые байты файла для MIME-типа и, только для
+изображений, заголовок через PIL -- дата съёмки из EXIF без декодирования
+пикселей. MIME-тип и дата из EXIF кэшируются по (устройство, inode, mtime),
+так что повторная проверка того же файла стоит один stat.
+"""
+import mimetypes
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from sniff import SNIFF_SIZE, sniff_bytes
+
+CACHE_SIZE = 65536
+DATE_SOURCES = ("mtime", "exif")
+# Теги EXIF: DateTimeOriginal (в подкаталоге Exif IFD) и DateTime
+_EXIF_IFD = 0x8769
+_DATE_TIME_ORIGINAL = 36867
+_DATE_TIME = 306
+_MISSING = object()
+
+
+def read_exif_date(path):
+    """Дата съёмки из EXIF (time.struct_time) или None; PIL читает только заголовок."""
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+    try:
+        with Image.open(path) as img:
+            exif = img.getexif()
+            value = exif.get_ifd(_EXIF_IFD).get(_DATE_TIME_ORIGINAL) or exif.get(_DATE_TIME)
+    except Exception:
+        return None
+    if not isinstance(value, str):
+        return None
+    try:
+        return time.strptime(value.strip("\0 ")[:19], "%Y:%m:%d %H:%M:%S")
+    except ValueError:
+        return None
+
+
+class MetadataCache:
+    """Ограниченный LRU-кэш извлечённых метаданных. Потокобезопасен."""
+    def __init__(self, cache_size=CACHE_SIZE):
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, field):
+        with self._lock:
+            fields = self._cache.get(key)
+            if fields is None:
+                return _MISSING
+            self._cache.move_to_end(key)
+            return fields.get(field, _MISSING)
+
+    def put(self, key, field, value):
+        with self._lock:
+            fields = self._cache.get(key)
+            if fields is None:
+                fields = self._cache[key] = {}
+                if len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+            fields[field] = value
+
+    def __call__(self, path, st=None):
+        return FileMetadata(path, self, st)
+
+
+class FileMetadata:
+    """Метаданные одного файла; каждое поле считается при первом обращении."""
+    __slots__ = ("path", "_cache", "_st")
+
+    def __init__(self, path, cache, st=None):
+        self.path = path
+        self._cache = cache
+        self._st = st
+
+    @property
+    def st(self):
+        """Результат os.stat или None, если файла нет."""
+        if self._st is None:
+            try:
+                self._st = os.stat(self.path)
+            except OSError:
+                return None
+        return self._st
+
+    @property
+    def size(self):
+        st = self.st
+        return st.st_size if st is not None else None
+
+    def age(self, now=None):
+        """Возраст файла по mtime в секундах."""
+        st = self.st
+        if st is None:
+            return None
+        return (time.time() if now is None else now) - st.st_mtime
+
+    def _cached(self, field, compute):
+        st = self.st
+        if st is None:
+            return None
+        key = (st.st_dev, st.st_ino, st.st_mtime_ns)
+        value = self._cache.get(key, field)
+        if value is _MISSING:
+            value = compute()
+            self._cache.put(key, field, value)
+        return value
+
+    @property
+    def mime(self):
+        """MIME-тип по сигнатуре содержимого, а если она не распознана -- по имени."""
+        return self._cached("mime", self._read_mime)
+
+    def _read_mime(self):
+        try:
+            with open(self.path, "rb") as f:
+                ext = sniff_bytes(f.read(SNIFF_SIZE))
+        except OSError:
+            ext = None
+        mime = mimetypes.types_map.get(ext) if ext else None
+        return mime or mimetypes.guess_type(self.path, strict=False)[0]
+
+    @property
+    def exif_date(self):
+        """Дата съёмки из EXIF; для файлов, не являющихся изображениями, -- None без чтения PIL."""
+        mime = mimetypes.guess_type(self.path, strict=False)[0] or self.mime
+        if not (mime or "").startswith("image/"):
+            return None
+        return self._cached("exif_date", lambda: read_exif_date(self.path))
+
+    def date(self, source="mtime"):
+        """Дата файла (time.struct_time): из EXIF, если source == "exif" и она есть, иначе по mtime."""
+        if source == "exif":
+            taken = self.exif_date
+            if taken is not None:
+                return taken
+        st = self.st
+        return time.localtime(st.st_mtime) if st is not None else None
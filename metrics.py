@@ -0,0 +1,329 @@
+"""
+Метрики и профилирование сортировки.
+
+Движок считает время по этапам (scan, classify, makedirs, naming, dedup,
+action, log, journal), гистограммы длительности операций и счётчики файлов;
+наблюдение -- события, задержку до готовности файла и длину очереди.
+Раздел "metrics" конфигурации включает выгрузку в формате Prometheus:
+    "file"      -- текстовый файл (для textfile collector node_exporter),
+                   перезаписывается раз в "interval" секунд;
+    "http_port" -- локальный HTTP-адрес /metrics ("http_host", по умолчанию
+                   127.0.0.1).
+Без раздела используется NULL: вызовы ничего не делают.
+
+"profile": "cprofile" или "sample" сохраняет профиль каждого запуска в
+"profile_dir": cProfile (.prof, только поток запуска) или сэмплирующий
+профиль всех потоков в формате collapsed stacks (.folded, для flamegraph).
+"""
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0)
+EXPORT_INTERVAL = 10.0
+PROFILE_DIR = "profiles"
+SAMPLE_INTERVAL = 0.005
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def _escape_label(value):
+    """Значение метки в текстовом формате Prometheus: экранируются \\, " и перевод строки."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape_label(v)}"' for k, v in items) + "}"
+
+
+class _Timer:
+    __slots__ = ("metrics", "name", "labels", "histogram", "start")
+
+    def __init__(self, metrics, name, labels, histogram):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.start
+        if self.histogram:
+            self.metrics.observe(self.name, elapsed, **self.labels)
+        else:
+            self.metrics.inc(self.name, elapsed, **self.labels)
+
+
+class Metrics:
+    """Потокобезопасный набор счётчиков, гистограмм и показателей (gauge)."""
+    enabled = True
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}  # ключ -> [счётчики по корзинам, сумма, количество]
+        self._gauges = {}      # ключ -> значение или функция без аргументов
+
+    def inc(self, name, value=1, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def add_time(self, stage, seconds):
+        """Время этапа сортировки (счётчик filesorter_stage_seconds_total)."""
+        self.inc("filesorter_stage_seconds_total", seconds, stage=stage)
+
+    def observe(self, name, value, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    hist[0][i] += 1
+                    break
+            hist[1] += value
+            hist[2] += 1
+
+    def gauge(self, name, value, **labels):
+        """Задать показатель: число или функция, вызываемая при выгрузке."""
+        with self._lock:
+            self._gauges[_key(name, labels)] = value
+
+    def timer(self, name, histogram=False, **labels):
+        """with metrics.timer(...): время блока в счётчик или гистограмму."""
+        return _Timer(self, name, labels, histogram)
+
+    def stage(self, stage):
+        return _Timer(self, "filesorter_stage_seconds_total", {"stage": stage}, False)
+
+    def render(self):
+        """Текст в формате Prometheus exposition."""
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {k: (list(v[0]), v[1], v[2]) for k, v in self._histograms.items()}
+            gauges = dict(self._gauges)
+        lines = []
+        typed = set()
+
+        def type_line(name, kind):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} {kind}")
+        for (name, labels), value in sorted(counters.items()):
+            type_line(name, "counter")
+            lines.append(f"{name}{_format_labels(labels)} {value:g}")
+        for (name, labels), value in sorted(gauges.items(), key=lambda item: item[0]):
+            try:
+                value = value() if callable(value) else value
+            except Exception:
+                continue
+            type_line(name, "gauge")
+            lines.append(f"{name}{_format_labels(labels)} {value:g}")
+        for (name, labels), (counts, total, count) in sorted(histograms.items()):
+            type_line(name, "histogram")
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', f'{bound:g}')])} {cumulative}")
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {count}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {total:g}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+class NullMetrics:
+    """Заглушка с тем же интерфейсом: метрики выключены."""
+    enabled = False
+    _timer = _NullTimer()
+
+    def inc(self, name, value=1, **labels):
+        pass
+
+    def add_time(self, stage, seconds):
+        pass
+
+    def observe(self, name, value, **labels):
+        pass
+
+    def gauge(self, name, value, **labels):
+        pass
+
+    def timer(self, name, histogram=False, **labels):
+        return self._timer
+
+    def stage(self, stage):
+        return self._timer
+
+    def render(self):
+        return ""
+
+
+NULL = NullMetrics()
+
+
+class FileSink:
+    """Периодически перезаписывает файл метрик (через временный файл и rename)."""
+    def __init__(self, metrics, path, interval=EXPORT_INTERVAL):
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="metrics-file", daemon=True)
+        self._thread.start()
+
+    def write(self):
+        tmp = self.path + ".tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(self.metrics.render())
+            os.replace(tmp, self.path)
+        except OSError as e:
+            logging.error(f"Ошибка записи метрик в '{self.path}': {str(e)}")
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.write()
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+        self.write()
+
+
+class HttpSink:
+    """Отдаёт метрики по HTTP GET /metrics в отдельном потоке."""
+    def __init__(self, metrics, port, host="127.0.0.1"):
+        import http.server
+        sink_metrics = metrics
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = sink_metrics.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer((host, port), Handler)
+        self._thread = threading.Thread(target=self.server.serve_forever, name="metrics-http", daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def from_config(config):
+    """(Metrics или NULL, список выгрузок) по разделу "metrics" конфигурации."""
+    settings = config.get("metrics")
+    if not settings:
+        return NULL, []
+    metrics = Metrics()
+    sinks = []
+    try:
+        if settings.get("file"):
+            sinks.append(FileSink(metrics, settings["file"], float(settings.get("interval", EXPORT_INTERVAL))))
+        if settings.get("http_port"):
+            sinks.append(HttpSink(metrics, int(settings["http_port"]), settings.get("http_host", "127.0.0.1")))
+    except OSError as e:
+        logging.error(f"Ошибка запуска выгрузки метрик: {str(e)}")
+    return metrics, sinks
+
+
+class _Sampler:
+    """Сэмплирующий профиль всех потоков: стеки через sys._current_frames."""
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def stop(self, path):
+        self._stop.set()
+        self._thread.join()
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class RunProfiler:
+    """Контекст профилирования одного запуска; mode -- "cprofile" или "sample"."""
+    def __init__(self, mode, profile_dir=PROFILE_DIR, name="run"):
+        self.mode = mode
+        self.profile_dir = profile_dir
+        self.name = name
+        self._profiler = None
+
+    def __enter__(self):
+        if self.mode == "cprofile":
+            import cProfile
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        elif self.mode == "sample":
+            self._profiler = _Sampler()
+            self._profiler.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._profiler is None:
+            return False
+        os.makedirs(self.profile_dir, exist_ok=True)
+        base = os.path.join(self.profile_dir, time.strftime("%Y%m%d-%H%M%S") + f"-{self.name}")
+        try:
+            if self.mode == "cprofile":
+                self._profiler.disable()
+                self._profiler.dump_stats(base + ".prof")
+                logging.info(f"Профиль запуска сохранён в '{base}.prof'")
+            else:
+                self._profiler.stop(base + ".folded")
+                logging.info(f"Профиль запуска сохранён в '{base}.folded'")
+        except OSError as e:
+            logging.error(f"Ошибка сохранения профиля: {str(e)}")
+        return False
@@ -0,0 +1,203 @@
+"""
+Выбор имени в целевой папке без перезаписи существующих файлов.
+
+"collisions" в конфигурации -- что делать, если имя занято:
+    "number"    -- "отчёт (1).pdf", "отчёт (2).pdf", ... (по умолчанию);
+    "timestamp" -- "отчёт_20240131-154500.pdf" по mtime файла;
+    "hash"      -- "отчёт_1a2b3c4d.pdf" по содержимому;
+    "skip"      -- не трогать файл, если в папке уже лежит такой же по
+                   содержимому, иначе как "number";
+    "overwrite" -- прежнее поведение: файл назначения заменяется.
+Если имя с отметкой времени или хэшем тоже занято, добавляется номер.
+При копировании любая политика, кроме "overwrite", пропускает файл, если
+такой же по содержимому уже лежит под его именем или под одним из имён,
+которые ему дала бы нумерация: повторная сортировка копированием не
+плодит "отчёт (1).pdf", "отчёт (2).pdf", ...
+
+NameRegistry хранит занятые имена по папкам в памяти: папка читается один
+раз за запуск, а выбор и резервирование имени идут под блокировкой, так что
+два потока не получат одно и то же имя. Реестры разных запусков (и других
+процессов) друг о друге не знают, поэтому файл кладётся без замены
+(fileops, replace=False): если имя успели занять, вызывающий отмечает это
+через taken_elsewhere и берёт следующее. Для одиночных файлов (авто-
+сортировка) папка не читается: имя проверяется через lstat, а в памяти
+держатся только имена, занятые ещё не завершёнными операциями.
+"""
+import os
+import threading
+import time
+
+from dedup import full_hash
+
+COLLISION_POLICIES = ("number", "timestamp", "hash", "skip", "overwrite")
+DEFAULT_POLICY = "number"
+HASH_LENGTH = 8
+# Составные расширения: номер ставится перед ними ("архив (1).tar.gz")
+COMPOUND_EXTS = (".tar.gz", ".tar.bz2", ".tar.xz", ".tar.zst")
+
+
+def split_name(file_name):
+    lower = file_name.lower()
+    for ext in COMPOUND_EXTS:
+        if lower.endswith(ext) and len(file_name) > len(ext):
+            return file_name[:-len(ext)], file_name[-len(ext):]
+    return os.path.splitext(file_name)
+
+
+class _Folder:
+    __slots__ = ("on_disk", "reserved", "counters")
+
+    def __init__(self, on_disk):
+        self.on_disk = on_disk  # нормализованные имена на диске или None (проверка через lstat)
+        self.reserved = set()   # имена, выданные в этом запуске
+        self.counters = {}      # (основа, расширение) -> следующий номер
+
+
+class NameRegistry:
+    """
+    Занятые имена целевых папок. listed=False -- папки не читаются целиком
+    (для отдельных файлов). cache -- dedup.HashCache для сравнения
+    содержимого в политиках "hash" и "skip".
+    """
+    def __init__(self, policy=DEFAULT_POLICY, listed=True, cache=None):
+        if policy not in COLLISION_POLICIES:
+            raise ValueError(f"Неизвестная политика конфликтов имён: {policy}")
+        self.policy = policy
+        self.listed = listed
+        self.cache = cache
+        self._lock = threading.Lock()
+        self._folders = {}
+
+    def _folder(self, target_dir):
+        folder = self._folders.get(target_dir)
+        if folder is None:
+            on_disk = None
+            if self.listed:
+                try:
+                    with os.scandir(target_dir) as entries:
+                        on_disk = {os.path.normcase(entry.name) for entry in entries}
+                except OSError:
+                    on_disk = set()
+            folder = self._folders[target_dir] = _Folder(on_disk)
+        return folder
+
+    def _taken(self, folder, target_dir, name):
+        """"exists" (имя есть на диске), "duplicate" (выдано в этом запуске) или None."""
+        key = os.path.normcase(name)
+        if key in folder.reserved:
+            return "duplicate"
+        if folder.on_disk is None:
+            return "exists" if os.path.lexists(os.path.join(target_dir, name)) else None
+        return "exists" if key in folder.on_disk else None
+
+    def conflict(self, target_dir, file_name):
+        """Занято ли имя: "exists", "duplicate" или None."""
+        with self._lock:
+            return self._taken(self._folder(target_dir), target_dir, file_name)
+
+    def reserve(self, target_dir, file_name, src, copy=False):
+        """
+        Свободное имя для src в target_dir, уже закреплённое за вызывающим,
+        или None, если такой же файл в папке уже есть (политика "skip" или
+        копирование, copy=True).
+        """
+        policy = self.policy
+        with self._lock:
+            folder = self._folder(target_dir)
+            if policy == "overwrite" or not self._taken(folder, target_dir, file_name):
+                return self._claim(folder, file_name)
+        # Сравнение содержимого и хэши считаются без блокировки
+        base, ext = split_name(file_name)
+        candidate = None
+        if policy == "skip" and not copy:
+            if self._same_content(src, os.path.join(target_dir, file_name)):
+                return None
+        elif policy == "timestamp":
+            try:
+                stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(os.stat(src).st_mtime))
+            except OSError:
+                stamp = time.strftime("%Y%m%d-%H%M%S")
+            candidate = f"{base}_{stamp}{ext}"
+        elif policy == "hash":
+            digest = self._hash(src)
+            if digest is not None:
+                candidate = f"{base}_{digest.hex()[:HASH_LENGTH]}{ext}"
+        if copy:
+            with self._lock:
+                existing = [name for other in (file_name, candidate) if other
+                            for name in self._numbered_on_disk(folder, target_dir, other)]
+            if any(self._same_content(src, os.path.join(target_dir, name)) for name in existing):
+                return None
+        with self._lock:
+            if candidate is not None:
+                if not self._taken(folder, target_dir, candidate):
+                    return self._claim(folder, candidate)
+                base, ext = split_name(candidate)
+            counter = folder.counters.get((base, ext), 1)
+            while True:
+                name = f"{base} ({counter}){ext}"
+                counter += 1
+                if not self._taken(folder, target_dir, name):
+                    folder.counters[(base, ext)] = counter
+                    return self._claim(folder, name)
+
+    def _numbered_on_disk(self, folder, target_dir, file_name):
+        """file_name и "основа (N).расширение" подряд, пока такие имена есть на диске."""
+        base, ext = split_name(file_name)
+        names = []
+        name, counter = file_name, 1
+        while self._taken(folder, target_dir, name) == "exists":
+            names.append(name)
+            name = f"{base} ({counter}){ext}"
+            counter += 1
+        return names
+
+    @staticmethod
+    def _claim(folder, name):
+        folder.reserved.add(os.path.normcase(name))
+        return name
+
+    def release(self, target_dir, name):
+        """
+        Снять резерв после операции (для listed=False): дальше имя видно на
+        диске. В режиме listed имя остаётся занятым до конца запуска.
+        """
+        if self.listed:
+            return
+        with self._lock:
+            folder = self._folders.get(target_dir)
+            if folder is not None:
+                folder.reserved.discard(os.path.normcase(name))
+                if not folder.reserved:
+                    del self._folders[target_dir]
+
+    def taken_elsewhere(self, target_dir, name):
+        """Выданное имя оказалось занятым мимо реестра: снять резерв и считать имя занятым."""
+        key = os.path.normcase(name)
+        with self._lock:
+            folder = self._folders.get(target_dir)
+            if folder is None:
+                return
+            folder.reserved.discard(key)
+            if folder.on_disk is not None:
+                folder.on_disk.add(key)
+            elif not folder.reserved:
+                del self._folders[target_dir]
+
+    def _hash(self, path):
+        try:
+            st = os.stat(path)
+            if self.cache is not None:
+                return self.cache.get(path, st, full=True)
+            return full_hash(path, st.st_size)
+        except OSError:
+            return None
+
+    def _same_content(self, src, dst):
+        try:
+            if os.stat(src).st_size != os.stat(dst).st_size:
+                return False
+        except OSError:
+            return False
+        src_hash = self._hash(src)
+        return src_hash is not None and src_hash == self._hash(dst)
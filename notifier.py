@@ -0,0 +1,90 @@
+"""
+Фоновая отправка уведомлений со слиянием и ограничением частоты.
+
+notify() только учитывает событие и сразу возвращается, поэтому поток
+сортировки не ждёт ни plyer, ни osascript. Поток-диспетчер собирает
+события за окно WINDOW секунд и показывает одно уведомление, например
+"Обработано файлов: 312" и "Ошибок: 4"; между уведомлениями проходит не
+меньше MIN_INTERVAL секунд. События с одинаковым заголовком сливаются,
+формат сводки задаётся через summaries.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+WINDOW = 1.0
+MIN_INTERVAL = 5.0
+SUMMARY_TITLE = "Умный сортировщик файлов"
+DEFAULT_SUMMARY = "{message} (всего {count})"
+
+
+class Notifier:
+    def __init__(self, send, summaries=None, window=WINDOW, min_interval=MIN_INTERVAL):
+        """send(title, message) вызывается только в потоке диспетчера."""
+        self.send = send
+        self.summaries = summaries or {}
+        self.window = window
+        self.min_interval = min_interval
+        self._groups = OrderedDict()  # title -> [count, последнее сообщение]
+        self._cond = threading.Condition()
+        self._last_sent = 0.0
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name="notifier", daemon=True)
+        self._thread.start()
+
+    def notify(self, title, message):
+        """Учесть событие; не блокирует вызывающий поток."""
+        with self._cond:
+            group = self._groups.get(title)
+            if group is None:
+                self._groups[title] = [1, message]
+                self._cond.notify()
+            else:
+                group[0] += 1
+                group[1] = message
+
+    def _summary(self, title, count, message):
+        if count == 1:
+            return message
+        return self.summaries.get(title, DEFAULT_SUMMARY).format(count=count, message=message)
+
+    def _take(self):
+        """Сформировать одно уведомление из накопленных событий."""
+        groups, self._groups = self._groups, OrderedDict()
+        if len(groups) == 1:
+            title, (count, message) = next(iter(groups.items()))
+            return title, self._summary(title, count, message)
+        lines = []
+        for title, (count, message) in groups.items():
+            summary = self._summary(title, count, message)
+            lines.append(f"{title}: {summary}" if count == 1 else summary)
+        return SUMMARY_TITLE, "\n".join(lines)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._groups and not self._stopped:
+                    self._cond.wait()
+                if not self._groups:
+                    return
+                # Собрать пачку событий и выдержать паузу с прошлого уведомления
+                deadline = max(time.monotonic() + self.window, self._last_sent + self.min_interval)
+                while not self._stopped:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                title, message = self._take()
+            try:
+                self.send(title, message)
+            except Exception as e:
+                logging.error(f"Ошибка показа уведомления: {e}")
+            self._last_sent = time.monotonic()
+
+    def stop(self, timeout=5.0):
+        """Отправить накопленное и остановить диспетчер."""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        self._thread.join(timeout)
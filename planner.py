@@ -0,0 +1,218 @@
+"""
+План сортировки: полный список src -> dst без изменений на диске.
+
+build_plan обходит папку так же, как sort_directory, но ничего не создаёт и
+не перемещает. Имена назначения выбираются по политике "collisions" (см.
+naming) так же, как при сортировке: каждая целевая папка читается один раз.
+Конфликты имён остаются только при политике "overwrite":
+    exists    -- файл с таким именем уже есть в целевой папке;
+    duplicate -- в одно место назначения попадают несколько файлов плана.
+При политике "skip" (а при копировании -- при любой, кроме "overwrite")
+файлы, такие же, как уже лежащие в папке, отмечаются как identical и при
+выполнении не трогаются.
+Для каждого тома целевых папок считается, сколько байт на него ляжет
+(копирование и перемещение с другого тома), и сравнивается со свободным
+местом.
+
+План сохраняется в JSON или CSV (по расширению файла) и выполняется позже
+через SortEngine.run_plan ровно в том виде, в каком составлен.
+"""
+import csv
+import json
+import os
+import shutil
+import time
+from collections import namedtuple
+
+PLAN_VERSION = 1
+PROBLEMS = {
+    "exists": "в целевой папке уже есть файл с таким именем",
+    "duplicate": "в это же место назначения попадает другой файл плана",
+    "identical": "такой же файл уже есть в целевой папке",
+}
+CONFLICTS = ("exists", "duplicate")
+_COPY_ACTIONS = ("Копировать",)
+_MOVE_ACTIONS = ("Переместить", "Переименовать")
+
+# problem -- пустая строка или ключ PROBLEMS
+PlanEntry = namedtuple("PlanEntry", "action src dst folder size mtime_ns problem")
+# Том целевых папок: путь, по которому он найден, нужно байт и свободно байт
+VolumeUsage = namedtuple("VolumeUsage", "path needed free")
+
+
+class Plan:
+    def __init__(self, source_dir, entries, volumes=None, created=None, rules_version=None):
+        self.source_dir = source_dir
+        self.entries = entries
+        self.volumes = volumes or []
+        self.created = created or time.strftime("%Y-%m-%dT%H:%M:%S")
+        self.rules_version = rules_version
+
+    @staticmethod
+    def describe(problem):
+        return PROBLEMS.get(problem, problem)
+
+    @property
+    def collisions(self):
+        return [entry for entry in self.entries if entry.problem in CONFLICTS]
+
+    @property
+    def shortfalls(self):
+        """Тома, на которых не хватит места."""
+        return [volume for volume in self.volumes if volume.free is not None and volume.needed > volume.free]
+
+    @property
+    def ok(self):
+        return not self.collisions and not self.shortfalls
+
+    def summary(self):
+        counts = {}
+        for entry in self.entries:
+            counts[entry.action] = counts.get(entry.action, 0) + 1
+        lines = [f"План: {len(self.entries)} файлов"
+                 + (" (" + ", ".join(f"{action}: {n}" for action, n in sorted(counts.items())) + ")" if counts else "")]
+        collisions = self.collisions
+        if collisions:
+            lines.append(f"Конфликтов имён: {len(collisions)}")
+            lines += [f"  {entry.src} -> {entry.dst}: {self.describe(entry.problem)}" for entry in collisions[:10]]
+            if len(collisions) > 10:
+                lines.append(f"  ... и ещё {len(collisions) - 10}")
+        identical = sum(1 for entry in self.entries if entry.problem == "identical")
+        if identical:
+            lines.append(f"Пропускаются как уже имеющиеся в целевых папках: {identical}")
+        for volume in self.shortfalls:
+            lines.append(f"Не хватает места на томе '{volume.path}': нужно {_format_size(volume.needed)}, "
+                         f"свободно {_format_size(volume.free)}")
+        return "\n".join(lines)
+
+    def save(self, path):
+        """Записать план в JSON или, для файла .csv, в CSV (только записи)."""
+        if path.lower().endswith(".csv"):
+            with open(path, "w", encoding="utf-8", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(PlanEntry._fields)
+                writer.writerows(self.entries)
+            return
+        data = {
+            "version": PLAN_VERSION,
+            "created": self.created,
+            "source_dir": self.source_dir,
+            "rules_version": self.rules_version,
+            "volumes": [volume._asdict() for volume in self.volumes],
+            "entries": [entry._asdict() for entry in self.entries],
+        }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=1, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path):
+        if path.lower().endswith(".csv"):
+            with open(path, "r", encoding="utf-8", newline="") as f:
+                rows = list(csv.DictReader(f))
+            entries = [_entry(row) for row in rows]
+            source_dir = os.path.commonpath([entry.src for entry in entries]) if entries else ""
+            return cls(source_dir, entries)
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != PLAN_VERSION:
+            raise ValueError(f"Неподдерживаемая версия плана: {data.get('version')}")
+        return cls(
+            data["source_dir"], [_entry(entry) for entry in data["entries"]],
+            [VolumeUsage(**volume) for volume in data.get("volumes", [])],
+            data.get("created"), data.get("rules_version")
+        )
+
+
+def _entry(row):
+    return PlanEntry(
+        row["action"], row["src"], row["dst"] or None, row["folder"],
+        int(row["size"]), int(row["mtime_ns"]), row["problem"] or ""
+    )
+
+
+def _format_size(size):
+    for unit in ("Б", "КБ", "МБ", "ГБ"):
+        if size < 1024:
+            return f"{size:.0f} {unit}"
+        size /= 1024
+    return f"{size:.1f} ТБ"
+
+
+class _Volumes:
+    """Тома целевых папок; для каждой папки определяется один раз."""
+    def __init__(self):
+        self._devices = {}  # целевая папка -> (st_dev, путь существующего предка)
+
+    def device(self, target_dir):
+        """Том целевой папки: по ближайшей существующей папке пути."""
+        device = self._devices.get(target_dir)
+        if device is None:
+            path = target_dir
+            while True:
+                try:
+                    device = (os.stat(path).st_dev, path)
+                    break
+                except OSError:
+                    parent = os.path.dirname(path)
+                    if parent == path:
+                        device = (None, path)
+                        break
+                    path = parent
+            self._devices[target_dir] = device
+        return device
+
+
+def build_plan(engine, source_dir=None, progress=None):
+    """
+    Составить план сортировки папки движком engine (SortEngine).
+    progress(done) вызывается для каждого файла плана.
+    """
+    source_dir = source_dir or engine.source_dir
+    if not source_dir or not os.path.exists(source_dir):
+        raise FileNotFoundError("Папка для сортировки не указана или не существует!")
+    rules = engine.rules
+    hardlink = engine.copy_mode == "hardlink"
+    volumes = _Volumes()
+    names = engine.name_registry()
+    needed = {}  # st_dev -> [путь, байт]
+    entries = []
+    with engine.metrics.timer("filesorter_run_seconds", histogram=True, kind="planning"):
+        for dir_entry in engine.iter_files(source_dir):
+            task = engine.make_task(dir_entry.path, dir_entry.name, source_dir, rules)
+            if task is None:
+                continue
+            try:
+                st = dir_entry.stat()
+            except OSError:
+                continue
+            dst = engine.destination_for(task)
+            problem = ""
+            if dst is not None:
+                file_name = os.path.basename(dst)
+                if names.policy == "overwrite":
+                    problem = names.conflict(task.target_dir, file_name) or ""
+                    names.reserve(task.target_dir, file_name, task.src)
+                else:
+                    file_name = names.reserve(task.target_dir, file_name, task.src, copy=task.action in _COPY_ACTIONS)
+                    if file_name is None:
+                        problem = "identical"
+                    else:
+                        dst = os.path.join(task.target_dir, file_name)
+            if dst is not None and not problem:
+                dev, dev_path = volumes.device(task.target_dir)
+                same_volume = dev == st.st_dev
+                if (task.action in _COPY_ACTIONS and not (hardlink and same_volume)
+                        or task.action in _MOVE_ACTIONS and not same_volume):
+                    total = needed.setdefault(dev, [dev_path, 0])
+                    total[1] += st.st_size
+            entries.append(PlanEntry(task.action, task.src, dst, task.folder, st.st_size, st.st_mtime_ns, problem))
+            if progress:
+                progress(len(entries))
+    usage = []
+    for path, size in needed.values():
+        try:
+            free = shutil.disk_usage(path).free
+        except OSError:
+            free = None
+        usage.append(VolumeUsage(path, size, free))
+    return Plan(source_dir, entries, usage, rules_version=engine.rules_version)
@@ -0,0 +1,101 @@
+"""
+Определение типа файла по сигнатуре (magic bytes).
+
+Используется, только если правило по расширению не нашлось: файл без
+расширения или с неверным расширением читается одним read() не больше
+SNIFF_SIZE байт. Результат кэшируется по (устройство, inode, mtime).
+"""
+import os
+import threading
+from collections import OrderedDict
+
+SNIFF_SIZE = 4096
+CACHE_SIZE = 65536
+
+# (смещение, сигнатура, расширение); проверяются по порядку
+SIGNATURES = (
+    (0, b"\xff\xd8\xff", ".jpg"),
+    (0, b"\x89PNG\r\n\x1a\n", ".png"),
+    (0, b"GIF87a", ".gif"),
+    (0, b"GIF89a", ".gif"),
+    (0, b"%PDF-", ".pdf"),
+    (0, b"Rar!\x1a\x07", ".rar"),
+    (0, b"7z\xbc\xaf\x27\x1c", ".7z"),
+    (0, b"\x1f\x8b", ".gz"),
+    (0, b"BM", ".bmp"),
+    (0, b"II*\x00", ".tiff"),
+    (0, b"MM\x00*", ".tiff"),
+    (0, b"ID3", ".mp3"),
+    (0, b"OggS", ".ogg"),
+    (0, b"fLaC", ".flac"),
+    (0, b"\x1a\x45\xdf\xa3", ".mkv"),
+    (0, b"MZ", ".exe"),
+    (0, b"{\\rtf", ".rtf"),
+    (0, b"%!PS", ".ps"),
+    (257, b"ustar", ".tar"),
+)
+# Контейнеры, тип которых уточняется по содержимому
+_RIFF_TYPES = {b"WAVE": ".wav", b"AVI ": ".avi", b"WEBP": ".webp"}
+_ZIP_TYPES = ((b"word/", ".docx"), (b"xl/", ".xlsx"), (b"ppt/", ".pptx"))
+_OLE_TYPES = ((b"W\x00o\x00r\x00d\x00", ".doc"), (b"W\x00o\x00r\x00k\x00b\x00o\x00o\x00k\x00", ".xls"),
+              (b"P\x00o\x00w\x00e\x00r\x00P\x00o\x00i\x00n\x00t\x00", ".ppt"))
+
+
+def sniff_bytes(head):
+    """Расширение по первым байтам файла или None."""
+    if head[:4] == b"PK\x03\x04":
+        for marker, ext in _ZIP_TYPES:
+            if marker in head:
+                return ext
+        return ".zip"
+    if head[:4] == b"RIFF":
+        return _RIFF_TYPES.get(head[8:12])
+    if head[4:8] == b"ftyp":
+        return ".mov" if head[8:10] == b"qt" else ".mp4"
+    if head[:8] == b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1":
+        for marker, ext in _OLE_TYPES:
+            if marker in head:
+                return ext
+        return ".doc"
+    for offset, magic, ext in SIGNATURES:
+        if head.startswith(magic, offset):
+            return ext
+    if len(head) >= 2 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0:
+        return ".mp3"  # кадр MPEG audio без тега ID3
+    text = head.lstrip()[:256].lower()
+    if text.startswith(b"<svg") or (text.startswith(b"<?xml") and b"<svg" in head):
+        return ".svg"
+    if text.startswith((b"<!doctype html", b"<html")):
+        return ".html"
+    if text.startswith(b"<?xml"):
+        return ".xml"
+    return None
+
+
+class ContentSniffer:
+    """Классификатор path -> расширение с ограниченным LRU-кэшем. Потокобезопасен."""
+    def __init__(self, cache_size=CACHE_SIZE):
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __call__(self, path, st=None):
+        try:
+            st = st or os.stat(path)
+        except OSError:
+            return None
+        key = (st.st_dev, st.st_ino, st.st_mtime_ns)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+        try:
+            with open(path, "rb") as f:
+                ext = sniff_bytes(f.read(SNIFF_SIZE))
+        except OSError:
+            return None
+        with self._lock:
+            self._cache[key] = ext
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return ext
@@ -0,0 +1,942 @@
+"""
+Движок сортировки файлов без графического интерфейса.
+
+Модуль не импортирует tkinter, PIL и pystray, поэтому его можно использовать
+на серверах без графики (см. filesorter.py) и из FileSorterApp.
+"""
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import fileops
+import iolimit
+import journal
+import metrics as sortmetrics
+import sortlog
+from sortlog import LOG_FILE, setup_logging
+from dedup import DUPLICATE_POLICIES, Deduplicator, HashCache
+from exclusions import ExclusionRules
+from naming import COLLISION_POLICIES, DEFAULT_POLICY, NameRegistry
+from sortrules import RuleIndex
+
+ACTIONS = ["Переместить", "Копировать", "Переименовать", "Удалить"]
+ACTION_MAP = {
+    "Переместить": "move",
+    "Копировать": "copy",
+    "Переименовать": "rename",
+    "Удалить": "delete"
+}
+DEFAULT_CONFIG = {
+    "target_dirs": {
+        "Images": {"exts": [".jpg", ".png", ".gif"], "action": "Переместить"},
+        "Documents": {"exts": [".pdf", ".docx", ".txt"], "action": "Переместить"},
+        "Music": {"exts": [".mp3", ".wav"], "action": "Переместить"}
+    },
+    "source_dir": ""
+}
+DEFAULT_WORKERS = 4
+BATCH_SIZE = 64  # файлов одной целевой папки в одной задаче пула
+CONFIG_FILE = "config.json"
+
+
+# Файл и правило для него; target_dir равен None для удаления. dst задаётся,
+# когда путь назначения уже выбран (выполнение сохранённого плана)
+SortTask = namedtuple("SortTask", "src file_name folder action target_dir dst", defaults=(None,))
+# Итог по одному файлу: задача, фактический путь назначения, успех и
+# признак того, что файл оказался дубликатом (см. handle_duplicate)
+SortResult = namedtuple("SortResult", "task dst ok duplicate", defaults=(False,))
+# Итог запуска: processed -- файлы, над которыми выполнено действие;
+# duplicates -- пропущенные или обработанные как дубликаты (такой же файл
+# уже есть в целевой папке); failed -- ошибки
+RunStats = namedtuple("RunStats", "processed duplicates failed", defaults=(0, 0, 0))
+
+
+def total_stats(stats):
+    """Сумма итогов нескольких запусков (RunStats)."""
+    return RunStats(*(sum(values) for values in zip(RunStats(), *stats)))
+
+
+class _PrunedDirs:
+    """
+    Нормализованные пути целевых папок. У папки с полями даты это её
+    неизменная часть ("Archive" для "Archive/{year}"), а если поле даты
+    в первой же части пути ("{year}", "Photos_{year}") -- выражение для
+    имён папок в source_dir.
+    """
+    __slots__ = ("_paths", "_patterns")
+
+    def __init__(self, source_dir=None, folders=()):
+        self._paths = set()
+        self._patterns = {}
+        for folder in folders:
+            fixed, pattern = RuleIndex.folder_pattern(folder)
+            path = os.path.normcase(os.path.normpath(os.path.join(source_dir, fixed)))
+            if pattern is None or fixed:
+                self._paths.add(path)
+            else:
+                self._patterns.setdefault(path, []).append(pattern)
+
+    def __contains__(self, path):
+        if path in self._paths:
+            return True
+        patterns = self._patterns.get(os.path.dirname(path))
+        if patterns:
+            name = os.path.basename(path)
+            return any(pattern.fullmatch(name) for pattern in patterns)
+        return False
+
+
+def load_config(config_file=CONFIG_FILE):
+    """Прочитать конфигурацию; при отсутствии или ошибке создать файл по умолчанию."""
+    try:
+        with open(config_file, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        default_config = json.loads(json.dumps(DEFAULT_CONFIG))
+        save_config(default_config, config_file)
+        return default_config
+
+
+def save_config(config, config_file=CONFIG_FILE):
+    """
+    Записать конфигурацию атомарно: во временный файл в той же папке и
+    переименованием поверх старого. Читатель (в том числе другой экземпляр,
+    следящий за файлом, см. configwatch) видит либо старый, либо новый файл
+    целиком.
+    """
+    data = json.dumps(config, indent=4, ensure_ascii=False)
+    folder = os.path.dirname(os.path.abspath(config_file))
+    fd, tmp_path = tempfile.mkstemp(prefix=".config-", suffix=".tmp", dir=folder)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        with contextlib.suppress(OSError):
+            os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, config_file)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.unlink(tmp_path)
+        raise
+
+
+def config_stamp(config_file=CONFIG_FILE):
+    """Отметка версии файла конфигурации (inode, размер, mtime) или None, если файла нет."""
+    try:
+        st = os.stat(config_file)
+    except OSError:
+        return None
+    return st.st_ino, st.st_size, st.st_mtime_ns
+
+
+class SortEngine:
+    """
+    Сортировка файлов по правилам из конфигурации.
+
+    notify -- необязательная функция (title, message) для уведомлений об ошибках;
+    интерфейс передаёт сюда свой show_notification. metrics -- общий набор
+    метрик (для движков дополнительных папок, см. source_engines); без него
+    метрики настраиваются по разделу "metrics" конфигурации. io -- общий
+    iolimit.IOLimiter, без него создаётся свой по разделу "io".
+    """
+    def __init__(self, config, test_run=False, notify=None, metrics=None, io=None):
+        self.test_run = test_run
+        self.notify = notify
+        self._dedup = None
+        self._sniffer = None
+        self._metadata = None
+        self._auto_journal = None
+        self._auto_names = None
+        self._journal_lock = threading.Lock()
+        self._dedup_lock = threading.Lock()
+        # Пределы и приоритеты ввода-вывода (раздел "io"), общие с движками папок
+        self.io = io or iolimit.IOLimiter()
+        self.config = None
+        self.set_config(config)
+        if metrics is None:
+            self.metrics, self._metric_sinks = sortmetrics.from_config(self.config)
+        else:
+            self.metrics, self._metric_sinks = metrics, []
+        if io is None:
+            self.io.metrics = self.metrics
+
+    def source_engines(self):
+        """
+        Движки всех наблюдаемых папок: этот (если задан source_dir) и по
+        одному на элемент "sources" конфигурации. Элемент -- словарь с
+        "source_dir" и своими "target_dirs"; остальные ключи, если не заданы,
+        берутся из общей конфигурации. Метрики и пределы ввода-вывода у
+        движков общие.
+        """
+        engines = [self] if self.source_dir else []
+        for source_config in self.source_configs(self.config):
+            engines.append(SortEngine(source_config, self.test_run, self.notify, metrics=self.metrics, io=self.io))
+        return engines
+
+    @staticmethod
+    def source_configs(config):
+        """Конфигурации движков элементов "sources" (см. source_engines)."""
+        base = {key: value for key, value in config.items() if key != "sources"}
+        return [dict(base, **source) for source in config.get("sources", [])]
+
+    def reload_config(self, config, engines=()):
+        """
+        Подменить конфигурацию на ходу у этого движка и у движков его папок
+        engines (из source_engines) без перезапуска наблюдения и без
+        повторного обхода. Правила, исключения и прочие настройки действуют
+        со следующего файла. Набор наблюдаемых папок не меняется: новые и
+        удалённые папки требуют перезапуска.
+        """
+        watched = {engine.source_dir for engine in engines}
+        if self.source_dir in watched and config.get("source_dir", "") != self.source_dir:
+            logging.warning("Папка сортировки изменена в конфигурации; наблюдение за новой папкой начнётся после перезапуска.")
+            config = dict(config, source_dir=self.source_dir)
+        self.set_config(config)
+        by_dir = {source_config.get("source_dir", ""): source_config for source_config in self.source_configs(config)}
+        for engine in engines:
+            if engine is self:
+                continue
+            source_config = by_dir.pop(engine.source_dir, None)
+            if source_config is None:
+                logging.warning(f"Папки '{engine.source_dir}' больше нет в конфигурации; наблюдение за ней остановится после перезапуска.")
+                continue
+            engine.set_config(source_config)
+        for source_dir in by_dir.keys() - watched:
+            logging.warning(f"Новая папка '{source_dir}' в конфигурации; наблюдение за ней начнётся после перезапуска.")
+
+    def close(self):
+        """
+        Закрыть журнал авто-сортировки и кэш хэшей, остановить выгрузку
+        метрик (последние значения записываются).
+        """
+        self.close_auto_journal()
+        dedup, self._dedup = self._dedup, None
+        if dedup is not None:
+            dedup.cache.close()
+        sinks, self._metric_sinks = self._metric_sinks, []
+        for sink in sinks:
+            sink.close()
+
+    @property
+    def source_dir(self):
+        return self.config.get("source_dir", "")
+
+    @property
+    def recursive(self):
+        """Обходить ли вложенные папки (целевые папки правил пропускаются)."""
+        return bool(self.config.get("recursive", False))
+
+    @property
+    def copy_mode(self):
+        """Способ копирования: "copy" или "hardlink" (жёсткая ссылка на том же томе)."""
+        mode = self.config.get("copy_mode", "copy")
+        return mode if mode in fileops.COPY_MODES else "copy"
+
+    @property
+    def duplicate_policy(self):
+        """Что делать с дубликатами по содержимому: off, skip, hardlink или delete."""
+        policy = self.config.get("duplicates", "off")
+        return policy if policy in DUPLICATE_POLICIES else "off"
+
+    @property
+    def collision_policy(self):
+        """Что делать с занятым именем в целевой папке (см. naming)."""
+        policy = self.config.get("collisions", DEFAULT_POLICY)
+        return policy if policy in COLLISION_POLICIES else DEFAULT_POLICY
+
+    def name_registry(self, listed=True):
+        """Новый naming.NameRegistry по политике "collisions" конфигурации."""
+        policy = self.collision_policy
+        cache = self.dedup.cache if policy in ("hash", "skip") else None
+        return NameRegistry(policy, listed, cache)
+
+    @property
+    def dedup(self):
+        """Deduplicator, создаётся при первом обращении; кэш хэшей из "hash_cache"."""
+        if self._dedup is None:
+            with self._dedup_lock:
+                if self._dedup is None:
+                    self._dedup = Deduplicator(HashCache(self.config.get("hash_cache")))
+        return self._dedup
+
+    @property
+    def journal_dir(self):
+        """Папка журналов запусков; пустое значение отключает журнал."""
+        return self.config.get("journal_dir", journal.JOURNAL_DIR)
+
+    @property
+    def workers(self):
+        """Размер пула потоков для массовой сортировки (1 -- последовательно)."""
+        return max(1, int(self.config.get("workers", DEFAULT_WORKERS)))
+
+    def _notify(self, title, message):
+        if self.notify:
+            self.notify(title, message)
+
+    def set_config(self, config):
+        """Заменить конфигурацию и пересобрать индекс правил; при ошибке в правилах остаётся прежняя."""
+        previous, self.config = self.config, config
+        try:
+            self.reload_rules()
+        except Exception:
+            if previous is not None:
+                self.config = previous
+            raise
+
+    def reload_rules(self):
+        """
+        Собрать новые RuleIndex из target_dirs и ExclusionRules из "exclusions"
+        и подменить текущие присваиванием; идущие обходы и наблюдение
+        подхватывают их со следующего файла.
+        """
+        rules = RuleIndex(self.config.get("target_dirs", {}))
+        exclusions = ExclusionRules(self.config.get("exclusions"))
+        # Классификаторы path -> расширение для файлов, не подошедших по имени
+        classifiers = []
+        if self.config.get("sniff_content", False):
+            if self._sniffer is None:
+                from sniff import ContentSniffer
+                self._sniffer = ContentSniffer()
+            classifiers.append(self._sniffer)
+        if rules.metadata_rules and self._metadata is None:
+            from metadata import MetadataCache
+            self._metadata = MetadataCache()
+        self.rules, self.exclusions, self.classifiers = rules, exclusions, classifiers
+        self.io.configure(self.config.get("io"))
+        with self._journal_lock:  # sort_file может как раз выбирать имя
+            self._auto_names = None
+        self._pruned = (None, _PrunedDirs())
+        self.rules_version = hashlib.sha1(json.dumps(
+            [self.config.get("target_dirs", {}), self.recursive, self.config.get("exclusions"),
+             self.config.get("sniff_content", False)],
+            sort_keys=True, ensure_ascii=False
+        ).encode("utf-8")).hexdigest()
+
+    def open_index(self):
+        """
+        Открыть индекс состояния файлов из "state_index" конфигурации.
+        None, если индекс не настроен или включён тестовый режим.
+        """
+        db_path = self.config.get("state_index")
+        if not db_path or self.test_run:
+            return None
+        from fileindex import FileStateIndex
+        return FileStateIndex(db_path, self.rules_version)
+
+    def profile_run(self, name):
+        """Профилировать запуск, если в конфигурации задан "profile" (см. metrics.RunProfiler)."""
+        mode = self.config.get("profile")
+        if not mode:
+            return contextlib.nullcontext()
+        return sortmetrics.RunProfiler(mode, self.config.get("profile_dir", sortmetrics.PROFILE_DIR), name)
+
+    def open_journal(self, source_dir, kind="sort"):
+        """Новый журнал запуска или None в тестовом режиме и при отключённом журнале."""
+        if self.test_run or not self.journal_dir:
+            return None
+        return journal.RunJournal.create(self.journal_dir, source_dir, kind)
+
+    def close_journal(self, run_journal):
+        if run_journal is not None:
+            run_journal.close()
+            journal.prune_runs(self.journal_dir)
+
+    def close_auto_journal(self):
+        """
+        Закрыть журнал авто-сортировки и записать накопленные хэши
+        (вызывается при остановке наблюдения).
+        """
+        with self._journal_lock:
+            run_journal, self._auto_journal = self._auto_journal, None
+        self.close_journal(run_journal)
+        if self._dedup is not None:
+            self._dedup.cache.commit()
+
+    def pruned_dirs(self, source_dir):
+        """Целевые папки правил (проверка "путь in ...") -- их обход пропускается."""
+        cached_dir, pruned = self._pruned
+        if cached_dir != source_dir:
+            pruned = _PrunedDirs(source_dir, self.config.get("target_dirs", {}))
+            self._pruned = (source_dir, pruned)
+        return pruned
+
+    def accepts_path(self, path, source_dir=None, is_dir=False):
+        """
+        Лежит ли путь в области сортировки: непосредственно в source_dir, а в
+        рекурсивном режиме -- в любой вложенной папке, кроме целевых и
+        исключённых, и не исключён ли сам файл по шаблонам. Пороги размера и
+        возраста здесь не проверяются: файл может быть ещё не дописан.
+        С is_dir=True -- обходится ли вложенная папка path.
+        """
+        source_dir = source_dir or self.source_dir
+        rel = os.path.relpath(path, source_dir)
+        parts = rel.split(os.sep)
+        if parts[0] == os.pardir or os.path.isabs(rel):
+            return False
+        dirs = parts if is_dir else parts[:-1]
+        if dirs:
+            if not self.recursive:
+                return False
+            pruned = self.pruned_dirs(source_dir)
+            prefix = source_dir
+            for i, part in enumerate(dirs, 1):
+                prefix = os.path.join(prefix, part)
+                if self.is_excluded("/".join(parts[:i]), is_dir=True) or os.path.normcase(os.path.normpath(prefix)) in pruned:
+                    return False
+        return is_dir or not self.is_excluded("/".join(parts))
+
+    def classify(self, file_name):
+        """Вернуть (папка, действие) для файла или None, если правило не найдено."""
+        return self.rules.match(file_name)
+
+    def classify_content(self, path, rules=None):
+        """Правило по содержимому файла: классификаторы опрашиваются, пока один не даст известное расширение."""
+        rules = rules or self.rules
+        for classifier in self.classifiers:
+            ext = classifier(path)
+            if ext:
+                info = rules.match_extension(ext)
+                if info:
+                    return info
+        return None
+
+    @staticmethod
+    def relative_path(path, source_dir):
+        """Путь от source_dir через "/"; для файла вне source_dir -- только имя."""
+        try:
+            rel = os.path.relpath(path, source_dir) if source_dir else os.pardir
+        except ValueError:  # другой диск в Windows
+            rel = os.pardir
+        if rel.split(os.sep, 1)[0] == os.pardir:
+            return os.path.basename(path)
+        return rel.replace(os.sep, "/")
+
+    def is_excluded(self, rel_path, is_dir=False, st=None):
+        """
+        Исключён ли путь (относительно папки сортировки, через "/") по разделу
+        "exclusions"; с st файла проверяются и пороги размера и возраста.
+        """
+        exclusions = self.exclusions
+        if exclusions.excluded(rel_path, is_dir):
+            return True
+        return st is not None and not is_dir and exclusions.excluded_stat(st)
+
+    def make_task(self, src, file_name, source_dir, rules=None):
+        """Сопоставить файл с правилом; None, если файл не сортируется."""
+        rules = rules or self.rules
+        if rules.metadata_rules:
+            info = rules.match_metadata(file_name, self._metadata(src)) or rules.match(file_name)
+        else:
+            info = rules.match(file_name)
+        if not info:
+            info = self.classify_content(src, rules)
+        if not info:
+            return None
+        folder, action = info
+        target_dir = None if action == "Удалить" else os.path.join(source_dir, folder)
+        return SortTask(src, file_name, folder, action, target_dir)
+
+    @staticmethod
+    def destination_for(task):
+        """Окончательный путь назначения задачи (None для удаления)."""
+        if task.target_dir is None:
+            return None
+        if task.dst is not None:
+            return task.dst
+        file_name = task.file_name
+        if task.action == "Переименовать":
+            base, extn = os.path.splitext(file_name)
+            file_name = base + "_renamed" + extn
+        return os.path.join(task.target_dir, file_name)
+
+    def assign_destination(self, task, names, auto=False):
+        """
+        Закрепить за задачей свободное имя в целевой папке (names --
+        NameRegistry). Возвращает задачу с dst или SortResult, если такой же
+        файл в папке уже есть (политика "skip" или копирование) и файл не
+        трогается.
+        """
+        if task.target_dir is None or task.dst is not None:
+            return task
+        dst = self.destination_for(task)
+        name = names.reserve(task.target_dir, os.path.basename(dst), task.src, copy=task.action == "Копировать")
+        if name is None:
+            logging.info("Файл '%s' пропущен: такой же уже есть в '%s'%s", task.file_name, task.folder,
+                         ' (авто)' if auto else '', extra={"op": "duplicate", "src": task.src, "dst": dst})
+            return SortResult(task, dst, True, True)
+        return task._replace(dst=os.path.join(task.target_dir, name))
+
+    def execute(self, task, auto=False, names=None):
+        """
+        Выполнить задачу. Кроме политики "overwrite", файл назначения не
+        заменяется: если выбранное имя заняли мимо реестра names (другой
+        запуск или процесс), берётся следующее свободное.
+        """
+        dedup = self.dedup if task.target_dir and self.duplicate_policy != "off" else None
+        if dedup is not None:
+            with self.metrics.stage("dedup"):
+                duplicate = dedup.find(task.src, task.target_dir)
+            if duplicate:
+                return SortResult(task, duplicate, self.handle_duplicate(task, duplicate, auto), True)
+        dst = self.destination_for(task)
+        replace = self.collision_policy == "overwrite"
+        while True:
+            try:
+                ok = self.perform_action(task.src, dst, task.action, task.file_name, task.folder, auto, replace)
+                break
+            except FileExistsError as e:
+                if names is None:
+                    logging.error("Ошибка при обработке файла '%s': %s", task.file_name, e,
+                                  extra={"op": ACTION_MAP.get(task.action, task.action), "src": task.src, "dst": dst})
+                    self._notify("Ошибка", f"{task.file_name}: {str(e)}")
+                    return SortResult(task, dst, False)
+                names.taken_elsewhere(task.target_dir, os.path.basename(dst))
+                retry = self.assign_destination(task._replace(dst=None), names, auto)
+                if isinstance(retry, SortResult):
+                    return retry
+                task, dst = retry, retry.dst
+        if ok and dedup is not None and not self.test_run:
+            with self.metrics.stage("dedup"):
+                dedup.add(dst, task.target_dir)
+        return SortResult(task, dst, ok)
+
+    def handle_duplicate(self, task, duplicate, auto=False):
+        """
+        Обработать файл, содержимое которого уже есть в целевой папке.
+        Для копирования и политики skip файл не трогается; delete удаляет
+        исходный файл, hardlink заменяет его жёсткой ссылкой на найденный.
+        """
+        policy = self.duplicate_policy
+        name = os.path.basename(duplicate)
+        suffix = ' (авто)' if auto else ''
+        try:
+            if task.action == "Копировать" or policy == "skip":
+                logging.info("Файл '%s' пропущен: совпадает с '%s' в '%s'%s", task.file_name, name, task.folder, suffix,
+                             extra={"op": "duplicate", "src": task.src, "dst": duplicate})
+            elif policy == "delete":
+                if not self.test_run:
+                    os.remove(task.src)
+                logging.info("Файл '%s' удалён как дубликат '%s' в '%s'%s", task.file_name, name, task.folder, suffix,
+                             extra={"op": "duplicate-delete", "src": task.src, "dst": duplicate})
+            elif policy == "hardlink":
+                if not self.test_run:
+                    tmp = task.src + ".filesorter-link"
+                    os.link(duplicate, tmp)
+                    os.replace(tmp, task.src)
+                logging.info("Файл '%s' заменён ссылкой на дубликат '%s' в '%s'%s", task.file_name, name, task.folder, suffix,
+                             extra={"op": "duplicate-link", "src": task.src, "dst": duplicate})
+            return True
+        except Exception as e:
+            logging.error("Ошибка при обработке дубликата '%s': %s", task.file_name, e)
+            self._notify("Ошибка", f"{task.file_name}: {str(e)}")
+            return False
+
+    def _execute_batch(self, batch, auto, run_journal=None, names=None, priority=iolimit.BACKGROUND):
+        """
+        Выполнить пакет. С names (NameRegistry) сначала выбираются имена
+        назначения, чтобы журнал записал фактические пути; с журналом
+        намерение записывается до выполнения, итоги -- после. Работа идёт с
+        приоритетом ввода-вывода priority (см. iolimit).
+        """
+        with self.io.job(priority):
+            prepared = None
+            if names is not None:
+                with self.metrics.stage("naming"):
+                    prepared = [self.assign_destination(task, names, auto) for task in batch]
+                batch = [item for item in prepared if isinstance(item, SortTask)]
+            if run_journal is None or not batch:
+                results = [self.execute(task, auto, names) for task in batch]
+            else:
+                planned = [self.destination_for(task) for task in batch]
+                with self.metrics.stage("journal"):
+                    batch_id = run_journal.begin_batch([
+                        [ACTION_MAP.get(task.action, task.action), task.src, dst] for task, dst in zip(batch, planned)
+                    ])
+                results = [self.execute(task, auto, names) for task in batch]
+                # Фактические пути, если имя пришлось сменить при выполнении
+                dsts = [r.dst if r.ok and not r.duplicate else dst for r, dst in zip(results, planned)]
+                with self.metrics.stage("journal"):
+                    run_journal.end_batch(batch_id, [
+                        journal.DUPLICATE if r.duplicate else journal.OK if r.ok else journal.FAILED for r in results
+                    ], dsts if dsts != planned else None)
+            if names is not None and not names.listed:
+                for result in results:
+                    if result.task.dst is not None:
+                        names.release(result.task.target_dir, os.path.basename(result.task.dst))
+            if prepared is not None and len(batch) != len(prepared):
+                executed = iter(results)
+                results = [next(executed) if isinstance(item, SortTask) else item for item in prepared]
+            return results
+
+    def perform_action(self, src, dst, action, file_name, folder, auto=False, replace=True):
+        """
+        Выполнить действие над файлом и логировать результат.
+        Сообщение форматируется в потоке записи лога; при JSON-логе в запись
+        добавляются операция, пути, размер и длительность. replace=False --
+        не заменять dst: если он есть, FileExistsError передаётся вызывающему.
+        """
+        suffix = ' (авто)' if auto else ''
+        op = ACTION_MAP.get(action, action)
+        size = None
+        if sortlog.structured:
+            try:
+                size = os.stat(src).st_size
+            except OSError:
+                pass
+        if not self.test_run:
+            self.io.acquire_op()
+        started = time.perf_counter()
+        try:
+            if action == "Переместить":
+                if not self.test_run:
+                    fileops.move_file(src, dst, self.io.copy_throttle(), replace)
+                message, args = "Файл '%s' перемещён в '%s'%s", (file_name, folder, suffix)
+            elif action == "Копировать":
+                if not self.test_run:
+                    fileops.copy_file(src, dst, self.copy_mode, self.io.copy_throttle(), replace)
+                message, args = "Файл '%s' скопирован в '%s'%s", (file_name, folder, suffix)
+            elif action == "Переименовать":
+                if not self.test_run:
+                    fileops.move_file(src, dst, self.io.copy_throttle(), replace)
+                message, args = "Файл '%s' переименован и перемещён в '%s' как '%s'%s", (file_name, folder, os.path.basename(dst), suffix)
+            elif action == "Удалить":
+                if not self.test_run:
+                    os.remove(src)
+                message, args = "Файл '%s' удалён%s", (file_name, suffix)
+            else:
+                return True
+            finished = time.perf_counter()
+            metrics = self.metrics
+            metrics.observe("filesorter_action_seconds", finished - started, op=op)
+            logging.info(message, *args, extra={
+                "op": op, "src": src, "dst": dst, "bytes": size,
+                "duration": round(finished - started, 6)
+            })
+            metrics.add_time("log", time.perf_counter() - finished)
+            return True
+        except Exception as e:
+            if isinstance(e, FileExistsError) and not replace:
+                raise
+            logging.error("Ошибка при обработке файла '%s': %s", file_name, e, extra={"op": op, "src": src, "dst": dst})
+            self._notify("Ошибка", f"{file_name}: {str(e)}")
+            return False
+
+    def iter_files(self, source_dir, recursive=None, index=None):
+        """
+        Генератор os.DirEntry файлов source_dir без построения списков.
+
+        В рекурсивном режиме обход идёт в глубину по стеку путей папок;
+        одновременно открыт один дескриптор. Целевые папки правил, исключённые
+        папки и символические ссылки на папки не обходятся.
+        С индексом (FileStateIndex) неизменившиеся папки не читаются, а
+        известные неизменившиеся файлы не выдаются.
+        """
+        recursive = self.recursive if recursive is None else recursive
+        pruned = self.pruned_dirs(source_dir) if recursive else frozenset()
+        exclusions = self.exclusions
+        needs_stat = exclusions.needs_stat
+        now = time.time()
+        stack = [(source_dir, "")]  # (папка, её путь от source_dir с "/" на конце)
+        while stack:
+            current, rel = stack.pop()
+            try:
+                if index is not None:
+                    dir_mtime = os.stat(current).st_mtime_ns
+                    cached_subdirs = index.unchanged_subdirs(current, dir_mtime)
+                    if cached_subdirs is not None:
+                        if recursive:
+                            stack.extend((os.path.join(current, name), f"{rel}{name}/") for name in cached_subdirs)
+                        continue
+                    known = index.entries(current)
+                    seen = set()
+                    subdirs = []
+                with os.scandir(current) as entries:
+                    for entry in entries:
+                        if entry.is_file():
+                            if exclusions.excluded(rel + entry.name):
+                                continue
+                            if needs_stat and exclusions.excluded_stat(entry.stat(), now):
+                                if index is not None:
+                                    index.mark_incomplete(entry.path)  # порог может перестать действовать
+                                continue
+                            if index is not None:
+                                seen.add(entry.name)
+                                state = known.get(entry.name)
+                                if state is not None and state.inode == entry.inode():
+                                    if state.decision == index.NO_RULE and state.size is None:
+                                        continue
+                                    st = entry.stat()
+                                    if (st.st_size, st.st_mtime_ns) == (state.size, state.mtime_ns):
+                                        continue
+                            yield entry
+                        elif recursive and entry.is_dir(follow_symlinks=False):
+                            if exclusions.excluded(rel + entry.name, is_dir=True):
+                                continue
+                            if os.path.normcase(os.path.normpath(entry.path)) in pruned:
+                                continue
+                            stack.append((entry.path, f"{rel}{entry.name}/"))
+                            if index is not None:
+                                subdirs.append(entry.name)
+                if index is not None:
+                    index.listed_dir(current, dir_mtime, subdirs, known.keys() - seen)
+            except OSError as e:
+                if current == source_dir:
+                    raise
+                logging.error(f"Ошибка чтения папки '{current}': {str(e)}")
+
+    def iter_directory_tasks(self, source_dir, index=None):
+        """
+        Задачи для файлов source_dir в порядке обхода. Время обхода и
+        классификации считается раздельно: пока генератор ждёт на yield,
+        часы не идут. Правила читаются для каждого файла, так что подменённые
+        на ходу (reload_config) действуют со следующего файла.
+        """
+        metrics = self.metrics
+        entries = self.iter_files(source_dir, index=index)
+        clock = time.perf_counter
+        while True:
+            started = clock()
+            entry = next(entries, None)
+            scanned = clock()
+            metrics.add_time("scan", scanned - started)
+            if entry is None:
+                return
+            task = self.make_task(entry.path, entry.name, source_dir)
+            metrics.add_time("classify", clock() - scanned)
+            if task:
+                yield task
+            elif index is not None:
+                if self.rules.time_dependent:
+                    index.mark_incomplete(entry.path)  # файл может дорасти до условия по возрасту
+                elif self.classifiers or self.rules.metadata_rules:
+                    # Решение зависело от содержимого: при правке файла его нужно пересмотреть
+                    st = entry.stat()
+                    index.record(entry.path, entry.inode(), st.st_size, st.st_mtime_ns, index.NO_RULE)
+                else:
+                    index.record(entry.path, entry.inode(), None, None, index.NO_RULE)
+
+    @staticmethod
+    def _record_result(index, result):
+        """Обновить индекс по итогу действия над файлом."""
+        src = result.task.src
+        if not result.ok:
+            index.mark_incomplete(src)
+        elif result.task.action == "Копировать":
+            try:
+                st = os.stat(src)
+            except OSError:
+                index.forget(src)
+            else:
+                index.record(src, st.st_ino, st.st_size, st.st_mtime_ns, result.task.action)
+        else:
+            index.forget(src)
+
+    def run_tasks(self, tasks, progress=None, auto=False, workers=None, run_journal=None, priority=iolimit.BACKGROUND):
+        """
+        Выполнить задачи и вернуть итог (RunStats).
+
+        При workers > 1 задачи группируются по целевой папке и выполняются в
+        пуле потоков. Пакет отправляется, когда в нём BATCH_SIZE файлов или
+        когда у пула есть свободные потоки, так что результаты идут потоком;
+        в работе не больше 2*workers пакетов. Каждая папка создаётся один раз.
+        progress(done, result) вызывается в потоке вызывающего для каждого
+        файла в порядке отправки. С журналом (RunJournal) последовательный
+        режим тоже идёт пакетами, чтобы fsync делался раз на пакет.
+        priority -- приоритет ввода-вывода запуска (iolimit.INTERACTIVE или
+        BACKGROUND): интерактивный запуск вытесняет фоновые, пока идёт.
+        """
+        with self.io.job(priority):
+            workers = self.workers if workers is None else max(1, workers)
+            metrics = self.metrics
+            names = self.name_registry()
+            created_dirs = set()
+            processed = duplicates = failed = 0
+            done = 0
+
+            def ensure_dir(target_dir):
+                if target_dir and target_dir not in created_dirs and not self.test_run:
+                    with metrics.stage("makedirs"):
+                        os.makedirs(target_dir, exist_ok=True)
+                    created_dirs.add(target_dir)
+
+            def report(results):
+                nonlocal processed, duplicates, failed, done
+                for result in results:
+                    done += 1
+                    if result.duplicate:
+                        duplicates += 1
+                    elif result.ok:
+                        processed += 1
+                    else:
+                        failed += 1
+                    metrics.inc("filesorter_files_total", result="duplicate" if result.duplicate else "ok" if result.ok else "failed")
+                    if progress:
+                        progress(done, result)
+
+            if workers == 1:
+                batch_size = BATCH_SIZE if run_journal is not None else 1
+                batch = []
+                for task in tasks:
+                    ensure_dir(task.target_dir)
+                    batch.append(task)
+                    if len(batch) >= batch_size:
+                        report(self._execute_batch(batch, auto, run_journal, names, priority))
+                        batch = []
+                if batch:
+                    report(self._execute_batch(batch, auto, run_journal, names, priority))
+                return RunStats(processed, duplicates, failed)
+
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="sort") as pool:
+                pending = deque()
+                batches = {}
+                for task in tasks:
+                    ensure_dir(task.target_dir)
+                    key = (task.target_dir, task.action)
+                    batch = batches.setdefault(key, [])
+                    batch.append(task)
+                    if len(batch) >= BATCH_SIZE or len(pending) < workers:
+                        pending.append(pool.submit(self._execute_batch, batches.pop(key), auto, run_journal, names, priority))
+                    while pending and (len(pending) > 2 * workers or pending[0].done()):
+                        report(pending.popleft().result())
+                    metrics.gauge("filesorter_pool_pending_batches", len(pending))
+                for batch in batches.values():
+                    pending.append(pool.submit(self._execute_batch, batch, auto, run_journal, names, priority))
+                while pending:
+                    report(pending.popleft().result())
+                metrics.gauge("filesorter_pool_pending_batches", 0)
+            if self._dedup is not None:
+                self._dedup.cache.commit()
+            return RunStats(processed, duplicates, failed)
+
+    def sort_directory(self, source_dir=None, progress=None):
+        """Сортировка всех файлов в папке; возвращает итог (RunStats)."""
+        source_dir = source_dir or self.source_dir
+        if not source_dir or not os.path.exists(source_dir):
+            raise FileNotFoundError("Папка для сортировки не указана или не существует!")
+        run_journal = self.open_journal(source_dir)
+        try:
+            with self.profile_run("sort"), self.metrics.timer("filesorter_run_seconds", histogram=True, kind="sort"):
+                index = self.open_index()
+                if index is None:
+                    return self.run_tasks(self.iter_directory_tasks(source_dir), progress, run_journal=run_journal)
+                with index:
+                    def on_result(done, result):
+                        self._record_result(index, result)
+                        if progress:
+                            progress(done, result)
+                    return self.run_tasks(self.iter_directory_tasks(source_dir, index), on_result, run_journal=run_journal)
+        finally:
+            self.close_journal(run_journal)
+
+    def sort_file(self, file_path, auto=False):
+        """
+        Сортировка одного файла (для авто-сортировки).
+        Возвращает действие, если оно выполнено, иначе None (в том числе
+        для дубликата, который уже есть в целевой папке).
+        """
+        source_dir = self.source_dir
+        if not self.accepts_path(file_path, source_dir):
+            return None
+        file_name = os.path.basename(file_path)
+        if self.exclusions.needs_stat:
+            try:
+                if self.exclusions.excluded_stat(os.stat(file_path)):
+                    return None
+            except FileNotFoundError:
+                return None
+        task = self.make_task(file_path, file_name, source_dir)
+        if not task:
+            return None
+        if task.target_dir and not self.test_run:
+            os.makedirs(task.target_dir, exist_ok=True)
+        with self._journal_lock:
+            if self._auto_journal is None:
+                self._auto_journal = self.open_journal(source_dir, "auto")
+            run_journal = self._auto_journal
+            names = self._auto_names
+            if names is None:
+                names = self._auto_names = self.name_registry(listed=False)
+        result = self._execute_batch([task], auto, run_journal, names)[0]
+        if result.ok and not result.duplicate:
+            return task.action
+        return None
+
+    def sort_paths(self, files, progress=None, priority=iolimit.INTERACTIVE):
+        """
+        Сортировка списка файлов; целевые папки создаются в source_dir. По
+        умолчанию это интерактивное задание: оно не ограничивается разделом
+        "io" и приостанавливает фоновые (см. iolimit).
+        """
+        source_dir = self.source_dir
+
+        def tasks():
+            needs_stat = self.exclusions.needs_stat
+            for file_path in files:
+                file_name = os.path.basename(file_path)
+                try:
+                    if self.is_excluded(self.relative_path(file_path, source_dir),
+                                        st=os.stat(file_path) if needs_stat else None):
+                        continue
+                except FileNotFoundError:
+                    continue
+                task = self.make_task(file_path, file_name, source_dir)
+                if task:
+                    yield task
+        run_journal = self.open_journal(source_dir, "selected")
+        try:
+            with self.profile_run("selected"), self.metrics.timer("filesorter_run_seconds", histogram=True, kind="selected"):
+                return self.run_tasks(tasks(), progress, run_journal=run_journal, priority=priority)
+        finally:
+            self.close_journal(run_journal)
+
+    def run_plan(self, plan, progress=None):
+        """
+        Выполнить сохранённый план (planner.Plan) ровно как он составлен:
+        пути назначения берутся из плана. Файлы, изменившиеся или исчезнувшие
+        после планирования, и записи с конфликтами пропускаются, как и
+        записи, место назначения которых с тех пор заняли (если его займут
+        во время выполнения, берётся следующее свободное имя).
+        """
+        overwrite = self.collision_policy == "overwrite"
+
+        def tasks():
+            for entry in plan.entries:
+                if entry.problem:
+                    logging.warning("Файл '%s' пропущен: %s", entry.src, plan.describe(entry.problem))
+                    continue
+                try:
+                    st = os.stat(entry.src)
+                except OSError:
+                    logging.warning("Файл '%s' из плана не найден, пропущен", entry.src)
+                    continue
+                if (st.st_size, st.st_mtime_ns) != (entry.size, entry.mtime_ns):
+                    logging.warning("Файл '%s' изменился после планирования, пропущен", entry.src)
+                    continue
+                if entry.dst and not overwrite and os.path.lexists(entry.dst):
+                    logging.warning("Файл '%s' пропущен: '%s' появился после планирования", entry.src, entry.dst)
+                    continue
+                target_dir = os.path.dirname(entry.dst) if entry.dst else None
+                yield SortTask(entry.src, os.path.basename(entry.src), entry.folder, entry.action, target_dir, entry.dst)
+        run_journal = self.open_journal(plan.source_dir, "plan")
+        try:
+            with self.profile_run("plan"), self.metrics.timer("filesorter_run_seconds", histogram=True, kind="plan"):
+                return self.run_tasks(tasks(), progress, run_journal=run_journal)
+        finally:
+            self.close_journal(run_journal)
+
+    def summary(self, stats):
+        """Итоговое сообщение по RunStats."""
+        msg = f"Обработано {stats.processed} файлов!"
+        if stats.duplicates:
+            msg += f" Пропущено как уже имеющиеся: {stats.duplicates}."
+        if stats.failed:
+            msg += f" Ошибок: {stats.failed}."
+        return f"(Тест) {msg}" if self.test_run else msg
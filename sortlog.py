@@ -0,0 +1,89 @@
+"""
+Неблокирующее логирование с ротацией.
+
+Вызов logging.info на горячем пути только кладёт запись в очередь;
+форматирование и запись в файл делает отдельный поток QueueListener.
+Файл ротируется по размеру ("log_max_bytes") или по времени
+("log_rotate_when", например "midnight"). При "log_format": "json" строки
+пишутся в формате JSON lines с полями операции (op, src, dst, bytes,
+duration), если они переданы через extra.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import time
+
+LOG_FILE = "file_sorter.log"
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_BACKUPS = 5
+STRUCTURED_FIELDS = ("op", "src", "dst", "bytes", "duration")
+
+# Включён ли JSON-формат: движок измеряет размер файлов только в этом случае
+structured = False
+_listener = None
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Кладёт запись в очередь как есть: сообщение форматируется в потоке записи."""
+    def prepare(self, record):
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        data = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created)) + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "message": record.getMessage(),
+        }
+        for field in STRUCTURED_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                data[field] = value
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False)
+
+
+def _file_handler(filename, config):
+    when = config.get("log_rotate_when")
+    backups = int(config.get("log_backups", LOG_BACKUPS))
+    if when:
+        return logging.handlers.TimedRotatingFileHandler(filename, when=when, backupCount=backups, encoding="utf-8")
+    return logging.handlers.RotatingFileHandler(
+        filename, maxBytes=int(config.get("log_max_bytes", LOG_MAX_BYTES)), backupCount=backups, encoding="utf-8"
+    )
+
+
+def setup_logging(filename=LOG_FILE, config=None):
+    """Настроить корневой логгер на очередь и запустить поток записи (повторный вызов перенастраивает)."""
+    global structured, _listener
+    config = config or {}
+    stop_logging()
+    handler = _file_handler(filename, config)
+    structured = config.get("log_format") == "json"
+    handler.setFormatter(JsonFormatter() if structured else logging.Formatter(LOG_FORMAT))
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    for old in [h for h in root.handlers if isinstance(h, _DeferredQueueHandler)]:
+        root.removeHandler(old)
+    root.addHandler(_DeferredQueueHandler(log_queue))
+    root.setLevel(logging.INFO)
+    _listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+    _listener.start()
+
+
+def stop_logging():
+    """Дописать очередь и закрыть файл лога."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+atexit.register(stop_logging)
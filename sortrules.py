@@ -0,0 +1,281 @@
+"""
+Скомпилированный индекс правил сортировки.
+
+Правило в target_dirs может содержать:
+    "exts"     -- расширения, в том числе составные (".tar.gz");
+    "patterns" -- glob-шаблоны имени ("backup_*.zip") или регулярные
+                  выражения с префиксом "re:" ("re:IMG_\\d+\\.jpe?g").
+Регистр не учитывается. Шаблоны проверяются раньше расширений и в порядке
+конфигурации; среди расширений выигрывает самое длинное.
+
+Правило с условиями по метаданным файла (см. metadata):
+    "min_size", "max_size" -- границы размера в байтах;
+    "min_age", "max_age"   -- границы возраста по mtime в секундах;
+    "mime"                 -- MIME-типы, можно с "*" ("image/*");
+    "date"                 -- "exif" или "mtime" (по умолчанию): откуда
+                              брать дату для полей {year}, {month}, {day}
+                              в имени папки ("Archive/{year}/{month}").
+Без "exts" и "patterns" такое правило подходит к любому имени. Правила с
+условиями или полями даты проверяются раньше остальных, в порядке
+конфигурации; выигрывает первое подошедшее. Прочие фигурные скобки в имени
+папки ("Photos {old}") остаются как есть. Если их нет, поиск по имени
+остаётся прежним и метаданные не читаются.
+"""
+import fnmatch
+import re
+import time
+
+DEFAULT_ACTION = "Переместить"
+REGEX_PREFIX = "re:"
+# Равнозначные написания расширений для match_extension
+EXTENSION_ALIASES = {
+    ".jpg": (".jpeg",), ".jpeg": (".jpg",), ".tiff": (".tif",), ".tif": (".tiff",),
+    ".html": (".htm",), ".htm": (".html",), ".mp4": (".m4v",),
+}
+CONDITION_KEYS = ("min_size", "max_size", "min_age", "max_age", "mime")
+TEMPLATE_FIELDS = ("year", "month", "day")
+_TEMPLATE_FIELD = re.compile(r"\{(year|month|day)\}")
+# Чем поле даты становится в имени папки -- для распознавания таких папок при обходе
+_FIELD_PATTERNS = {"year": r"\d{4}", "month": r"\d{2}", "day": r"\d{2}"}
+
+
+def normalize_ext(ext):
+    """Привести расширение к виду '.ext' в нижнем регистре."""
+    ext = ext.strip().lower()
+    if ext and not ext.startswith("."):
+        ext = "." + ext
+    return ext
+
+
+_DEFAULT_FLAGS = re.compile("", re.IGNORECASE).flags
+# Глобальные флаги допустимы только в начале выражения, в объединение такое не встроить
+_GLOBAL_FLAGS = re.compile(r"\(\?[aiLmsux]+\)")
+
+
+def _pattern_to_regex(pattern, folder):
+    """Выражение шаблона и оно же скомпилированное; ошибка указывает на правило."""
+    regex = pattern[len(REGEX_PREFIX):] if pattern.startswith(REGEX_PREFIX) else fnmatch.translate(pattern)
+    try:
+        return regex, re.compile(regex, re.IGNORECASE)
+    except re.error as e:
+        raise ValueError(f"Ошибка в шаблоне '{pattern}' правила '{folder}': {str(e)}") from e
+
+
+class _PatternSet:
+    """
+    Шаблоны имён в порядке конфигурации -> значение первого подошедшего;
+    entries -- (шаблон, папка правила, значение). Подряд идущие простые
+    шаблоны объединяются в одно выражение. Отдельно проверяются выражения
+    со своими группами или обратными ссылками ("re:(a)\\1") -- чтобы
+    нумерация групп не сбивалась -- и с флагами ("re:(?s)...").
+    """
+    __slots__ = ("_segments", "_count")
+
+    def __init__(self, entries):
+        segments = []
+        merged = []  # (regex, значение) текущего объединяемого участка
+
+        def flush():
+            if merged:
+                groups = {f"r{i}": value for i, (_, value) in enumerate(merged)}
+                regex = "|".join(f"(?P<r{i}>{regex})" for i, (regex, _) in enumerate(merged))
+                segments.append((re.compile(regex, re.IGNORECASE), groups, None))
+                merged.clear()
+        for pattern, folder, value in entries:
+            regex, compiled = _pattern_to_regex(pattern, folder)
+            if compiled.groups or compiled.flags != _DEFAULT_FLAGS or _GLOBAL_FLAGS.match(regex):
+                flush()
+                segments.append((compiled, None, value))
+            else:
+                merged.append((regex, value))
+        flush()
+        self._segments = tuple(segments)
+        self._count = len(entries)
+
+    def __len__(self):
+        return self._count
+
+    def match(self, file_name):
+        for compiled, groups, value in self._segments:
+            m = compiled.fullmatch(file_name)
+            if m:
+                return value if groups is None else groups[m.lastgroup]
+        return None
+
+
+def _template_fields(folder):
+    """Поля даты в имени папки; остальные фигурные скобки -- часть имени."""
+    return set(_TEMPLATE_FIELD.findall(folder))
+
+
+def _is_metadata_rule(folder, info):
+    return isinstance(info, dict) and (
+        any(info.get(key) is not None for key in CONDITION_KEYS) or bool(_template_fields(folder))
+    )
+
+
+class _MetadataRule:
+    """Правило с условиями: сначала имя, затем stat, содержимое и дата -- по возрастанию цены."""
+    __slots__ = ("folder", "action", "_exts", "_pattern", "min_size", "max_size", "min_age", "max_age",
+                 "_mime", "date", "_templated")
+
+    def __init__(self, folder, info):
+        self.folder = folder
+        self.action = info.get("action", DEFAULT_ACTION)
+        self._exts = tuple(filter(None, (normalize_ext(ext) for ext in info.get("exts", []))))
+        patterns = info.get("patterns", [])
+        self._pattern = _PatternSet([(pattern, folder, True) for pattern in patterns]) if patterns else None
+        self.min_size = info.get("min_size")
+        self.max_size = info.get("max_size")
+        self.min_age = info.get("min_age")
+        self.max_age = info.get("max_age")
+        mime = info.get("mime")
+        if isinstance(mime, str):
+            mime = [mime]
+        self._mime = re.compile("|".join(fnmatch.translate(m.lower()) for m in mime)) if mime else None
+        self.date = info.get("date", "mtime")
+        if self.date not in ("mtime", "exif"):
+            raise ValueError(f"Неизвестный источник даты в правиле '{folder}': {self.date}")
+        self._templated = bool(_template_fields(folder))
+
+    @property
+    def time_dependent(self):
+        return self.min_age is not None or self.max_age is not None
+
+    def matches_name(self, file_name):
+        if not self._exts and self._pattern is None:
+            return True
+        if self._pattern is not None and self._pattern.match(file_name):
+            return True
+        return bool(self._exts) and file_name.lower().endswith(self._exts)
+
+    def matches(self, meta, now):
+        if self.min_size is not None or self.max_size is not None:
+            size = meta.size
+            if size is None:
+                return False
+            if self.min_size is not None and size < self.min_size:
+                return False
+            if self.max_size is not None and size > self.max_size:
+                return False
+        if self.time_dependent:
+            age = meta.age(now)
+            if age is None:
+                return False
+            if self.min_age is not None and age < self.min_age:
+                return False
+            if self.max_age is not None and age > self.max_age:
+                return False
+        if self._mime is not None:
+            mime = meta.mime
+            if mime is None or not self._mime.fullmatch(mime.lower()):
+                return False
+        return True
+
+    def folder_for(self, meta):
+        """Имя папки с подставленной датой файла или None, если даты нет."""
+        if not self._templated:
+            return self.folder
+        date = meta.date(self.date)
+        if date is None:
+            return None
+        values = {"year": f"{date.tm_year:04d}", "month": f"{date.tm_mon:02d}", "day": f"{date.tm_mday:02d}"}
+        return _TEMPLATE_FIELD.sub(lambda m: values[m.group(1)], self.folder)
+
+
+class RuleIndex:
+    """
+    Неизменяемый индекс: имя файла -> (папка, действие) за один поиск.
+
+    Строится один раз при загрузке или сохранении настроек; для обновления
+    правил создаётся новый индекс и подменяется целиком.
+    """
+    __slots__ = ("_exts", "_max_parts", "_patterns", "metadata_rules", "time_dependent")
+
+    def __init__(self, target_dirs):
+        exts = {}
+        pattern_rules = []
+        metadata_rules = []
+        for folder, info in target_dirs.items():
+            if _is_metadata_rule(folder, info):
+                metadata_rules.append(_MetadataRule(folder, info))
+                continue
+            ext_list = info.get("exts", []) if isinstance(info, dict) else info
+            action = info.get("action", DEFAULT_ACTION) if isinstance(info, dict) else DEFAULT_ACTION
+            for ext in ext_list:
+                ext = normalize_ext(ext)
+                if ext:
+                    exts[ext] = (folder, action)
+            patterns = info.get("patterns", []) if isinstance(info, dict) else []
+            for pattern in patterns:
+                pattern_rules.append((pattern, folder, (folder, action)))
+        self._exts = exts
+        self._max_parts = max((ext.count(".") for ext in exts), default=1)
+        self._patterns = _PatternSet(pattern_rules) if pattern_rules else None
+        # Пустой кортеж, если правил с условиями нет: тогда make_task их не касается
+        self.metadata_rules = tuple(metadata_rules)
+        # Решение по файлу может измениться без изменения файла (условия по возрасту)
+        self.time_dependent = any(rule.time_dependent for rule in metadata_rules)
+
+    def __len__(self):
+        return len(self._exts) + (len(self._patterns) if self._patterns else 0) + len(self.metadata_rules)
+
+    @staticmethod
+    def folder_pattern(folder):
+        """
+        Папки, в которые пишет правило: (неизменная часть пути, выражение
+        для следующей части или None). Для "Archive/{year}/{month}" это
+        "Archive" и выражение, под которое подходит "2024"; для
+        "Photos_{year}" -- "" и "Photos_2024"; без полей даты -- (folder, None).
+        """
+        parts = re.split(r"[/\\]", folder)
+        for i, part in enumerate(parts):
+            if _TEMPLATE_FIELD.search(part):
+                pieces = _TEMPLATE_FIELD.split(part)  # литералы и имена полей вперемешку
+                regex = "".join(_FIELD_PATTERNS[piece] if n % 2 else re.escape(piece) for n, piece in enumerate(pieces))
+                return "/".join(parts[:i]), re.compile(regex, re.IGNORECASE)
+        return folder, None
+
+    def match_metadata(self, file_name, meta, now=None):
+        """
+        Вернуть (папка, действие) по правилам с условиями или None; meta --
+        metadata.FileMetadata файла, поля которого читаются только при
+        совпадении имени.
+        """
+        now = time.time() if now is None else now
+        for rule in self.metadata_rules:
+            if rule.matches_name(file_name) and rule.matches(meta, now):
+                folder = rule.folder_for(meta)
+                if folder is not None:
+                    return folder, rule.action
+        return None
+
+    def match_extension(self, ext):
+        """Вернуть (папка, действие) для расширения вида '.ext' (с учётом синонимов) или None."""
+        info = self._exts.get(ext)
+        if info is None:
+            for alias in EXTENSION_ALIASES.get(ext, ()):
+                info = self._exts.get(alias)
+                if info is not None:
+                    break
+        return info
+
+    def match(self, file_name):
+        """Вернуть (папка, действие) для имени файла или None."""
+        if self._patterns is not None:
+            info = self._patterns.match(file_name)
+            if info:
+                return info
+        name = file_name.lower()
+        # Как os.path.splitext: ведущие точки (".bashrc") не считаются расширением
+        stem_start = len(name) - len(name.lstrip("."))
+        best = None
+        i = name.rfind(".")
+        for _ in range(self._max_parts):
+            if i <= stem_start:
+                break
+            info = self._exts.get(name[i:])
+            if info:
+                best = info
+            i = name.rfind(".", 0, i)
+        return best
@@ -0,0 +1,57 @@
+import os
+import threading
+import time
+
+from autosort import StableFileQueue, WatchSource
+
+SETTLE = 0.2
+
+
+def _queue(delivered):
+    event = threading.Event()
+
+    def callback(path):
+        delivered.append(path)
+        event.set()
+    file_queue = StableFileQueue(workers=1, settle_time=SETTLE)
+    file_queue.start()
+    return file_queue, WatchSource("", callback), event
+
+
+def test_old_mtime_is_not_settled_immediately(tmp_path):
+    path = tmp_path / "copy.bin"
+    path.write_bytes(b"x")
+    old = time.time() - 3600
+    os.utime(path, (old, old))  # как после cp -p
+    delivered = []
+    file_queue, source, event = _queue(delivered)
+    try:
+        file_queue.put(str(path), source)
+        time.sleep(SETTLE * 1.5)
+        assert delivered == []  # одна проверка -- ещё не готов
+        assert event.wait(SETTLE * 10)
+        assert delivered == [str(path)]
+    finally:
+        file_queue.stop()
+        file_queue.join(1)
+
+
+def test_growing_file_with_preserved_mtime_waits(tmp_path):
+    path = tmp_path / "growing.bin"
+    old = time.time() - 3600
+    path.write_bytes(b"x")
+    os.utime(path, (old, old))
+    delivered = []
+    file_queue, source, event = _queue(delivered)
+    try:
+        file_queue.put(str(path), source)
+        for i in range(4):
+            time.sleep(SETTLE * 0.9)
+            with open(path, "ab") as f:
+                f.write(b"x" * 1024)
+            os.utime(path, (old, old))
+        assert delivered == []
+        assert event.wait(SETTLE * 10)
+    finally:
+        file_queue.stop()
+        file_queue.join(1)
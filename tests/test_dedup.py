@@ -0,0 +1,38 @@
+import sqlite3
+
+import dedup
+from sortengine import SortEngine
+
+
+def _rows(db_path):
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute("SELECT COUNT(*) FROM hashes").fetchone()[0]
+
+
+def test_auto_sorted_duplicates_persist_hashes(tmp_path):
+    src = tmp_path / "src"
+    (src / "Docs").mkdir(parents=True)
+    db_path = str(tmp_path / "hashes.db")
+    engine = SortEngine({
+        "source_dir": str(src), "journal_dir": "", "duplicates": "skip", "hash_cache": db_path,
+        "target_dirs": {"Docs": {"exts": [".txt"]}},
+    })
+    for i in range(3):
+        (src / "Docs" / f"{i}.txt").write_text(f"content {i}")
+        (src / f"copy{i}.txt").write_text(f"content {i}")
+        engine.sort_file(str(src / f"copy{i}.txt"), auto=True)
+    engine.close_auto_journal()
+    assert _rows(db_path) > 0
+    engine.close()
+    assert _rows(db_path) > 0
+
+
+def test_cache_commits_by_time(tmp_path, monkeypatch):
+    monkeypatch.setattr(dedup, "COMMIT_INTERVAL", 0)
+    db_path = str(tmp_path / "hashes.db")
+    path = tmp_path / "a.bin"
+    path.write_bytes(b"x" * 10)
+    cache = dedup.HashCache(db_path)
+    cache.get(str(path), path.stat())
+    assert _rows(db_path) == 1  # без commit, close и COMMIT_EVERY записей
+    cache.close()
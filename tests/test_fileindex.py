@@ -0,0 +1,57 @@
+import os
+import time
+
+from sortengine import SortEngine
+
+
+def _engine(tmp_path, action="Копировать"):
+    src = tmp_path / "src"
+    src.mkdir(exist_ok=True)
+    config = {
+        "source_dir": str(src), "journal_dir": "", "state_index": str(tmp_path / "index.db"),
+        "target_dirs": {"Docs": {"exts": [".txt"], "action": action}},
+    }
+    return SortEngine(config), src
+
+
+def test_copied_file_edited_in_place_is_copied_again(tmp_path):
+    engine, src = _engine(tmp_path)
+    doc = src / "a.txt"
+    doc.write_text("one")
+    assert engine.sort_directory().processed == 1
+    dir_mtime = os.stat(src).st_mtime_ns
+    assert engine.sort_directory().processed == 0  # без изменений ничего не копируется
+
+    with open(doc, "a") as f:  # правка на месте: mtime папки не меняется
+        f.write(" two")
+    later = time.time() + 5
+    os.utime(doc, (later, later))
+    assert os.stat(src).st_mtime_ns == dir_mtime
+    assert engine.sort_directory().processed == 1
+    copies = sorted(p.read_text() for p in (src / "Docs").iterdir())
+    assert "one two" in copies
+
+
+def test_unchanged_directory_without_sorted_files_is_not_listed(tmp_path, monkeypatch):
+    engine, src = _engine(tmp_path)
+    (src / "skip.bin").write_bytes(b"x")
+    assert engine.sort_directory().processed == 0
+    listed = []
+    real_scandir = os.scandir
+    monkeypatch.setattr(os, "scandir", lambda path: listed.append(path) or real_scandir(path))
+    assert engine.sort_directory().processed == 0
+    assert str(src) not in listed
+
+
+def test_sniffed_file_edited_in_place_is_reclassified(tmp_path):
+    engine, src = _engine(tmp_path, action="Переместить")
+    engine.set_config(dict(engine.config, sniff_content=True,
+                           target_dirs={"Docs": {"exts": [".pdf"], "action": "Переместить"}}))
+    blob = src / "scan"
+    blob.write_bytes(b"not yet")
+    assert engine.sort_directory().processed == 0
+    blob.write_bytes(b"%PDF-1.4 now a document")  # папка не меняется
+    later = time.time() + 5
+    os.utime(blob, (later, later))
+    assert engine.sort_directory().processed == 1
+    assert (src / "Docs" / "scan").exists()
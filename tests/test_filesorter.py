@@ -0,0 +1,25 @@
+import time
+
+import filesorter
+from sortengine import SortEngine
+
+
+def test_watch_sorts_files_arriving_during_initial_sweep(tmp_path):
+    src = tmp_path / "src"
+    src.mkdir()
+    engine = SortEngine({
+        "source_dir": str(src), "journal_dir": "", "watch_mode": "poll", "poll_interval": 0.05,
+        "poll_max_interval": 0.05, "settle_time": 0.1,
+        "target_dirs": {"Docs": {"exts": [".txt"]}},
+    })
+    (src / "old.txt").write_text("old")
+
+    def initial():
+        engine.sort_directory()
+        (src / "new.txt").write_text("new")  # появился, пока шёл обход
+        deadline = time.monotonic() + 5
+        while not (src / "Docs" / "new.txt").exists() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        raise KeyboardInterrupt
+    filesorter.run_watch(engine, [engine], initial=initial)
+    assert sorted(p.name for p in (src / "Docs").iterdir()) == ["new.txt", "old.txt"]
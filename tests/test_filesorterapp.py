@@ -0,0 +1,34 @@
+import queue
+
+import pytest
+
+filesorterapp = pytest.importorskip("filesorterapp")
+
+
+class _Root:
+    def __init__(self):
+        self.scheduled = []
+
+    def after(self, ms, func):
+        self.scheduled.append(func)
+
+
+class _App:
+    _poll_ui_queue = filesorterapp.FileSorterApp._poll_ui_queue
+
+    def __init__(self):
+        self.ui_queue = queue.Queue()
+        self.root = _Root()
+
+
+def test_failing_ui_callback_keeps_queue_polling():
+    app = _App()
+    calls = []
+
+    def broken():
+        raise OSError("только для чтения")
+    app.ui_queue.put((broken, ()))
+    app.ui_queue.put((calls.append, ("Готово",)))
+    app._poll_ui_queue()
+    assert calls == ["Готово"]
+    assert app.root.scheduled == [app._poll_ui_queue]
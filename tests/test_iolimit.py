@@ -0,0 +1,45 @@
+import errno
+import os
+
+import fileops
+from iolimit import BACKGROUND, INTERACTIVE, IOLimiter
+
+
+def test_copy_throttle_only_with_limit_or_interactive_job():
+    io = IOLimiter()
+    assert io.copy_throttle() is None
+    with io.job(BACKGROUND):
+        assert io.copy_throttle() is None  # без раздела "io" -- копирование целиком
+        with io.job(INTERACTIVE):
+            pass
+    io._interactive = 1  # интерактивное задание в другом потоке
+    with io.job(BACKGROUND):
+        assert io.copy_throttle() is not None
+    io._interactive = 0
+
+    io.configure({"bandwidth": 10 * 1024 * 1024})
+    assert io.copy_throttle() is None
+    with io.job(INTERACTIVE):
+        assert io.copy_throttle() is None
+    with io.job(BACKGROUND):
+        assert io.copy_throttle() is not None
+
+
+def test_throttled_copy_stays_in_kernel_without_copy_file_range(tmp_path, monkeypatch):
+    src, dst = tmp_path / "src.bin", tmp_path / "dst.bin"
+    data = os.urandom(10000)
+    src.write_bytes(data)
+
+    def unsupported(*args):
+        raise OSError(errno.EXDEV, "cross-device")
+
+    def no_python_loop(*args):
+        raise AssertionError("копирование через память Python")
+    monkeypatch.setattr(fileops, "_reflink", unsupported)
+    monkeypatch.setattr(os, "copy_file_range", unsupported, raising=False)
+    monkeypatch.setattr(fileops, "_copy_chunks", no_python_loop)
+    monkeypatch.setattr(fileops, "CHUNK_SIZE", 4096)
+    chunks = []
+    fileops.copy_file(str(src), str(dst), throttle=chunks.append)
+    assert dst.read_bytes() == data
+    assert chunks[-3:] == [4096, 4096, 1808]  # первый блок списан и неудавшейся попыткой copy_file_range
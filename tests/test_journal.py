@@ -0,0 +1,92 @@
+import json
+import os
+
+import journal
+
+
+def _run(tmp_path, batches, finish=True):
+    """Записать журнал с пакетами [(операции, выполнены ли)] и выполнить выполненные."""
+    run_journal = journal.RunJournal.create(str(tmp_path / "journal"), str(tmp_path))
+    for ops, done in batches:
+        batch = run_journal.begin_batch(ops)
+        if done:
+            for op in ops:
+                journal._redo_op(op)
+            run_journal.end_batch(batch, [journal.OK] * len(ops))
+    if finish:
+        run_journal.close()
+    else:
+        run_journal._file.close()
+    return journal.read_run(run_journal.path)
+
+
+def test_undo_restores_chain_of_moves_in_reverse_order(tmp_path):
+    a, b, c = (str(tmp_path / name) for name in ("a.txt", "b.txt", "c.txt"))
+    with open(a, "w") as f:
+        f.write("data")
+    # Авто-сортировка: один и тот же файл переносится дважды в разных пакетах
+    batches = [([["move", a, b]], True), ([["move", b, c]], True)]
+    batches += [([["copy", c, str(tmp_path / f"copy{i}.txt")]], True) for i in range(8)]
+    run = _run(tmp_path, batches)
+    assert os.path.exists(c) and not os.path.exists(a)
+
+    assert journal.undo_run(run, workers=8) == 10
+    assert sorted(os.listdir(tmp_path)) == ["a.txt", "journal"]
+    assert journal.read_run(run.path).undone == set(range(10))
+
+
+def test_resume_redoes_interrupted_batch(tmp_path):
+    a, b, c = (str(tmp_path / name) for name in ("a.txt", "b.txt", "c.txt"))
+    for path in (a, b):
+        with open(path, "w") as f:
+            f.write(path)
+    run = _run(tmp_path, [([["move", a, str(tmp_path / "x" / "a.txt")]], True), ([["copy", b, c]], False)], finish=False)
+    assert not run.ended and 1 not in run.outcomes
+
+    assert journal.resume_run(run) == 1
+    resumed = journal.read_run(run.path)
+    assert resumed.ended and resumed.outcomes[1] == [journal.OK]
+    assert open(c).read() == b
+
+
+def test_prune_keeps_newest_ended_and_incomplete_runs(tmp_path):
+    journal_dir = tmp_path / "journal"
+    journal_dir.mkdir()
+
+    def write(name, records):
+        (journal_dir / name).write_text("".join(json.dumps(r) + "\n" for r in records))
+    header = {"type": "run", "run": "r"}
+    batch = {"type": "batch", "batch": 0, "ops": [["move", "a" * 5000, "b"]]}
+    write("20240101-000000-1-1.jsonl", [header, {"type": "end"}])
+    write("20240101-000000-1-2.jsonl", [header, batch])  # незавершённый
+    write("20240101-000000-1-3.jsonl", [header, batch, {"type": "end"}, {"type": "undone", "batch": 0}])
+    write("20240101-000000-1-4.jsonl", [header, {"type": "end"}])
+
+    journal.prune_runs(str(journal_dir), keep=2)
+    assert sorted(os.listdir(journal_dir)) == [
+        "20240101-000000-1-2.jsonl", "20240101-000000-1-3.jsonl", "20240101-000000-1-4.jsonl",
+    ]
+
+
+def test_open_journal_is_not_reported_as_interrupted(tmp_path):
+    journal_dir = str(tmp_path / "journal")
+    run_journal = journal.RunJournal.create(journal_dir, str(tmp_path))
+    run_journal.begin_batch([["move", "a", "b"]])
+    assert journal.writer_alive(run_journal.path)
+    assert journal.incomplete_runs(journal_dir) == []
+    run_journal._file.close()  # процесс упал, не записав "end"
+    assert [run.path for run in journal.incomplete_runs(journal_dir)] == [run_journal.path]
+
+
+def test_recovery_undoes_only_unfinished_batches(tmp_path):
+    a, b, c, d = (str(tmp_path / name) for name in ("a.txt", "b.txt", "c.txt", "d.txt"))
+    for path in (a, c):
+        with open(path, "w") as f:
+            f.write(path)
+    run = _run(tmp_path, [([["move", a, b]], True), ([["move", c, d]], False)], finish=False)
+    journal._redo_op(["move", c, d])  # сбой после операции, но до записи "done"
+
+    assert journal.undo_run(run, interrupted_only=True) == 1
+    assert os.path.exists(b) and not os.path.exists(a)
+    assert os.path.exists(c) and not os.path.exists(d)
+    assert journal.read_run(run.path).ended
@@ -0,0 +1,43 @@
+from logindex import LogIndex
+
+
+def test_lines_with_other_line_breaks_keep_numbering(tmp_path):
+    log = tmp_path / "file_sorter.log"
+    names = ["a\rb.txt", "form\x0cfeed.txt", "sep\u2028arator.txt", "group\x1csep.txt", "plain.txt"]
+    lines = [f"2024-01-01 00:00:0{i} - INFO - Перемещён '{name}'" for i, name in enumerate(names)]
+    log.write_bytes(("\n".join(lines) + "\n").encode("utf-8"))
+    index = LogIndex(str(log), block_size=64)
+    assert index.refresh()
+
+    assert index.line_count == len(lines)
+    assert index.read_lines(0, 100) == lines
+    assert index.read_numbered([4, 1]) == [lines[4], lines[1]]
+    assert index.find("plain", 0) == 4
+    assert list(index.filter_lines(level="INFO", date_from="2024-01-01 00:00:03")) == [3, 4]
+
+
+def test_refresh_indexes_appended_lines_only_when_complete(tmp_path):
+    log = tmp_path / "file_sorter.log"
+    log.write_bytes(b"one\ntwo\nthr")
+    index = LogIndex(str(log))
+    assert index.refresh()
+    assert index.read_lines(0, 10) == ["one", "two"]
+    assert index.stale() is False
+    with open(log, "ab") as f:
+        f.write(b"ee\n")
+    assert index.stale()
+    assert index.refresh()
+    assert index.read_lines(1, 10) == ["two", "three"]
+    assert not index.stale()
+
+
+def test_find_from_before_first_line(tmp_path):
+    log = tmp_path / "file_sorter.log"
+    log.write_bytes(b"".join(f"line needle{i}\n".encode() for i in range(20)))
+    index = LogIndex(str(log), block_size=32)
+    index.refresh()
+    assert index.find("needle0", -1) == 0
+    assert index.find("needle3", -1) == 3
+    assert index.find("needle3", 0) == 3
+    assert index.find("needle0", 0) is None
+    assert index.find("needle0", 5, backwards=True) == 0
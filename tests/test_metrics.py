@@ -0,0 +1,15 @@
+from metrics import Metrics
+
+
+def test_label_values_are_escaped():
+    metrics = Metrics()
+    metrics.inc("filesorter_files_total", target='C:\\Docs "old"\nnew')
+    assert 'filesorter_files_total{target="C:\\\\Docs \\"old\\"\\nnew"} 1' in metrics.render().splitlines()
+
+
+def test_histogram_bucket_labels_follow_escaped_labels():
+    metrics = Metrics(buckets=(1,))
+    metrics.observe("filesorter_stage_seconds", 0.5, stage='a"b')
+    lines = metrics.render().splitlines()
+    assert 'filesorter_stage_seconds_bucket{stage="a\\"b",le="1"} 1' in lines
+    assert 'filesorter_stage_seconds_count{stage="a\\"b"} 1' in lines
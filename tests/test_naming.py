@@ -0,0 +1,113 @@
+import os
+
+import pytest
+
+import fileops
+import journal
+from naming import NameRegistry
+from sortengine import SortEngine
+
+
+def _engine(tmp_path, collisions):
+    src = tmp_path / "src"
+    src.mkdir(exist_ok=True)
+    config = {
+        "source_dir": str(src), "journal_dir": "", "collisions": collisions,
+        "target_dirs": {"Docs": {"exts": [".txt"], "action": "Копировать"}},
+    }
+    return SortEngine(config), src
+
+
+@pytest.mark.parametrize("collisions", ["number", "timestamp", "hash", "skip"])
+def test_copy_rerun_is_idempotent(tmp_path, collisions):
+    engine, src = _engine(tmp_path, collisions)
+    (src / "Docs").mkdir()
+    (src / "Docs" / "a.txt").write_text("другой файл с тем же именем")
+    (src / "a.txt").write_text("a")
+    (src / "b.txt").write_text("b")
+    assert engine.sort_directory().processed == 2
+    copies = sorted(os.listdir(src / "Docs"))
+    assert len(copies) == 3
+
+    for _ in range(2):
+        engine.sort_directory()
+        assert sorted(os.listdir(src / "Docs")) == copies
+
+
+def test_copy_with_different_content_is_numbered(tmp_path):
+    target = tmp_path / "Docs"
+    target.mkdir()
+    (target / "a.txt").write_text("old")
+    (target / "a (1).txt").write_text("older")
+    src = tmp_path / "a.txt"
+    src.write_text("new")
+    names = NameRegistry("number")
+    assert names.reserve(str(target), "a.txt", str(src), copy=True) == "a (2).txt"
+
+
+def test_move_keeps_numbering_identical_file(tmp_path):
+    target = tmp_path / "Docs"
+    target.mkdir()
+    (target / "a.txt").write_text("same")
+    src = tmp_path / "a.txt"
+    src.write_text("same")
+    assert NameRegistry("number").reserve(str(target), "a.txt", str(src)) == "a (1).txt"
+    assert NameRegistry("skip").reserve(str(target), "a.txt", str(src)) is None
+
+
+@pytest.mark.parametrize("action", ["Переместить", "Копировать"])
+def test_name_taken_by_another_run_is_not_overwritten(tmp_path, action):
+    src = tmp_path / "src"
+    src.mkdir()
+    target = src / "Docs"
+    target.mkdir()
+    engine = SortEngine({
+        "source_dir": str(src), "journal_dir": str(tmp_path / "journal"),
+        "target_dirs": {"Docs": {"exts": [".txt"], "action": action}},
+    })
+    (src / "a.txt").write_text("mine")
+    task = engine.make_task(str(src / "a.txt"), "a.txt", str(src))
+    names = engine.name_registry()
+    task = engine.assign_destination(task, names)
+    assert task.dst == str(target / "a.txt")
+    (target / "a.txt").write_text("other run")  # другой реестр выдал то же имя
+
+    run_journal = engine.open_journal(str(src))
+    result, = engine._execute_batch([task], False, run_journal, names)
+    engine.close_journal(run_journal)
+    assert result.ok and result.dst == str(target / "a (1).txt")
+    assert (target / "a.txt").read_text() == "other run"
+    assert (target / "a (1).txt").read_text() == "mine"
+
+    run, = journal.list_runs(str(tmp_path / "journal"))
+    assert run.batches[0][0][2] == result.dst
+    journal.undo_run(run)
+    assert (target / "a.txt").read_text() == "other run"
+    assert not (target / "a (1).txt").exists()
+    assert (src / "a.txt").read_text() == "mine"
+
+
+def test_fileops_no_replace(tmp_path):
+    src, dst = tmp_path / "a.txt", tmp_path / "b.txt"
+    src.write_text("src")
+    dst.write_text("dst")
+    for op in (fileops.move_file, fileops.copy_file):
+        with pytest.raises(FileExistsError):
+            op(str(src), str(dst), replace=False)
+        assert src.read_text() == "src" and dst.read_text() == "dst"
+    with pytest.raises(FileExistsError):
+        fileops.copy_file(str(src), str(dst), "hardlink", replace=False)
+    assert dst.read_text() == "dst"
+
+
+def test_copy_rerun_reports_skipped_files_separately(tmp_path):
+    engine, src = _engine(tmp_path, "number")
+    (src / "a.txt").write_text("a")
+    (src / "b.txt").write_text("b")
+    assert engine.sort_directory() == (2, 0, 0)
+    stats = engine.sort_directory()
+    assert stats == (0, 2, 0)
+    assert engine.summary(stats) == "Обработано 0 файлов! Пропущено как уже имеющиеся: 2."
+    (src / "c.txt").write_text("c")
+    assert engine.sort_file(str(src / "a.txt"), auto=True) is None
+    assert engine.sort_file(str(src / "c.txt"), auto=True) == "Копировать"
@@ -0,0 +1,44 @@
+import threading
+
+import pytest
+
+from sortengine import SortEngine
+
+
+def _config(tmp_path, **extra):
+    config = {"source_dir": str(tmp_path), "journal_dir": "", "target_dirs": {"Docs": {"exts": [".txt"]}}}
+    config.update(extra)
+    return config
+
+
+def test_failed_reload_keeps_previous_config(tmp_path):
+    config = _config(tmp_path)
+    engine = SortEngine(config)
+    rules = engine.rules
+    bad = dict(config, target_dirs={"Docs/{year}": {"exts": [".txt"], "date": "ctime"}})
+    with pytest.raises(ValueError):
+        engine.reload_config(bad, [engine])
+    assert engine.config is config
+    assert engine.rules is rules
+    assert engine.classify("a.txt")[0] == "Docs"
+
+
+def test_reload_keeps_watched_source_dir(tmp_path):
+    engine = SortEngine(_config(tmp_path))
+    new = _config(tmp_path / "other", target_dirs={"Texts": {"exts": [".txt"]}})
+    engine.reload_config(new, [engine])
+    assert engine.source_dir == str(tmp_path)
+    assert engine.classify("a.txt")[0] == "Texts"
+    assert new["source_dir"] == str(tmp_path / "other")
+
+
+def test_reload_resets_auto_names_under_lock(tmp_path):
+    engine = SortEngine(_config(tmp_path))
+    engine._auto_names = object()
+    with engine._journal_lock:
+        reload = threading.Thread(target=engine.reload_rules)
+        reload.start()
+        reload.join(0.2)
+        assert reload.is_alive()  # ждёт, пока sort_file закрепляет имя
+    reload.join()
+    assert engine._auto_names is None
@@ -0,0 +1,101 @@
+import os
+import time
+
+import pytest
+
+from metadata import MetadataCache
+from sortengine import SortEngine
+from sortrules import RuleIndex
+
+
+def test_extensions_and_compound():
+    rules = RuleIndex({
+        "Archives": {"exts": [".tar.gz", ".zip"]},
+        "Gzip": {"exts": [".gz"]},
+    })
+    assert rules.match("backup.tar.gz") == ("Archives", "Переместить")
+    assert rules.match("log.gz") == ("Gzip", "Переместить")
+    assert rules.match(".bashrc") is None
+
+
+def test_patterns_first_in_config_order():
+    rules = RuleIndex({
+        "Backups": {"exts": [], "patterns": ["backup_*.zip"]},
+        "Any": {"exts": [], "patterns": ["*.zip"]},
+        "Zips": {"exts": [".zip"]},
+    })
+    assert rules.match("BACKUP_1.zip")[0] == "Backups"
+    assert rules.match("other.zip")[0] == "Any"
+
+
+def test_regex_backreferences_compile_separately():
+    rules = RuleIndex({
+        "A": {"exts": [], "patterns": [r"re:(a)\1\.txt"]},
+        "B": {"exts": [], "patterns": [r"re:(b)\1\.txt"]},
+        "Glob": {"exts": [], "patterns": ["*.log"]},
+    })
+    assert rules.match("aa.txt")[0] == "A"
+    assert rules.match("bb.txt")[0] == "B"
+    assert rules.match("ab.txt") is None
+    assert rules.match("x.log")[0] == "Glob"
+
+
+def test_user_named_groups_keep_rule_mapping():
+    rules = RuleIndex({
+        "First": {"exts": [], "patterns": ["*.bak"]},
+        "Named": {"exts": [], "patterns": [r"re:(?P<r0>img)_\d+\.jpg"]},
+        "Last": {"exts": [], "patterns": ["*.jpg"]},
+    })
+    assert rules.match("img_12.jpg")[0] == "Named"
+    assert rules.match("x.bak")[0] == "First"
+    assert rules.match("photo.jpg")[0] == "Last"
+
+
+def test_unknown_braces_stay_literal(tmp_path):
+    rules = RuleIndex({
+        "Photos {old}": {"exts": [".jpg"]},
+        "Docs/{year}-{month} {draft}": {"exts": [".txt"]},
+    })
+    assert rules.match("a.jpg") == ("Photos {old}", "Переместить")
+    assert not rules.metadata_rules[0].matches_name("a.jpg")
+    doc = tmp_path / "a.txt"
+    doc.write_text("x")
+    os.utime(doc, (time.mktime((2024, 3, 5, 12, 0, 0, 0, 0, -1)),) * 2)
+    assert rules.match_metadata("a.txt", MetadataCache()(str(doc)))[0] == "Docs/2024-03 {draft}"
+
+
+@pytest.mark.parametrize("folder, kept", [
+    ("{year}", ["Archive/2024", "Photos_2024", "notes"]),
+    ("Photos_{year}", ["2024", "Archive/2024", "notes"]),
+    ("Archive/{year}/{month}", ["2024", "Photos_2024", "notes"]),
+])
+def test_dated_output_folders_are_not_walked(tmp_path, folder, kept):
+    src = tmp_path / "src"
+    for name in ("2024", "Photos_2024", "notes"):
+        (src / name).mkdir(parents=True)
+        (src / name / "a.jpg").write_text("x")
+    (src / "Archive" / "2024").mkdir(parents=True)
+    (src / "Archive" / "2024" / "a.jpg").write_text("x")
+    engine = SortEngine({
+        "source_dir": str(src), "journal_dir": "", "recursive": True,
+        "target_dirs": {folder: {"exts": [".jpg"]}},
+    })
+    walked = {os.path.relpath(os.path.dirname(entry.path), src).replace(os.sep, "/") for entry in engine.iter_files(str(src))}
+    assert walked == set(kept)
+
+
+def test_inline_global_flags_compile_separately():
+    rules = RuleIndex({
+        "A": {"exts": [], "patterns": [r"re:(?i)img_\d+\.jpg", "x*"]},
+        "B": {"exts": [], "patterns": [r"re:(?s)note.+\.txt"]},
+        "C": {"exts": [], "patterns": ["*.log"]},
+    })
+    assert rules.match("IMG_1.jpg")[0] == "A"
+    assert rules.match("xyz")[0] == "A"
+    assert rules.match("note\n1.txt")[0] == "B"
+    assert rules.match("a.log")[0] == "C"
+
+
+def test_invalid_pattern_names_rule():
+    with pytest.raises(ValueError, match="Broken"):
+        RuleIndex({"Ok": {"exts": [".txt"]}, "Broken": {"exts": [], "patterns": ["re:(unclosed"]}})